@@ -0,0 +1,9 @@
+"""
+pypn5180 benchmarks, run against the PN5180 simulator:
+
+    python -m benchmarks -o results.json
+    python -m benchmarks --compare baseline.json --maxRegression 0.2
+
+timeScale 0 (default) measures the host cost only: simulated chip and RF
+timings are instantaneous. timeScale 1 adds real chip and RF timings.
+"""
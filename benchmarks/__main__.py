@@ -0,0 +1,42 @@
+import sys
+import json
+import argparse
+
+from . import suite
+
+
+def parseInputs():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run: %s (default: all)" %", ".join(sorted(suite.BENCHMARKS)))
+    parser.add_argument("-o", "--output", type=str, default=None, help="JSON result file (default: stdout)")
+    parser.add_argument("-n", "--count", type=int, default=2000, help="Iterations of the rate benchmarks")
+    parser.add_argument("-t", "--timeScale", type=float, default=0.0, help="Simulated chip and RF timing scale (0: host cost only)")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON result file")
+    parser.add_argument("--maxRegression", type=float, default=None, help="Exit with an error when a result is worse than the baseline by more than this ratio")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parseInputs()
+    for name in args.names:
+        if name not in suite.BENCHMARKS:
+            sys.exit("Unknown benchmark %s" %name)
+
+    report = suite.run(args.names or None, args.timeScale, args.count)
+    if args.output is not None:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare is not None:
+        with open(args.compare) as fid:
+            baseline = json.load(fid)
+        failed = False
+        for name, value, reference, regression in suite.compare(report, baseline):
+            print("%-28s %12.1f %12.1f %+7.1f%%" %(name, value, reference, -100.0 * regression), file=sys.stderr)
+            if args.maxRegression is not None and regression > args.maxRegression:
+                failed = True
+        if failed:
+            sys.exit("Regression above %.0f%%" %(100.0 * args.maxRegression))
@@ -0,0 +1,203 @@
+import io
+import os
+import sys
+import time
+import shutil
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import contextlib
+
+from pypn5180.iso_iec_15693 import iso_iec_15693
+from pypn5180.pypn5180sim import PN5180Simulator, VirtualTag15693
+from pypn5180.chipcache import ChipCache
+from pypn5180.dump import FramDumper
+from pypn5180.spitrace import SpiReplay
+
+"""
+Benchmark suite. Each benchmark returns a list of results:
+    {'name': ..., 'value': ..., 'unit': ..., 'higherIsBetter': ...}
+"""
+
+UID = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0xE0]
+
+
+def _result(name, value, unit, higherIsBetter=True):
+    return {'name': name, 'value': value, 'unit': unit, 'higherIsBetter': higherIsBetter}
+
+
+def _connect(timeScale, **options):
+    options.setdefault('backend', PN5180Simulator([VirtualTag15693(UID)], timeScale=timeScale))
+    options.setdefault('busy', "SIMULATED")
+    # Connection progress messages
+    with contextlib.redirect_stdout(io.StringIO()):
+        return iso_iec_15693(**options)
+
+
+def _rate(function, count):
+    start = time.perf_counter()
+    for k in range(count):
+        function(k)
+    return count / (time.perf_counter() - start)
+
+
+def benchSendCommand(timeScale, count):
+    pn5180 = _connect(timeScale, selfTest=False).pn5180
+    cmd = pn5180.CMD['READ_REGISTER']
+    address = pn5180.REG_ADDR['IRQ_STATUS']
+    rate = _rate(lambda k: pn5180._sendCommand(cmd, [address], 4), count)
+    return [_result('sendCommand', rate, 'instructions/s')]
+
+
+# Transactions measured with the ISO IEC 15693 timing of the simulator (timeScale=1)
+REAL_TIMING_TRANSACTIONS = 50
+
+
+def _instructionsPerTransaction(isoIec15693, count):
+    pn5180 = isoIec15693.pn5180
+    frame = isoIec15693._frame('READ_SINGLE_BLOCK', [], (0,))
+    instructions = pn5180.instructionCount
+    rate = _rate(lambda k: pn5180.transactionIsoIec15693(frame), count)
+    return rate, (pn5180.instructionCount - instructions) / float(count)
+
+
+def benchTransaction(timeScale, count):
+    results = []
+    for name, options in (('transactionIsoIec15693', {}),
+                          ('transactionFastPath', {'fastPath': True}),
+                          ('transactionIrq', {'irq': "SIMULATED"}),
+                          ('transactionFastPathIrq', {'fastPath': True, 'irq': "SIMULATED"})):
+        rate, instructions = _instructionsPerTransaction(_connect(timeScale, selfTest=False, **options), count)
+        results.append(_result(name, rate, 'transactions/s'))
+        results.append(_result(name + 'Instructions', instructions, 'instructions/transaction', False))
+        # Status polls while the tag answers, not counted at timeScale=0
+        rate, instructions = _instructionsPerTransaction(_connect(1.0, selfTest=False, **options),
+                                                         REAL_TIMING_TRANSACTIONS)
+        results.append(_result(name + 'InstructionsRealTiming', instructions, 'instructions/transaction', False))
+    return results
+
+
+def benchDump(timeScale, count):
+    results = []
+    for name, chunkSize in (('dumpSingleBlock', 1), ('dumpMultipleBlocks', None)):
+        isoIec15693 = _connect(timeScale, selfTest=False)
+        blocks = 0
+        start = time.perf_counter()
+        for k in range(max(count // 256, 1)):
+            dumper = FramDumper(isoIec15693, chunkSize=chunkSize)
+            blocks += len([data for data in dumper.dump() if data is not None])
+        results.append(_result(name, blocks / (time.perf_counter() - start), 'blocks/s'))
+    return results
+
+
+def benchStartup(timeScale, count):
+    results = []
+    cacheDir = tempfile.mkdtemp()
+    try:
+        cache = ChipCache(os.path.join(cacheDir, "chips.json"))
+        for name, options in (('startupDefault', {}),
+                              ('startupNoSelfTestNoReset', {'selfTest': False, 'reset': False}),
+                              ('startupWarmCache', {'cache': cache})):
+            sim = PN5180Simulator([VirtualTag15693(UID)], timeScale=timeScale)
+            if 'cache' in options:
+                # Cold start filling the cache
+                _connect(timeScale, backend=sim, **options)
+            repeat = 3 if name == 'startupDefault' else 20
+            start = time.perf_counter()
+            for k in range(repeat):
+                _connect(timeScale, backend=sim, **options)
+            results.append(_result(name, (time.perf_counter() - start) * 1000.0 / repeat, 'ms', False))
+    finally:
+        shutil.rmtree(cacheDir)
+    return results
+
+
+def benchTrace(timeScale, count):
+    traceDir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(traceDir, "session.trace")
+        pn5180 = _connect(timeScale, selfTest=False, trace=path).pn5180
+        cmd = pn5180.CMD['READ_REGISTER']
+        address = pn5180.REG_ADDR['IRQ_STATUS']
+        rate = _rate(lambda k: pn5180._sendCommand(cmd, [address], 4), count)
+        pn5180.spiTrace.close()
+        results = [_result('sendCommandTraced', rate, 'instructions/s')]
+
+        isoIec15693 = _connect(timeScale, selfTest=False, trace=path)
+        blocks = len([data for data in FramDumper(isoIec15693).dump() if data is not None])
+        isoIec15693.pn5180.spiTrace.close()
+        replayed = _connect(timeScale, selfTest=False, backend=SpiReplay(path))
+        start = time.perf_counter()
+        FramDumper(replayed).dump()
+        results.append(_result('dumpReplay', blocks / (time.perf_counter() - start), 'blocks/s'))
+    finally:
+        shutil.rmtree(traceDir)
+    return results
+
+
+def benchMemory(timeScale, count):
+    isoIec15693 = _connect(timeScale, selfTest=False)
+    # Warm up caches and lazily created objects
+    for k in range(10):
+        isoIec15693.readSingleBlockCmd(k)
+    tracemalloc.start()
+    try:
+        before, peak = tracemalloc.get_traced_memory()
+        for k in range(count):
+            isoIec15693.readSingleBlockCmd(k % 256)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [_result('transactionPeakMemory', peak - before, 'bytes', False),
+            _result('transactionRetainedMemory', (after - before) / float(count), 'bytes/transaction', False)]
+
+
+BENCHMARKS = {
+    'sendCommand': benchSendCommand,
+    'transaction': benchTransaction,
+    'dump': benchDump,
+    'startup': benchStartup,
+    'memory': benchMemory,
+    'trace': benchTrace,
+}
+
+
+"""
+run(names=None, timeScale=0.0, count=2000)
+names : benchmarks to run, default: all
+count : iterations of the rate benchmarks
+response : dict with environment information and results
+"""
+def run(names=None, timeScale=0.0, count=2000):
+    if names is None:
+        names = sorted(BENCHMARKS)
+    results = []
+    for name in names:
+        results.extend(BENCHMARKS[name](timeScale, count))
+    return {
+        'date': datetime.datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'timeScale': timeScale,
+        'count': count,
+        'results': results,
+    }
+
+
+"""
+compare(report, baseline)
+response : list of (name, value, baseline value, relative regression);
+           regression > 0 when the report is worse than the baseline
+"""
+def compare(report, baseline):
+    baselineValues = dict((result['name'], result['value']) for result in baseline['results'])
+    comparison = []
+    for result in report['results']:
+        reference = baselineValues.get(result['name'])
+        if not reference:
+            continue
+        change = (result['value'] - reference) / float(reference)
+        regression = -change if result['higherIsBetter'] else change
+        comparison.append((result['name'], result['value'], reference, regression))
+    return comparison
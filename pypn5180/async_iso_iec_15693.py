@@ -0,0 +1,258 @@
+import asyncio
+import functools
+from .iso_iec_15693 import iso_iec_15693
+
+"""
+asyncio front-end for iso_iec_15693.
+SPI instructions run in an executor, waits for the tag answer are
+'await asyncio.sleep' polls, so many readers and tasks share one event loop.
+Each reader is protected by its own asyncio.Lock.
+
+    isoIec15693 = await AsyncIsoIec15693.connect("PORT_A")
+    data, error = await isoIec15693.readSingleBlockCmd(5)
+"""
+
+
+"""
+Async transport over a connected PN5180 instance
+pn5180       : pypn5180.PN5180 instance
+executor     : concurrent.futures executor for SPI instructions, default: loop executor
+pollInterval : us, sleep between two IRQ_STATUS polls
+"""
+class AsyncPN5180(object):
+
+    def __init__(self, pn5180, executor=None, pollInterval=500):
+        self.pn5180 = pn5180
+        self.executor = executor
+        self.pollInterval = pollInterval
+        self.lock = asyncio.Lock()
+
+    def __getattr__(self, name):
+        # Constants and state (RX_STATUS, lastRxStatus...) of the PN5180 instance
+        return getattr(self.pn5180, name)
+
+    """
+    run(self, function, *args)
+    Run a blocking PN5180 call in the executor
+    """
+    async def run(self, function, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    """
+    waitIrqStatus(self, mask, timeout)
+    Async PN5180.waitIrqStatus
+    """
+    async def waitIrqStatus(self, mask, timeout):
+        clock = self.pn5180.clock
+        deadline = clock() + timeout / 1000000.0
+        while True:
+            expired = clock() > deadline
+            irqStatus = await self.run(self.pn5180.getIrqStatus)
+            if irqStatus & mask or expired:
+                return irqStatus
+            await asyncio.sleep(self.pollInterval / 1000000.0)
+
+    """
+    transactionIsoIec15693(self, command, timeout=None, sofTimeout=None)
+    Async PN5180.transactionIsoIec15693, holding the reader lock
+    """
+    async def transactionIsoIec15693(self, command, timeout=None, sofTimeout=None):
+        async with self.lock:
+            return await self.transactionIsoIec15693Locked(command, timeout, sofTimeout)
+
+    """
+    transactionIsoIec15693Locked(self, command, timeout=None, sofTimeout=None)
+    Transaction for callers already holding the reader lock
+    """
+    async def transactionIsoIec15693Locked(self, command, timeout=None, sofTimeout=None):
+        pn5180 = self.pn5180
+        if timeout is None:
+            timeout = pn5180.transactionTimeout
+        instructions = pn5180.instructionCount
+        if pn5180.fastPath:
+            flags, data = await self._transactionFast(command, timeout, sofTimeout)
+        else:
+            flags, data = await self._transaction(command, timeout, sofTimeout)
+        pn5180.lastTransactionInstructions = pn5180.instructionCount - instructions
+        return flags, data
+
+    async def _transaction(self, command, timeout, sofTimeout):
+        pn5180 = self.pn5180
+        started = pn5180.TRANSACTION_END_IRQ | pn5180.ANSWER_START_IRQ
+        if not await self.run(pn5180._transactionStart, command):
+            return 0xFF, []
+        irqStatus = await self.waitIrqStatus(pn5180.IRQ_STATUS['TX_IRQ'] | pn5180.TRANSACTION_END_IRQ, pn5180._txTimeout(command))
+        if sofTimeout is not None and not irqStatus & started:
+            irqStatus = await self.waitIrqStatus(started, sofTimeout)
+            if not irqStatus & started:
+                return await self.run(pn5180._transactionEnd, irqStatus)
+        if not irqStatus & pn5180.TRANSACTION_END_IRQ:
+            irqStatus = await self.waitIrqStatus(pn5180.TRANSACTION_END_IRQ, timeout)
+        return await self.run(pn5180._transactionEnd, irqStatus)
+
+    async def _transactionFast(self, command, timeout, sofTimeout):
+        pn5180 = self.pn5180
+        if not await self.run(pn5180._transactionStartFast, command):
+            return 0xFF, []
+        if sofTimeout is None:
+            status = await self.waitTransactionStatus(pn5180._txTimeout(command) + timeout, pn5180.TRANSACTION_END_IRQ)
+        else:
+            status = await self.waitTransactionStatus(pn5180._txTimeout(command) + sofTimeout,
+                                                      pn5180.ANSWER_START_IRQ | pn5180.TRANSACTION_END_IRQ)
+            if status[0] & pn5180.ANSWER_START_IRQ and not status[0] & pn5180.TRANSACTION_END_IRQ:
+                status = await self.waitTransactionStatus(timeout, pn5180.TRANSACTION_END_IRQ)
+        return await self.run(pn5180._transactionEnd, *status)
+
+    """
+    waitTransactionStatus(self, timeout, mask)
+    Async PN5180.waitTransactionStatus
+    """
+    async def waitTransactionStatus(self, timeout, mask):
+        clock = self.pn5180.clock
+        deadline = clock() + timeout / 1000000.0
+        while True:
+            expired = clock() > deadline
+            status = await self.run(self.pn5180.getTransactionStatus)
+            if status[0] & mask or expired:
+                return status
+            await asyncio.sleep(self.pollInterval / 1000000.0)
+
+
+def _isoIec15693Attribute(name):
+    # Attribute read and written on the wrapped iso_iec_15693 instance
+    return property(lambda self: getattr(self.isoIec15693, name),
+                    lambda self, value: setattr(self.isoIec15693, name, value))
+
+
+"""
+AsyncIsoIec15693(isoIec15693, executor=None, pollInterval=500)
+Async view of a connected iso_iec_15693 instance: every command is a coroutine.
+flags, inventoryStats, blockCache and retryPolicy are those of isoIec15693.
+"""
+class AsyncIsoIec15693(iso_iec_15693):
+
+    flags = _isoIec15693Attribute('flags')
+    inventoryStats = _isoIec15693Attribute('inventoryStats')
+    blockCache = _isoIec15693Attribute('blockCache')
+    retryPolicy = _isoIec15693Attribute('retryPolicy')
+
+    def __init__(self, isoIec15693, executor=None, pollInterval=500):
+        self.isoIec15693 = isoIec15693
+        self.pn5180 = AsyncPN5180(isoIec15693.pn5180, executor, pollInterval)
+
+    """
+    connect(ftdi_port="PORT_A", executor=None, pollInterval=500, **halOptions)
+    Connect and configure a reader without blocking the event loop
+    """
+    @classmethod
+    async def connect(cls, ftdi_port="PORT_A", executor=None, pollInterval=500, **halOptions):
+        loop = asyncio.get_event_loop()
+        isoIec15693 = await loop.run_in_executor(executor, functools.partial(iso_iec_15693, ftdi_port, **halOptions))
+        return cls(isoIec15693, executor, pollInterval)
+
+    async def _transact(self, frame, timeout=None, eofDelay=None, answerDelay=0, answer=True):
+        if self.blockCache is not None:
+            data = self._cacheLookup(frame)
+            if data is not None:
+                return data, "Transaction OK"
+        metrics = self.pn5180.metrics
+        if metrics is not None:
+            token = metrics.isoStart()
+        policy = self.retryPolicy
+        sofTimeout = policy.answerStartTimeout(frame[0], answerDelay) if answer else None
+        attempt = 0
+        while True:
+            if eofDelay is None:
+                flags, data = await self.pn5180.transactionIsoIec15693(frame, timeout, sofTimeout)
+            else:
+                flags, data = await self._transactEof(frame, timeout, eofDelay, sofTimeout)
+            errorClass = policy.classify(flags, self.pn5180.lastRxStatus, self.pn5180.lastIrqStatus)
+            if not answer or not policy.retry(errorClass, attempt):
+                break
+            attempt += 1
+        if metrics is not None:
+            metrics.recordIso(self._commandName(frame), token, len(frame), len(data))
+        error = self.getError(flags, data, errorClass)
+        if self.blockCache is not None:
+            self._cacheUpdate(frame, data, errorClass)
+        if answer:
+            policy.record(errorClass)
+        return data, error
+
+    async def _transactEof(self, frame, timeout, eofDelay, sofTimeout):
+        # Option flag write: request, programming delay, then EOF
+        pn5180 = self.pn5180
+        async with pn5180.lock:
+            await pn5180.transactionIsoIec15693Locked(frame, self.NO_ANSWER_TIMEOUT)
+            await asyncio.sleep(eofDelay / 1000000.0)
+            await pn5180.run(pn5180.pn5180.setTxEofOnly, True)
+            flags, data = await pn5180.transactionIsoIec15693Locked([], timeout, sofTimeout)
+            await pn5180.run(pn5180.pn5180.setTxEofOnly, False)
+        return flags, data
+
+    """
+    writeBlocks(self, *args, **kwargs)
+    iso_iec_15693.writeBlocks run in the executor, holding the reader lock
+    """
+    async def writeBlocks(self, *args, **kwargs):
+        async with self.pn5180.lock:
+            return await self.pn5180.run(functools.partial(self.isoIec15693.writeBlocks, *args, **kwargs))
+
+    """
+    setRfProfile(self, profile), autoRfProfile(self, uid=[], profiles=None)
+    iso_iec_15693 RF profile selection run in the executor, holding the reader lock
+    """
+    async def setRfProfile(self, profile):
+        async with self.pn5180.lock:
+            await self.pn5180.run(self.isoIec15693.setRfProfile, profile)
+
+    async def autoRfProfile(self, uid=[], profiles=None):
+        async with self.pn5180.lock:
+            result = await self.pn5180.run(self.isoIec15693.autoRfProfile, uid, profiles)
+        return result
+
+    async def disconnect(self):
+        async with self.pn5180.lock:
+            await self.pn5180.run(self.pn5180.pn5180.rfOff)
+        if self.blockCache is not None:
+            self.blockCache.invalidate()
+        if self.pn5180.spiTrace is not None:
+            self.pn5180.spiTrace.flush()
+
+    async def getSystemInformation(self, uid=[]):
+        data, error = await self.getSystemInformationCmd(uid)
+        return self._parseSystemInformation(data, error)
+
+    async def inventoryCmd(self, maskLength=0, mask=0, afi=None, slots=16):
+        frame = self._inventoryFrame(maskLength, mask, afi, slots)
+        answers = []
+        collisions = []
+        pn5180 = self.pn5180
+        sofTimeout = self.retryPolicy.answerStartTimeout(frame[0])
+        # Slots of a round must not be interleaved with other requests
+        async with pn5180.lock:
+            for slot in range(slots):
+                if slot == 0:
+                    flags, data = await pn5180.transactionIsoIec15693Locked(frame, None, sofTimeout)
+                else:
+                    if slot == 1:
+                        await pn5180.run(pn5180.pn5180.setTxEofOnly, True)
+                    flags, data = await pn5180.transactionIsoIec15693Locked([], self.INVENTORY_SLOT_TIMEOUT, sofTimeout)
+                self._inventorySlot(slot, slots, maskLength, mask, flags, data, answers, collisions)
+            if slots > 1:
+                await pn5180.run(pn5180.pn5180.setTxEofOnly, False)
+        return answers, collisions
+
+    async def inventory(self, afi=None, slots=16, stayQuiet=True):
+        self.inventoryStats = {'transactions': 0, 'rounds': 0, 'collisions': 0}
+        found = []
+        pending = [(0, 0)]
+        while pending:
+            maskLength, mask = pending.pop()
+            answers, collisions = await self.inventoryCmd(maskLength, mask, afi, slots)
+            for uid in self._inventoryRound(found, answers, collisions, pending):
+                if stayQuiet:
+                    await self.stayQuietCmd(uid)
+                    self.inventoryStats['transactions'] += 1
+        return found
@@ -0,0 +1,88 @@
+import time
+import collections
+
+"""
+LRU cache of tag blocks keyed by (UID, block number), see iso_iec_15693(blockCache=...).
+Only addressed requests (with UID) are served from the cache.
+"""
+
+
+"""
+BlockCache(maxBytes=65536, ttl=None)
+maxBytes : budget of cached block data, least recently used blocks are evicted
+ttl      : seconds a block stays valid, None for no expiry
+"""
+class BlockCache(object):
+
+    def __init__(self, maxBytes=65536, ttl=None):
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+    def _key(self, uid, blockNumber):
+        return (bytes(bytearray(uid)), blockNumber)
+
+    """
+    get(self, uid, blockNumber)
+    response : block data (bytes), or None
+    """
+    def get(self, uid, blockNumber):
+        key = self._key(uid, blockNumber)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        data, stamp = entry
+        if self.ttl is not None and time.time() - stamp > self.ttl:
+            self.size -= len(data)
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return None
+        # Most recently used last
+        self.entries[key] = entry
+        self.stats['hits'] += 1
+        return data
+
+    """
+    put(self, uid, blockNumber, data)
+    Cache the content of a block read from or written to the tag
+    """
+    def put(self, uid, blockNumber, data):
+        key = self._key(uid, blockNumber)
+        data = bytes(bytearray(data))
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[0])
+        if len(data) > self.maxBytes:
+            return
+        self.entries[key] = (data, time.time())
+        self.size += len(data)
+        while self.size > self.maxBytes:
+            evictedKey, (evicted, stamp) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.stats['evictions'] += 1
+
+    """
+    invalidate(self, uid=None, blockNumber=None)
+    Forget one block, all blocks of a tag (blockNumber None), or everything (uid None)
+    """
+    def invalidate(self, uid=None, blockNumber=None):
+        self.stats['invalidations'] += 1
+        if uid is None:
+            self.entries.clear()
+            self.size = 0
+            return
+        if blockNumber is not None:
+            keys = [self._key(uid, blockNumber)]
+        else:
+            tagUid = self._key(uid, None)[0]
+            keys = [key for key in self.entries if key[0] == tagUid]
+        for key in keys:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[0])
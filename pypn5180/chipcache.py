@@ -0,0 +1,82 @@
+import os
+import json
+
+"""
+On-disk cache of PN5180 chips, keyed by die identifier.
+An entry holds the chip versions and the RF configuration registers applied
+at the last cold start, see PN5180.warmStart and PN5180.updateCache.
+"""
+
+
+"""
+ChipCache(path=None)
+path : JSON cache file, default: ~/.cache/pypn5180/chips.json
+"""
+class ChipCache(object):
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pypn5180", "chips.json")
+
+    def __init__(self, path=None):
+        self.path = self.DEFAULT_PATH if path is None else path
+        self.entries = None
+
+    def load(self):
+        try:
+            with open(self.path) as fid:
+                self.entries = json.load(fid)
+        except (IOError, OSError, ValueError):
+            # Missing or corrupted cache: cold start
+            self.entries = {}
+        return self.entries
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write then rename, a reader never sees a partial file
+        tmpPath = "%s.%d" %(self.path, os.getpid())
+        with open(tmpPath, "w") as fid:
+            json.dump(self.entries, fid, indent=1, sort_keys=True)
+        os.rename(tmpPath, self.path)
+
+    """
+    get(self, dieIdentifier)
+    response : cache entry of a chip, or None
+    """
+    def get(self, dieIdentifier):
+        if self.entries is None:
+            self.load()
+        return self.entries.get(dieIdentifier)
+
+    """
+    store(self, dieIdentifier, entry)
+    Record a chip and write the cache file
+    """
+    def store(self, dieIdentifier, entry):
+        if self.entries is None:
+            self.load()
+        self.entries[dieIdentifier] = entry
+        try:
+            self.save()
+        except (IOError, OSError) as exc:
+            print("Chip cache not saved: %r" %exc)
+
+    def forget(self, dieIdentifier=None):
+        if self.entries is None:
+            self.load()
+        if dieIdentifier is None:
+            self.entries = {}
+        else:
+            self.entries.pop(dieIdentifier, None)
+        self.save()
+
+
+"""
+SpiSpeedCache(path=None)
+SPI clocks calibrated by PN5180_HIL.calibrateSpeed, keyed by SPI device URL
+(cabling differs between stations, not between chips)
+path : JSON cache file, default: ~/.cache/pypn5180/spi.json
+"""
+class SpiSpeedCache(ChipCache):
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pypn5180", "spi.json")
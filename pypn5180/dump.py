@@ -0,0 +1,437 @@
+import os
+import time
+import json
+import bisect
+import binascii
+import hashlib
+from .retrypolicy import TagLostError
+
+"""
+Tag memory dump using READ_MULTIPLE_BLOCK transactions
+"""
+
+
+"""
+Dump engine reading as many blocks per RF transaction as the tag allows.
+The chunk size starts from the tag memory organisation (GET_SYSTEM_INFORMATION)
+and the PN5180 reception buffer limit, is halved on errors and grows back
+after successful reads.
+isoIec15693 : connected iso_iec_15693 instance
+uid         : tag UID for addressed commands, [] for non addressed mode
+chunkSize   : maximum number of blocks per transaction, default: learned from the tag
+"""
+class FramDumper(object):
+
+    # Successful reads before doubling a reduced chunk size
+    GROW_AFTER = 4
+
+    # Defaults when the tag does not report its memory size
+    DEFAULT_NUM_BLOCKS = 255
+    DEFAULT_BLOCK_SIZE = 8
+
+    def __init__(self, isoIec15693, uid=[], chunkSize=None):
+        self.isoIec15693 = isoIec15693
+        self.uid = uid
+        self.maxChunkSize = chunkSize
+        self.numBlocks = None
+        self.blockSize = None
+        self.tagUid = None
+        self.multipleBlocks = True
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {'transactions': 0, 'blocks': 0, 'failedBlocks': 0, 'elapsed': 0.0, 'blocksPerSec': 0.0,
+                      'aborted': False}
+
+    """
+    learnMemory(self)
+    Read memory organisation and tag UID from GET_SYSTEM_INFORMATION
+    response : numBlocks, blockSize
+    """
+    def learnMemory(self):
+        sysInfo, error = self.isoIec15693.getSystemInformation(self.uid)
+        self.stats['transactions'] += 1
+        if sysInfo is not None:
+            self.tagUid = sysInfo['uid']
+        if sysInfo is not None and sysInfo['numBlocks'] is not None:
+            self.numBlocks = sysInfo['numBlocks']
+            self.blockSize = sysInfo['blockSize']
+        else:
+            self.numBlocks = self.DEFAULT_NUM_BLOCKS
+            self.blockSize = self.DEFAULT_BLOCK_SIZE
+        chunkLimit = self.isoIec15693.maxBlocksPerRead(self.blockSize)
+        if self.maxChunkSize is None or self.maxChunkSize > chunkLimit:
+            self.maxChunkSize = chunkLimit
+        return self.numBlocks, self.blockSize
+
+    def _readChunk(self, blockNumber, count):
+        self.stats['transactions'] += 1
+        if count == 1 or not self.multipleBlocks:
+            data, error = self.isoIec15693.readSingleBlockCmd(blockNumber, self.uid)
+            count = 1
+        else:
+            data, error = self.isoIec15693.readMultipleBlocksCmd(blockNumber, count, self.uid, self.blockSize)
+            # Command not supported: switch to single block reads
+            if 'ERROR' in error and 'No Answer' not in error and data and data[0] == 0x01:
+                self.multipleBlocks = False
+        # With the option flag, each block starts with its security status byte
+        option = self.isoIec15693.flags & self.isoIec15693.REQUEST_FLAGS['OPTION']
+        recordSize = self.blockSize + 1 if option else self.blockSize
+        if 'OK' in error and len(data) == count * recordSize:
+            if option:
+                return bytearray(value for k, value in enumerate(data) if k % recordSize)
+            return bytearray(data)
+        return None
+
+    """
+    iterBlocks(self, firstBlock=0, numberOfBlocks=None)
+    Generator reading blocks in chunks. Stops when the tag is lost (retryPolicy
+    maxMisses of the iso_iec_15693 instance), stats['aborted'] is then set
+    yield : blockNumber, block data (bytearray) or None when the block could not be read
+    """
+    def iterBlocks(self, firstBlock=0, numberOfBlocks=None):
+        if self.numBlocks is None:
+            self.learnMemory()
+        if numberOfBlocks is None:
+            numberOfBlocks = self.numBlocks - firstBlock
+        lastBlock = firstBlock + numberOfBlocks
+        chunkSize = self.maxChunkSize
+        # Chunk sizes above ceiling failed before
+        ceiling = self.maxChunkSize
+        successes = 0
+        start = time.time()
+        self.stats['aborted'] = False
+        blockNumber = firstBlock
+        with self.isoIec15693.retryPolicy.operation():
+            while blockNumber < lastBlock:
+                count = min(chunkSize, lastBlock - blockNumber)
+                try:
+                    data = self._readChunk(blockNumber, count)
+                except TagLostError:
+                    # Remaining blocks are not read
+                    self.stats['aborted'] = True
+                    break
+                if data is not None:
+                    count = len(data) // self.blockSize
+                    for k in range(count):
+                        yield blockNumber + k, data[k*self.blockSize:(k+1)*self.blockSize]
+                    blockNumber += count
+                    self.stats['blocks'] += count
+                    successes += 1
+                    if successes >= self.GROW_AFTER and chunkSize < ceiling:
+                        chunkSize = min(chunkSize * 2, ceiling)
+                        successes = 0
+                elif count > 1 and self.multipleBlocks:
+                    ceiling = count - 1
+                    chunkSize = max(count // 2, 1)
+                    successes = 0
+                elif count > 1:
+                    # READ_MULTIPLE_BLOCK not supported, retry with single block reads
+                    chunkSize = ceiling = 1
+                else:
+                    yield blockNumber, None
+                    blockNumber += 1
+                    self.stats['failedBlocks'] += 1
+                self.stats['elapsed'] = time.time() - start
+                if self.stats['elapsed'] > 0:
+                    self.stats['blocksPerSec'] = self.stats['blocks'] / self.stats['elapsed']
+
+    """
+    dump(self, firstBlock=0, numberOfBlocks=None, progress=None)
+    progress : callback(current_block, max_block)
+    response : list of block data, None for failed blocks, shorter when the
+               tag was lost (stats['aborted'])
+    """
+    def dump(self, firstBlock=0, numberOfBlocks=None, progress=None):
+        blocks = []
+        for blockNumber, data in self.iterBlocks(firstBlock, numberOfBlocks):
+            blocks.append(data)
+            if progress is not None:
+                progress(blockNumber + 1, self.numBlocks)
+        return blocks
+
+
+def _addRange(ranges, blockNumber):
+    # Add a block to sorted [start, end) ranges, merging neighbours
+    k = bisect.bisect_right(ranges, [blockNumber, float('inf')])
+    if k > 0 and ranges[k-1][1] >= blockNumber:
+        if ranges[k-1][1] > blockNumber:
+            return
+        ranges[k-1][1] += 1
+        if k < len(ranges) and ranges[k][0] == blockNumber + 1:
+            ranges[k-1][1] = ranges.pop(k)[1]
+    elif k < len(ranges) and ranges[k][0] == blockNumber + 1:
+        ranges[k][0] = blockNumber
+    else:
+        ranges.insert(k, [blockNumber, blockNumber + 1])
+
+
+def _inRanges(ranges, blockNumber):
+    k = bisect.bisect_right(ranges, [blockNumber, float('inf')])
+    return k > 0 and ranges[k-1][1] > blockNumber
+
+
+def _missingRanges(ranges, numBlocks):
+    missing = []
+    start = 0
+    for first, end in ranges:
+        if first > start:
+            missing.append((start, first))
+        start = end
+    if start < numBlocks:
+        missing.append((start, numBlocks))
+    return missing
+
+
+"""
+Resumable dump to a file: blocks are written at their offset in a file
+pre-sized to the tag memory, completed block ranges, retry counts and a
+running SHA-256 of the completed file prefix are kept in a sidecar
+'<path>.state' file. Running again on the same path and tag reads only the
+missing blocks.
+dumper     : FramDumper
+path       : memory image file
+maxRetries : read passes over failed blocks after the first one
+"""
+class StreamingDump(object):
+
+    # Blocks between two sidecar updates
+    SYNC_EVERY = 32
+
+    def __init__(self, dumper, path, maxRetries=3):
+        self.dumper = dumper
+        self.path = path
+        self.statePath = path + ".state"
+        self.maxRetries = maxRetries
+        self.state = None
+
+    def _newState(self):
+        return {'uid': self.dumper.tagUid, 'numBlocks': self.dumper.numBlocks, 'blockSize': self.dumper.blockSize,
+                'done': [], 'retries': {}, 'digest': hashlib.sha256().hexdigest(), 'digestBlocks': 0,
+                'complete': False}
+
+    def _loadState(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.statePath) as fid:
+                state = json.load(fid)
+        except (IOError, OSError, ValueError):
+            return None
+        for key in ('uid', 'numBlocks', 'blockSize'):
+            if state.get(key) != getattr(self.dumper, 'tagUid' if key == 'uid' else key):
+                print("%s: %s does not match the tag, restarting the dump" %(self.statePath, key))
+                return None
+        return state
+
+    def _saveState(self, fid):
+        # Blocks on disk before the sidecar records them
+        fid.flush()
+        os.fsync(fid.fileno())
+        self.state['digest'] = self._digest.hexdigest()
+        self.state['digestBlocks'] = self._hashed
+        tmpPath = self.statePath + ".tmp"
+        with open(tmpPath, "w") as stateFid:
+            json.dump(self.state, stateFid)
+        os.rename(tmpPath, self.statePath)
+
+    def _advanceDigest(self, fid, blockNumber=None, data=None):
+        # Hash the contiguous prefix of completed blocks
+        if blockNumber == self._hashed:
+            self._digest.update(data)
+            self._hashed += 1
+        blockSize = self.state['blockSize']
+        while self._hashed < self.state['numBlocks'] and _inRanges(self.state['done'], self._hashed):
+            fid.seek(self._hashed * blockSize)
+            self._digest.update(fid.read(blockSize))
+            self._hashed += 1
+
+    """
+    run(self, progress=None)
+    Dump, or resume, until all blocks are read or the retries are exhausted
+    progress : callback(completed_blocks, max_block)
+    response : state dict: done ranges, retries, digest (SHA-256 of the
+               image when complete), complete
+    """
+    def run(self, progress=None):
+        if self.dumper.numBlocks is None:
+            self.dumper.learnMemory()
+        self.state = self._loadState()
+        resumed = self.state is not None
+        if not resumed:
+            self.state = self._newState()
+        numBlocks = self.state['numBlocks']
+        blockSize = self.state['blockSize']
+        done = self.state['done']
+        retries = self.state['retries']
+
+        with open(self.path, "r+b" if resumed else "w+b") as fid:
+            # Sparse file of the memory size, missing blocks read as 0x00
+            fid.truncate(numBlocks * blockSize)
+            self._digest = hashlib.sha256()
+            self._hashed = 0
+            self._advanceDigest(fid)
+            completed = sum(end - first for first, end in done)
+            unsynced = 0
+            for attempt in range(self.maxRetries + 1):
+                missing = _missingRanges(done, numBlocks)
+                if not missing:
+                    break
+                for first, end in missing:
+                    for blockNumber, data in self.dumper.iterBlocks(first, end - first):
+                        if data is None:
+                            retries[str(blockNumber)] = retries.get(str(blockNumber), 0) + 1
+                            continue
+                        fid.seek(blockNumber * blockSize)
+                        fid.write(data)
+                        _addRange(done, blockNumber)
+                        self._advanceDigest(fid, blockNumber, data)
+                        completed += 1
+                        unsynced += 1
+                        if unsynced >= self.SYNC_EVERY:
+                            self._saveState(fid)
+                            unsynced = 0
+                        if progress is not None:
+                            progress(completed, numBlocks)
+                    if self.dumper.stats['aborted']:
+                        break
+                if self.dumper.stats['aborted']:
+                    # Tag lost, resume later
+                    break
+            self.state['complete'] = not _missingRanges(done, numBlocks)
+            self._saveState(fid)
+        return self.state
+
+
+"""
+Incremental dump against the last snapshot of the tag, keyed by tag UID.
+Only mutable blocks and blocks changed during the last HISTORY_SCANS scans
+are read, every fullEvery scans (and while the snapshot misses blocks never
+read, after a failed or aborted scan) the whole memory is read to catch
+changes elsewhere. Blocks read for the first time are not reported as changed. Each scan updates the snapshot
+('<uid>.dat' image, '<uid>.json' metadata in snapshotDir) and returns a
+delta record.
+dumper        : FramDumper
+snapshotDir   : snapshots directory, default: ~/.cache/pypn5180/snapshots
+mutableRanges : list of (firstBlock, numberOfBlocks) read at every scan
+fullEvery     : scans between two full reads
+"""
+class IncrementalDump(object):
+
+    DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pypn5180", "snapshots")
+
+    # A changed block is read again during HISTORY_SCANS scans
+    HISTORY_SCANS = 8
+
+    # Unchanged blocks read to join two ranges instead of a new transaction
+    MERGE_GAP = 4
+
+    def __init__(self, dumper, snapshotDir=None, mutableRanges=(), fullEvery=16):
+        self.dumper = dumper
+        self.snapshotDir = self.DEFAULT_DIR if snapshotDir is None else snapshotDir
+        self.mutableRanges = mutableRanges
+        self.fullEvery = fullEvery
+
+    def _paths(self, uid):
+        name = "".join("%02x" %byte for byte in reversed(uid))
+        return os.path.join(self.snapshotDir, name + ".dat"), os.path.join(self.snapshotDir, name + ".json")
+
+    def _loadSnapshot(self, uid):
+        imagePath, metaPath = self._paths(uid)
+        try:
+            with open(metaPath) as fid:
+                meta = json.load(fid)
+            with open(imagePath, "rb") as fid:
+                image = bytearray(fid.read())
+        except (IOError, OSError, ValueError):
+            return None, None
+        if meta['numBlocks'] != self.dumper.numBlocks or meta['blockSize'] != self.dumper.blockSize \
+                or len(image) != meta['numBlocks'] * meta['blockSize']:
+            print("Snapshot %s does not match the tag memory, full dump" %metaPath)
+            return None, None
+        return meta, image
+
+    def _saveSnapshot(self, uid, meta, image):
+        if not os.path.isdir(self.snapshotDir):
+            os.makedirs(self.snapshotDir)
+        for path, content, mode in zip(self._paths(uid), (bytes(image), json.dumps(meta)), ("wb", "w")):
+            with open(path + ".tmp", mode) as fid:
+                fid.write(content)
+            os.rename(path + ".tmp", path)
+
+    def _blocksToRead(self, meta):
+        blocks = set(int(block) for block, scan in meta['changedAt'].items()
+                     if meta['scan'] - scan < self.HISTORY_SCANS)
+        for first, count in self.mutableRanges:
+            blocks.update(range(first, min(first + count, self.dumper.numBlocks)))
+        ranges = []
+        for block in sorted(blocks):
+            if ranges and block - ranges[-1][1] <= self.MERGE_GAP:
+                ranges[-1][1] = block + 1
+            else:
+                ranges.append([block, block + 1])
+        return ranges
+
+    """
+    run(self, progress=None)
+    progress : callback(current_block, max_block)
+    response : delta record dict: uid, scan, full, blocksRead, changed (list of
+               [block, old hex, new hex]), failed (blocks kept from the snapshot),
+               aborted (tag lost), or None when the tag UID is unknown
+    """
+    def run(self, progress=None):
+        dumper = self.dumper
+        if dumper.numBlocks is None:
+            dumper.learnMemory()
+        uid = dumper.tagUid
+        if uid is None:
+            print("GET_SYSTEM_INFORMATION failed, tag UID unknown")
+            return None
+        blockSize = dumper.blockSize
+        meta, image = self._loadSnapshot(uid)
+        if meta is None:
+            meta = {'numBlocks': dumper.numBlocks, 'blockSize': blockSize, 'scan': 0,
+                    'lastFull': 0, 'changedAt': {}, 'known': []}
+            image = None
+        # Block ranges holding a value read from the tag, all of them in older snapshots
+        known = meta.setdefault('known', [[0, dumper.numBlocks]])
+        full = (image is None or meta['scan'] - meta['lastFull'] >= self.fullEvery
+                or bool(_missingRanges(known, dumper.numBlocks)))
+        meta['scan'] += 1
+        ranges = [[0, dumper.numBlocks]] if full else self._blocksToRead(meta)
+
+        delta = {'uid': uid, 'scan': meta['scan'], 'full': full, 'blocksRead': 0, 'changed': [], 'failed': [],
+                 'aborted': False}
+        newImage = bytearray(dumper.numBlocks * blockSize) if image is None else image
+        for first, end in ranges:
+            for blockNumber, data in dumper.iterBlocks(first, end - first):
+                if progress is not None:
+                    progress(blockNumber + 1, dumper.numBlocks)
+                if data is None:
+                    delta['failed'].append(blockNumber)
+                    # Read again at the next scans
+                    meta['changedAt'][str(blockNumber)] = meta['scan']
+                    continue
+                delta['blocksRead'] += 1
+                offset = blockNumber * blockSize
+                old = newImage[offset:offset + blockSize]
+                if not _inRanges(known, blockNumber):
+                    # First read of the block: no previous value to compare
+                    _addRange(known, blockNumber)
+                    newImage[offset:offset + blockSize] = data
+                elif old != data:
+                    delta['changed'].append([blockNumber, binascii.hexlify(old).decode('ascii'),
+                                             binascii.hexlify(data).decode('ascii')])
+                    meta['changedAt'][str(blockNumber)] = meta['scan']
+                    newImage[offset:offset + blockSize] = data
+            if dumper.stats['aborted']:
+                delta['aborted'] = True
+                break
+
+        if full and not delta['failed'] and not delta['aborted']:
+            meta['lastFull'] = meta['scan']
+        # Forget blocks out of the history window
+        meta['changedAt'] = dict((block, scan) for block, scan in meta['changedAt'].items()
+                                 if meta['scan'] - scan < self.HISTORY_SCANS)
+        self._saveSnapshot(uid, meta, newImage)
+        return delta
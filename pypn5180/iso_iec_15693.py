@@ -1,4 +1,5 @@
 from . import pypn5180
+from .retrypolicy import RetryPolicy, TagLostError
 import binascii
 import collections
 """
@@ -42,16 +43,97 @@ class iso_iec_15693(object):
         0x14:'The specified block was not successfully locked',
         0xA7:'CUSTOM ERROR 0xA7'
     }
+    CMD_NAME = dict((code, name) for name, code in CMD_CODE.items())
+
     # Avoid unhandled error codes crash:
     ERROR_CODE = collections.defaultdict(lambda:0,ERROR_CODE)
 
-    def __init__(self, ftdi_port = "PORT_A"):
+    # Reception errors of an answer, see RetryPolicy.classify
+    RX_ERROR = {
+        RetryPolicy.TIMEOUT:'Answer not complete before the timeout',
+        RetryPolicy.COLLISION:'Collision between tag answers',
+        RetryPolicy.CRC:'Data integrity (CRC) error',
+        RetryPolicy.PROTOCOL:'Protocol error'
+    }
+
+    # Request flags, bits 5 to 8 depend on INVENTORY flag
+    REQUEST_FLAGS = {
+        'SUB_CARRIER':0x01,
+        'DATA_RATE':0x02,
+        'INVENTORY':0x04,
+        'PROTOCOL_EXTENSION':0x08,
+        'SELECT':0x10,
+        'ADDRESS':0x20,
+        'OPTION':0x40,
+        'AFI':0x10,         # with INVENTORY flag
+        'NB_SLOTS':0x20     # with INVENTORY flag: 1 slot
+    }
+
+    # Wait for an inventory slot answer after EOF (us)
+    INVENTORY_SLOT_TIMEOUT = 3000
+
+    # Wait after requests without answer (us)
+    NO_ANSWER_TIMEOUT = 1000
+
+    # PN5180 reception buffer size (bytes)
+    MAX_RX_BUFFER = 508
+
+    # PN5180 transmission buffer size (bytes)
+    MAX_TX_BUFFER = 260
+
+    # ISO IEC 15693 maximum block size (bytes)
+    MAX_BLOCK_SIZE = 32
+
+    # Maximum programming time of one block (us): answer timeout of writes,
+    # delay before the EOF of writes sent with the option flag
+    WRITE_BLOCK_TIME = 20000
+
+    # RF profiles probed by autoRfProfile, in order. Standard commands are answered
+    # at 26 kbps, the 53 kbps profiles are for vendor fast custom commands only
+    RF_PROFILE_AUTO = ('ASK100_26KBPS', 'ASK10_26KBPS')
+
+    # Probe transactions per profile
+    RF_PROFILE_PROBES = 2
+
+    # GET_SYSTEM_INFORMATION info flags
+    INFO_FLAGS = {
+        'DSFID':0x01,
+        'AFI':0x02,
+        'MEMORY_SIZE':0x04,
+        'IC_REFERENCE':0x08
+    }
+
+    """
+    selfTest  : read and display the chip versions (4 EEPROM reads)
+    reset     : soft reset the chip before configuration, see PN5180.configureIsoIec15693Mode
+    cache     : chipcache.ChipCache, skip self test, reset and RF configuration
+                loading when the chip is still configured, see PN5180.warmStart
+    blockCache: blockcache.BlockCache serving addressed block reads without RF transaction
+    rfProfile : PN5180.RF_PROFILES key, or "AUTO" to probe a tag in the field, see autoRfProfile
+    retryPolicy: retrypolicy.RetryPolicy, answer start timeout, retries and abort of
+                requests, default RetryPolicy()
+    halOptions: extra PN5180_HIL options (busy, busyPin, busyTimeout...)
+    """
+    def __init__(self, ftdi_port = "PORT_A", selfTest=True, reset=True, cache=None, blockCache=None,
+                 rfProfile="ASK100_26KBPS", retryPolicy=None, **halOptions):
+        self.blockCache = blockCache
+        self.retryPolicy = RetryPolicy() if retryPolicy is None else retryPolicy
         print("Connecting to PN5180 device...")
-        self.pn5180 = pypn5180.PN5180(debug="PN5180", ftdi_port = ftdi_port)
-        print("PN5180 Self test:")
-        self.pn5180.selfTest()
-        print("\nConfiguring device for ISO IEC 15693")
-        self.pn5180.configureIsoIec15693Mode()
+        self.pn5180 = pypn5180.PN5180(debug="PN5180", ftdi_port = ftdi_port, **halOptions)
+        chipInfo = None
+        if cache is not None:
+            chipInfo = self.pn5180.warmStart(cache)
+        warm = chipInfo is not None
+        if warm:
+            print("PN5180 warm start, die identifier: %s" %chipInfo['dieIdentifier'])
+            self.pn5180.configureIsoIec15693Mode(reset=False, loadConfig=False)
+        else:
+            if selfTest:
+                print("PN5180 Self test:")
+                chipInfo = self.pn5180.selfTest()
+            print("\nConfiguring device for ISO IEC 15693")
+            self.pn5180.configureIsoIec15693Mode(reset)
+        configuredRf = list(self.pn5180.rfConfig)
 
         # Set default frame flags byte:
         # [Extract From ISO_IEC_15693]
@@ -64,6 +146,15 @@ class iso_iec_15693(object):
         # Bit 4 Protocol          0 No protocol format extension
         #       Extension_flag    1 Protocol format is extended. Reserved for future use
         self.flags = 0x02
+        self.inventoryStats = {'transactions': 0, 'rounds': 0, 'collisions': 0}
+
+        if rfProfile == "AUTO":
+            self.autoRfProfile()
+        else:
+            self.setRfProfile(rfProfile)
+        if cache is not None and (not warm or self.pn5180.rfConfig != configuredRf):
+            # Cold start, or RF configuration changed since the warm start
+            self.pn5180.updateCache(cache, chipInfo)
 
     """
     configureFlags(self, flags)
@@ -71,47 +162,330 @@ class iso_iec_15693(object):
     flags: 1 byte, following ISO_IEC_15693 requirements
     """
     def configureFlags(self, flags):
+        if flags & self.REQUEST_FLAGS['SUB_CARRIER'] or not flags & self.REQUEST_FLAGS['DATA_RATE']:
+            print("Warning: PN5180 RF configurations only receive single sub-carrier, high data rate answers")
         self.flags = flags
 
     """
-    getError(self, flags, data)
+    setRfProfile(self, profile)
+    Load the RF configurations of a profile and set the matching request flags:
+    single sub-carrier, high data rate (26 kbps and 53 kbps receive configurations).
+    The 53 kbps profiles only receive the answers of vendor fast custom commands
+    profile : PN5180.RF_PROFILES key
+    """
+    def setRfProfile(self, profile):
+        self.pn5180.setRfProfile(profile)
+        self.flags = (self.flags & ~self.REQUEST_FLAGS['SUB_CARRIER']) | self.REQUEST_FLAGS['DATA_RATE']
+
+    """
+    autoRfProfile(self, uid=[], profiles=None)
+    Select the first RF profile a tag answers correctly to: GET_SYSTEM_INFORMATION
+    probes, any answer without CRC or protocol error validates the profile.
+    The last profile is kept when no profile is validated.
+    profiles : PN5180.RF_PROFILES keys, in probe order, default RF_PROFILE_AUTO.
+               26 kbps profiles only: standard commands are never answered at 53 kbps
+    response : selected profile or None, error of the last probe
+    """
+    def autoRfProfile(self, uid=[], profiles=None):
+        if profiles is None:
+            profiles = self.RF_PROFILE_AUTO
+        rxErrors = self.pn5180.RX_STATUS['DATA_INTEGRITY_ERROR'] | self.pn5180.RX_STATUS['PROTOCOL_ERROR']
+        error = "Transaction ERROR: No Answer from tag"
+        for profile in profiles:
+            self.setRfProfile(profile)
+            for k in range(self.RF_PROFILE_PROBES):
+                data, error = self.getSystemInformationCmd(uid)
+                if 'No Answer' not in error and not self.pn5180.lastRxStatus & rxErrors:
+                    return profile, error
+        return None, error
+
+    """
+    getError(self, flags, data, errorClass=None)
     analyse error code returned by the RFID chip
+    errorClass : RetryPolicy.classify of the answer, reports reception errors
     """    
-    def getError(self, flags, data):
+    def getError(self, flags, data, errorClass=None):
         
+        if errorClass in self.RX_ERROR:
+            return "Transaction ERROR: %s" %self.RX_ERROR[errorClass]
         if flags == 0xFF:
             return "Transaction ERROR: No Answer from tag"
         elif flags != 0:
             return "Transaction ERROR: %s" %self.ERROR_CODE[data[0]]
         return "Transaction OK"
 
-    def inventoryCmd(self):
-        pass
-        # 01h
+    """
+    _transact(self, frame, timeout=None, eofDelay=None, answerDelay=0, answer=True)
+    RF transaction of a request frame, attempts and abort following retryPolicy
+    timeout     : us, answer timeout, default PN5180.transactionTimeout
+    eofDelay    : us, option flag writes: delay before the EOF the tag answers to
+    answerDelay : us, tag processing time before the answer starts
+    answer      : False for requests without answer (no retry, no miss)
+    response : data, error
+    """
+    def _transact(self, frame, timeout=None, eofDelay=None, answerDelay=0, answer=True):
+        if self.blockCache is not None:
+            data = self._cacheLookup(frame)
+            if data is not None:
+                return data, "Transaction OK"
+        metrics = self.pn5180.metrics
+        if metrics is not None:
+            token = metrics.isoStart()
+        policy = self.retryPolicy
+        sofTimeout = policy.answerStartTimeout(frame[0], answerDelay) if answer else None
+        attempt = 0
+        while True:
+            flags, data = self._attempt(frame, timeout, eofDelay, sofTimeout)
+            errorClass = policy.classify(flags, self.pn5180.lastRxStatus, self.pn5180.lastIrqStatus)
+            if not answer or not policy.retry(errorClass, attempt):
+                break
+            attempt += 1
+        if metrics is not None:
+            metrics.recordIso(self._commandName(frame), token, len(frame), len(data))
+        error = self.getError(flags, data, errorClass)
+        if self.blockCache is not None:
+            self._cacheUpdate(frame, data, errorClass)
+        if answer:
+            policy.record(errorClass)
+        return data, error
+
+    def _attempt(self, frame, timeout, eofDelay, sofTimeout):
+        if eofDelay is None:
+            return self.pn5180.transactionIsoIec15693(frame, timeout, sofTimeout)
+        # Option flag: the tag answers to an EOF sent after programming
+        self.pn5180.transactionIsoIec15693(frame, self.NO_ANSWER_TIMEOUT)
+        self.pn5180._usDelay(eofDelay)
+        return self.pn5180.transactionIsoIec15693Eof(timeout, sofTimeout)
+
+    def _cacheLookup(self, frame):
+        # Addressed block reads without option flag, response: data or None
+        flags = frame[0]
+        if not flags & self.REQUEST_FLAGS['ADDRESS'] or flags & (self.REQUEST_FLAGS['INVENTORY'] | self.REQUEST_FLAGS['OPTION']):
+            return None
+        if frame[1] == self.CMD_CODE['READ_SINGLE_BLOCK']:
+            count = 1
+        elif frame[1] == self.CMD_CODE['READ_MULTIPLE_BLOCK']:
+            count = frame[11] + 1
+        else:
+            return None
+        data = []
+        for blockNumber in range(frame[10], frame[10] + count):
+            blockData = self.blockCache.get(frame[2:10], blockNumber)
+            if blockData is None:
+                return None
+            data.extend(bytearray(blockData))
+        return data
+
+    def _cacheUpdate(self, frame, data, errorClass):
+        # Write-through and invalidation after an RF transaction,
+        # errorClass: RetryPolicy.classify of the answer
+        flags, command = frame[0], frame[1]
+        if flags & self.REQUEST_FLAGS['INVENTORY'] or command == self.CMD_CODE['STAY_QUIET']:
+            return
+        uid = frame[2:10] if flags & self.REQUEST_FLAGS['ADDRESS'] else None
+        index = 2 if uid is None else 10
+        count = 1
+        if command in (self.CMD_CODE['READ_MULTIPLE_BLOCK'], self.CMD_CODE['WRITE_MULTIPLE_BLOCK']):
+            count = frame[index+1] + 1
+        if command in (self.CMD_CODE['WRITE_SINGLE_BLOCK'], self.CMD_CODE['WRITE_MULTIPLE_BLOCK']):
+            first = frame[index]
+            if command == self.CMD_CODE['WRITE_SINGLE_BLOCK']:
+                blocks = frame[index+1:]
+            else:
+                blocks = frame[index+2:]
+            if uid is None:
+                # Any tag in the field may have been written
+                self.blockCache.invalidate()
+                return
+            if errorClass == RetryPolicy.NO_ANSWER:
+                # Tag out of the field
+                self.blockCache.invalidate(uid)
+                return
+            if errorClass != RetryPolicy.OK:
+                # Write not confirmed: the blocks may have been programmed
+                for blockNumber in range(first, first + count):
+                    self.blockCache.invalidate(uid, blockNumber)
+                return
+        elif errorClass == RetryPolicy.NO_ANSWER:
+            # Tag out of the field
+            if uid is not None:
+                self.blockCache.invalidate(uid)
+            return
+        elif command in (self.CMD_CODE['READ_SINGLE_BLOCK'], self.CMD_CODE['READ_MULTIPLE_BLOCK']):
+            if uid is None or flags & self.REQUEST_FLAGS['OPTION'] or errorClass != RetryPolicy.OK:
+                return
+            first = frame[index]
+            blocks = data
+        elif command in (self.CMD_CODE['LOCK_BLOCK'], self.CMD_CODE['RESET_READY']):
+            self.blockCache.invalidate(uid)
+            return
+        else:
+            return
+        if not blocks or len(blocks) % count:
+            return
+        blockSize = len(blocks) // count
+        for k in range(count):
+            self.blockCache.put(uid, first + k, blocks[k*blockSize:(k+1)*blockSize])
+
+    def _commandName(self, frame):
+        return self.CMD_NAME.get(frame[1], "0x%02X" %frame[1])
+
+    """
+    _answerTimeout(self, frame, answerLength)
+    Answer timeout of a request with a long answer: transmission time of
+    answerLength bytes (flags included), at least PN5180.transactionTimeout
+    """
+    def _answerTimeout(self, frame, answerLength):
+        answerLength = min(answerLength, self.MAX_RX_BUFFER)
+        return max(self.pn5180.transactionTimeout, self.retryPolicy.answerTimeout(frame[0], answerLength))
+
+    """
+    _frame(self, command, uid=[], parameters=(), data=())
+    Request frame in a single bytearray: flags, command code, uid (addressed
+    mode), parameters bytes then data bytes
+    """
+    def _frame(self, command, uid=[], parameters=(), data=()):
+        header = 2 + len(uid)
+        frame = bytearray(header + len(parameters) + len(data))
+        frame[0] = self._requestFlags(uid)
+        frame[1] = self.CMD_CODE[command]
+        frame[2:header] = uid
+        frame[header:header + len(parameters)] = parameters
+        frame[header + len(parameters):] = data
+        return frame
+
+    """
+    _transactWrite(self, frame, numberOfBlocks)
+    RF transaction of a write request: answer start and timeout covering the
+    programming time, EOF sequence when the option flag is set
+    """
+    def _transactWrite(self, frame, numberOfBlocks):
+        writeTime = numberOfBlocks * self.WRITE_BLOCK_TIME
+        if frame[0] & self.REQUEST_FLAGS['OPTION']:
+            return self._transact(frame, None, writeTime)
+        return self._transact(frame, max(self.pn5180.transactionTimeout, writeTime), answerDelay=writeTime)
 
+    """
+    _requestFlags(self, uid)
+    Request flags for a command, addressed mode when uid is given
+    """
+    def _requestFlags(self, uid=[]):
+        if uid:
+            return (self.flags & ~self.REQUEST_FLAGS['SELECT']) | self.REQUEST_FLAGS['ADDRESS']
+        return self.flags
 
+    """
+    inventoryCmd(self, maskLength=0, mask=0, afi=None, slots=16)
+    One inventory round (01h) of 1 or 16 slots
+    maskLength : number of UID bits (LSB first) given by mask
+    afi        : Application family identifier filter, None for all tags
+    response : list of (uid, dsfid) answers, list of (maskLength, mask) of collided slots
+    """
+    def inventoryCmd(self, maskLength=0, mask=0, afi=None, slots=16):
+        frame = self._inventoryFrame(maskLength, mask, afi, slots)
+        answers = []
+        collisions = []
+        metrics = self.pn5180.metrics
+        if metrics is not None:
+            token = metrics.isoStart()
+        # Empty slots end when no answer starts
+        sofTimeout = self.retryPolicy.answerStartTimeout(frame[0])
+        for slot in range(slots):
+            if slot == 0:
+                flags, data = self.pn5180.transactionIsoIec15693(frame, None, sofTimeout)
+            else:
+                if slot == 1:
+                    self.pn5180.setTxEofOnly(True)
+                flags, data = self.pn5180.transactionIsoIec15693([], self.INVENTORY_SLOT_TIMEOUT, sofTimeout)
+            self._inventorySlot(slot, slots, maskLength, mask, flags, data, answers, collisions)
+        if slots > 1:
+            self.pn5180.setTxEofOnly(False)
+        if metrics is not None:
+            # Answers: flags, dsfid, uid
+            metrics.recordIso('INVENTORY', token, len(frame), 10 * len(answers))
+        return answers, collisions
+
+    def _inventoryFrame(self, maskLength, mask, afi, slots):
+        flags = self.flags & (self.REQUEST_FLAGS['SUB_CARRIER'] | self.REQUEST_FLAGS['DATA_RATE'])
+        flags |= self.REQUEST_FLAGS['INVENTORY']
+        if afi is not None:
+            flags |= self.REQUEST_FLAGS['AFI']
+        if slots == 1:
+            flags |= self.REQUEST_FLAGS['NB_SLOTS']
+        frame = bytearray((flags, self.CMD_CODE['INVENTORY']))
+        if afi is not None:
+            frame.append(afi)
+        frame.append(maskLength)
+        for k in range((maskLength + 7) // 8):
+            frame.append((mask >> (8*k)) & 0xFF)
+        return frame
+
+    def _inventorySlot(self, slot, slots, maskLength, mask, flags, data, answers, collisions):
+        self.inventoryStats['transactions'] += 1
+        rxStatus = self.pn5180.lastRxStatus
+        if rxStatus & (self.pn5180.RX_STATUS['COLLISION_DETECTED'] | self.pn5180.RX_STATUS['DATA_INTEGRITY_ERROR']):
+            if slots == 1:
+                collisions.append((maskLength + 1, mask))
+                collisions.append((maskLength + 1, mask | (1 << maskLength)))
+            else:
+                collisions.append((maskLength + 4, mask | (slot << maskLength)))
+        elif flags == 0 and len(data) >= 9:
+            answers.append((list(data[1:9]), data[0]))
+
+    """
+    inventory(self, afi=None, slots=16, stayQuiet=True)
+    Anticollision inventory of all tags in the field. Collided slots are split
+    with longer masks until all UIDs are found. With stayQuiet, found tags are
+    set quiet so they no longer answer (resetToReadyCmd or RF off to wake them).
+    response : list of (uid, dsfid), stats in inventoryStats
+    """
+    def inventory(self, afi=None, slots=16, stayQuiet=True):
+        self.inventoryStats = {'transactions': 0, 'rounds': 0, 'collisions': 0}
+        found = []
+        pending = [(0, 0)]
+        while pending:
+            maskLength, mask = pending.pop()
+            answers, collisions = self.inventoryCmd(maskLength, mask, afi, slots)
+            for uid in self._inventoryRound(found, answers, collisions, pending):
+                if stayQuiet:
+                    self.stayQuietCmd(uid)
+                    self.inventoryStats['transactions'] += 1
+        return found
+
+    def _inventoryRound(self, found, answers, collisions, pending):
+        # Record a round, response: new UIDs
+        self.inventoryStats['rounds'] += 1
+        self.inventoryStats['collisions'] += len(collisions)
+        newUids = []
+        for uid, dsfid in answers:
+            if (uid, dsfid) in found:
+                continue
+            found.append((uid, dsfid))
+            newUids.append(uid)
+        pending.extend(collision for collision in collisions if collision[0] <= 64)
+        return newUids
+
+    """
+    stayQuietCmd(self, uid)
+    Addressed STAY_QUIET (02h), the tag does not answer
+    """
     def stayQuietCmd(self, uid):
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['STAY_QUIET'])
-        frame.extend(uid)
+        frame = self._frame('STAY_QUIET', uid)
+        return self._transact(frame, self.NO_ANSWER_TIMEOUT, answer=False)
 
 
     def readSingleBlockCmd(self, blockNumber, uid=[]):
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['READ_SINGLE_BLOCK'])
-        if uid is not []:
-            frame.extend(uid)
-            # TODO : Add uid bit in flags
-        frame.append(blockNumber)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('READ_SINGLE_BLOCK', uid, (blockNumber,))
+        return self._transact(frame)
 
 
     def disconnect(self):
         self.pn5180.rfOff()
+        if self.blockCache is not None:
+            # Tags are not tracked without RF field
+            self.blockCache.invalidate()
+        if self.pn5180.spiTrace is not None:
+            self.pn5180.spiTrace.flush()
 
 
     def writeSingleBlockCmd(self, blockNumber, data, uid=[]):
@@ -120,176 +494,231 @@ class iso_iec_15693(object):
         if len(data) is not 8:
             print("WARNING, data block length must be 8 bytes")
 
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['WRITE_SINGLE_BLOCK'])
-        if uid is not []:
-            frame.extend(uid)
-            # TODO : Add uid bit in flags
-        frame.append(blockNumber)
-        frame.extend(data)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('WRITE_SINGLE_BLOCK', uid, (blockNumber,), data)
+        return self._transactWrite(frame, 1)
 
 
     def lockBlockCmd(self, numberOfBlocks, uid=[]):
         #'22'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['LOCK_BLOCK'])
-        if uid is not []:
-            frame.extend(uid)
-        frame.extend(numberOfBlocks)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('LOCK_BLOCK', uid, (), numberOfBlocks)
+        return self._transact(frame)
 
 
-    def readMultipleBlocksCmd(self, firstBlockNumber, numberOfBlocks, uid=[]):
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['READ_MULTIPLE_BLOCKS'])
-        if uid is not []:
-            frame.extend(uid)
-        frame.extend(firstBlockNumber)
-        frame.extend(numberOfBlocks)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+    """
+    readMultipleBlocksCmd(self, firstBlockNumber, numberOfBlocks, uid=[], blockSize=None)
+    numberOfBlocks: 1 to 256 blocks, see maxBlocksPerRead
+    blockSize     : tag block size, sets the answer timeout, default MAX_BLOCK_SIZE
+    """
+    def readMultipleBlocksCmd(self, firstBlockNumber, numberOfBlocks, uid=[], blockSize=None):
+        frame = self._frame('READ_MULTIPLE_BLOCK', uid, (firstBlockNumber, numberOfBlocks - 1))
+        if blockSize is None:
+            blockSize = self.MAX_BLOCK_SIZE
+        if frame[0] & self.REQUEST_FLAGS['OPTION']:
+            blockSize += 1
+        return self._transact(frame, self._answerTimeout(frame, 1 + numberOfBlocks * blockSize))
 
-    def writeMultipleBlocksCmd(self):
-        pass
+    """
+    maxBlocksPerRead(self, blockSize)
+    Maximum number of blocks of a READ_MULTIPLE_BLOCK answer fitting in the PN5180
+    reception buffer (flags byte, and one security status byte per block when
+    the option flag is set)
+    """
+    def maxBlocksPerRead(self, blockSize):
+        if self.flags & self.REQUEST_FLAGS['OPTION']:
+            blockSize += 1
+        return min((self.MAX_RX_BUFFER - 1) // blockSize, 256)
+
+    """
+    writeMultipleBlocksCmd(self, firstBlockNumber, numberOfBlocks, data, uid=[])
+    numberOfBlocks: 1 to 256 blocks, see maxBlocksPerWrite
+    data          : numberOfBlocks * block size bytes
+    """
+    def writeMultipleBlocksCmd(self, firstBlockNumber, numberOfBlocks, data, uid=[]):
         #'24'
+        frame = self._frame('WRITE_MULTIPLE_BLOCK', uid, (firstBlockNumber, numberOfBlocks - 1), data)
+        return self._transactWrite(frame, numberOfBlocks)
+
+    """
+    maxBlocksPerWrite(self, blockSize)
+    Maximum number of blocks of a WRITE_MULTIPLE_BLOCK request fitting in the
+    PN5180 transmission buffer (addressed request header of 12 bytes)
+    """
+    def maxBlocksPerWrite(self, blockSize):
+        return min((self.MAX_TX_BUFFER - 12) // blockSize, 256)
+
+    """
+    writeBlocks(self, firstBlockNumber, data, uid=[], blockSize=None, chunkSize=None, verify=False)
+    Write data over consecutive blocks with WRITE_MULTIPLE_BLOCK requests.
+    The chunk size is halved on errors, tags without WRITE_MULTIPLE_BLOCK
+    support are written block by block.
+    blockSize : tag block size, default: from GET_SYSTEM_INFORMATION
+    chunkSize : maximum number of blocks per request, default: maxBlocksPerWrite
+    verify    : read back the written blocks
+    The write is aborted when the tag is lost (retryPolicy maxMisses)
+    response : list of blocks not written (or different when read back), error
+    """
+    def writeBlocks(self, firstBlockNumber, data, uid=[], blockSize=None, chunkSize=None, verify=False):
+        if blockSize is None:
+            sysInfo, error = self.getSystemInformation(uid)
+            if sysInfo is None or sysInfo['blockSize'] is None:
+                blockSize = 8
+            else:
+                blockSize = sysInfo['blockSize']
+        data = bytearray(data)
+        numberOfBlocks = (len(data) + blockSize - 1) // blockSize
+        # Last block padded with its current content would need a read: pad with 0x00
+        data.extend(bytearray(numberOfBlocks * blockSize - len(data)))
+        if chunkSize is None or chunkSize > self.maxBlocksPerWrite(blockSize):
+            chunkSize = self.maxBlocksPerWrite(blockSize)
+
+        failed = []
+        k = 0
+        try:
+            with self.retryPolicy.operation():
+                while k < numberOfBlocks:
+                    count = min(chunkSize, numberOfBlocks - k)
+                    chunk = data[k*blockSize:(k+count)*blockSize]
+                    if count == 1:
+                        answer, error = self.writeSingleBlockCmd(firstBlockNumber + k, chunk, uid)
+                    else:
+                        answer, error = self.writeMultipleBlocksCmd(firstBlockNumber + k, count, chunk, uid)
+                    if 'OK' in error:
+                        k += count
+                    elif count > 1:
+                        if 'No Answer' not in error and answer and answer[0] in (0x01, 0x02):
+                            # Command not supported or not recognised
+                            chunkSize = 1
+                        else:
+                            chunkSize = count // 2
+                    else:
+                        failed.append(firstBlockNumber + k)
+                        k += 1
+        except TagLostError as exc:
+            failed.extend(range(firstBlockNumber + k, firstBlockNumber + numberOfBlocks))
+            return failed, "Transaction ERROR: %s, %d blocks not written" %(exc, len(failed))
+
+        if verify:
+            failed.extend(self._verifyBlocks(firstBlockNumber, data, uid, blockSize, failed))
+            failed.sort()
+        if failed:
+            return failed, "Transaction ERROR: %d blocks not written" %len(failed)
+        return failed, "Transaction OK"
+
+    def _verifyBlocks(self, firstBlockNumber, data, uid, blockSize, failed):
+        from .dump import FramDumper
+        # Read from the tag, not from the block cache
+        blockCache, self.blockCache = self.blockCache, None
+        try:
+            dumper = FramDumper(self, uid)
+            dumper.numBlocks = firstBlockNumber + len(data) // blockSize
+            dumper.blockSize = blockSize
+            dumper.maxChunkSize = self.maxBlocksPerRead(blockSize)
+            mismatches = []
+            for blockNumber, blockData in dumper.iterBlocks(firstBlockNumber, len(data) // blockSize):
+                offset = (blockNumber - firstBlockNumber) * blockSize
+                if blockNumber not in failed and blockData != data[offset:offset + blockSize]:
+                    mismatches.append(blockNumber)
+        finally:
+            self.blockCache = blockCache
+        return mismatches
 
     def selectCmd(self, uid):
         #'25'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['SELECT'])
-        frame.extend(uid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('SELECT', uid)
+        return self._transact(frame)
 
 
     def resetToReadyCmd(self, uid=[]):
         #'26'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['RESET_READY'])
-        if uid is not []:
-            frame.extend(uid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('RESET_READY', uid)
+        return self._transact(frame)
 
 
     def writeAfiCmd(self, afi, uid=[]):
         #27'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['WRITE_AFI'])
-        if uid is not []:
-            frame.extend(uid)
-        frame.extend(afi)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('WRITE_AFI', uid, (), afi)
+        return self._transact(frame)
 
 
     def lockAfiCmd(self, uid=[]):
         #'28'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['LOCK_AFI'])
-        if uid is not []:
-            frame.extend(uid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('LOCK_AFI', uid)
+        return self._transact(frame)
 
 
     def writeDsfidCmd(self, dsfid, uid=[]):
         #'29'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['WRITE_DSFID'])
-        if uid is not []:
-            frame.extend(uid)
-        frame.extend(dsfid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('WRITE_DSFID', uid, (), dsfid)
+        return self._transact(frame)
 
 
     def locckDsfidCmd(self, uid=[]):
         #'2A'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['LOCK_DSFID'])
-        if uid is not []:
-            frame.extend(uid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('LOCK_DSFID', uid)
+        return self._transact(frame)
 
 
     def getSystemInformationCmd(self, uid=[]):
         #'2B'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['GET_SYSTEM_INFORMATION'])
-        if uid is not []:
-            frame.extend(uid)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('GET_SYSTEM_INFORMATION', uid)
+        return self._transact(frame)
+
+
+    """
+    getSystemInformation(self, uid=[])
+    GET_SYSTEM_INFORMATION with decoded answer
+    response : dict (infoFlags, uid, dsfid, afi, numBlocks, blockSize, icReference)
+               or None, error
+    """
+    def getSystemInformation(self, uid=[]):
+        data, error = self.getSystemInformationCmd(uid)
+        return self._parseSystemInformation(data, error)
+
+    def _parseSystemInformation(self, data, error):
+        if 'OK' not in error or len(data) < 9:
+            return None, error
+        infoFlags = data[0]
+        sysInfo = {'infoFlags': infoFlags, 'uid': list(data[1:9]), 'dsfid': None, 'afi': None,
+                   'numBlocks': None, 'blockSize': None, 'icReference': None}
+        index = 9
+        if infoFlags & self.INFO_FLAGS['DSFID']:
+            sysInfo['dsfid'] = data[index]
+            index += 1
+        if infoFlags & self.INFO_FLAGS['AFI']:
+            sysInfo['afi'] = data[index]
+            index += 1
+        if infoFlags & self.INFO_FLAGS['MEMORY_SIZE']:
+            sysInfo['numBlocks'] = data[index] + 1
+            sysInfo['blockSize'] = (data[index+1] & 0x1F) + 1
+            index += 2
+        if infoFlags & self.INFO_FLAGS['IC_REFERENCE']:
+            sysInfo['icReference'] = data[index]
+        return sysInfo, error
 
 
     def getMultipleBlockSecurityStatusCmd(self, firstBlockNumber, numberOfBlocks, uid=[]):
         #'2C'
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['GET_MULTIPLE_BLOCK_SECURITY_STATUS'])
-        if uid is not []:
-            frame.extend(uid)
-        frame.append(firstBlockNumber)
-        frame.append(numberOfBlocks)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = self._frame('GET_MULTIPLE_BLOCK_SECURITY_STATUS', uid, (firstBlockNumber, numberOfBlocks))
+        return self._transact(frame, self._answerTimeout(frame, 2 + numberOfBlocks))
 
 
     def customCommand(self, cmdCode, mfCode, data):
         # 'A0' - 'DF' Custom IC Mfg dependent
         # 'E0' - 'FF' Proprietary IC Mfg dependent
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, cmdCode)
-        frame.insert(2, mfCode)
-        if data is not []:
-            frame.extend(data)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = bytearray((self.flags, cmdCode, mfCode))
+        frame.extend(data)
+        return self._transact(frame)
 
     """
     Note: firstBlockNumber: 2 bytes, LSB first
     """
     def customReadSinlge(self, mfCode, firstBlockNumber, uid=[]):
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, self.CMD_CODE['CUSTOM_READ_SINGLE'])
-        frame.insert(2, mfCode)
-        if uid is not []:
-            frame.extend(uid)
-        if len(firstBlockNumber) == 1:
-            frame.extend(0)
+        frame = bytearray((self._requestFlags(uid), self.CMD_CODE['CUSTOM_READ_SINGLE'], mfCode))
+        frame.extend(uid)
         frame.extend(firstBlockNumber)
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        if len(firstBlockNumber) == 1:
+            frame.append(0)
+        return self._transact(frame)
 
     """
     Note: firstBlockNumber: 2 bytes, LSB first
@@ -299,10 +728,9 @@ class iso_iec_15693(object):
 
 
     def rfuCommand(self, cmdCode, data, uid=[]):
-        frame = []
-        frame.insert(0, self.flags)
-        frame.insert(1, cmdCode)
-        frame.extend(map(ord,data))
-        flags, data = self.pn5180.transactionIsoIec15693(frame)
-        error = self.getError(flags, data)
-        return data, error
+        frame = bytearray((self.flags, cmdCode))
+        if isinstance(data, str) and not isinstance(data, bytes):
+            # Text data: one byte per character
+            data = data.encode('latin-1')
+        frame.extend(bytearray(data))
+        return self._transact(frame)
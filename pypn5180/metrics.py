@@ -0,0 +1,151 @@
+import json
+from . import pypn5180hal
+
+"""
+Latency instrumentation of the PN5180 HAL and ISO IEC 15693 layers.
+Enabled with PN5180_HIL(metrics=True), available as pn5180.metrics.
+
+Times are in us:
+    busTime  : SPI transfers
+    waitTime : BUSY waits and fixed delays
+    overhead : (ISO commands) remaining host time, Python and USB scheduling
+"""
+
+
+"""
+Latency histogram with power of 2 buckets, from 1 us to 2^(BUCKETS-1) us
+"""
+class _histogram(object):
+
+    BUCKETS = 24
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+
+    def add(self, us):
+        self.counts[min(int(us).bit_length(), self.BUCKETS - 1)] += 1
+
+    def snapshot(self):
+        return dict(("<%dus" %(1 << k), count) for k, count in enumerate(self.counts) if count)
+
+
+class _entry(object):
+
+    def __init__(self):
+        self.count = 0
+        self.txBytes = 0
+        self.rxBytes = 0
+        self.busTime = 0.0
+        self.waitTime = 0.0
+        self.overhead = 0.0
+        self.instructions = 0
+        self.busHistogram = _histogram()
+        self.waitHistogram = _histogram()
+        self.latencyHistogram = _histogram()
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'txBytes': self.txBytes,
+            'rxBytes': self.rxBytes,
+            'busTime': self.busTime,
+            'waitTime': self.waitTime,
+            'overhead': self.overhead,
+            'instructions': self.instructions,
+            'busHistogram': self.busHistogram.snapshot(),
+            'waitHistogram': self.waitHistogram.snapshot(),
+            'latencyHistogram': self.latencyHistogram.snapshot(),
+        }
+
+
+class HalMetrics(object):
+
+    CMD_NAME = dict((code, name) for name, code in pypn5180hal.PN5180_HIL.CMD.items())
+
+    def __init__(self):
+        self.reset()
+
+    """
+    reset(self)
+    Clear all counters
+    """
+    def reset(self):
+        self.instructions = {}
+        self.isoCommands = {}
+        self.totalBusTime = 0.0
+        self.totalWaitTime = 0.0
+        self.instructionCount = 0
+
+    def _entry(self, table, name):
+        if name not in table:
+            table[name] = _entry()
+        return table[name]
+
+    """
+    recordInstruction(self, cmd, txBytes, rxBytes, busTime, waitTime)
+    Record one SPI instruction (PN5180_HIL.CMD code)
+    """
+    def recordInstruction(self, cmd, txBytes, rxBytes, busTime, waitTime):
+        entry = self._entry(self.instructions, self.CMD_NAME.get(cmd, "0x%02X" %cmd))
+        entry.count += 1
+        entry.txBytes += txBytes
+        entry.rxBytes += rxBytes
+        entry.busTime += busTime
+        entry.waitTime += waitTime
+        entry.busHistogram.add(busTime)
+        entry.waitHistogram.add(waitTime)
+        entry.latencyHistogram.add(busTime + waitTime)
+        self.totalBusTime += busTime
+        self.totalWaitTime += waitTime
+        self.instructionCount += 1
+
+    """
+    recordDelay(self, us)
+    Record a fixed delay outside of an instruction (softwareReset...)
+    """
+    def recordDelay(self, us):
+        self.totalWaitTime += us
+
+    """
+    isoStart(self)
+    response : token for recordIso
+    """
+    def isoStart(self):
+        return (pypn5180hal._timer(), self.totalBusTime, self.totalWaitTime, self.instructionCount)
+
+    """
+    recordIso(self, name, token, txBytes, rxBytes)
+    Record one ISO IEC 15693 command started at isoStart()
+    """
+    def recordIso(self, name, token, txBytes, rxBytes):
+        start, busTime, waitTime, instructionCount = token
+        latency = (pypn5180hal._timer() - start) * 1000000.0
+        busTime = self.totalBusTime - busTime
+        waitTime = self.totalWaitTime - waitTime
+        entry = self._entry(self.isoCommands, name)
+        entry.count += 1
+        entry.txBytes += txBytes
+        entry.rxBytes += rxBytes
+        entry.busTime += busTime
+        entry.waitTime += waitTime
+        entry.overhead += max(latency - busTime - waitTime, 0.0)
+        entry.busHistogram.add(busTime)
+        entry.waitHistogram.add(waitTime)
+        entry.latencyHistogram.add(latency)
+        entry.instructions += self.instructionCount - instructionCount
+
+    """
+    snapshot(self)
+    response : dict of all counters
+    """
+    def snapshot(self):
+        return {
+            'instructions': dict((name, entry.snapshot()) for name, entry in self.instructions.items()),
+            'isoCommands': dict((name, entry.snapshot()) for name, entry in self.isoCommands.items()),
+            'totalBusTime': self.totalBusTime,
+            'totalWaitTime': self.totalWaitTime,
+            'instructionCount': self.instructionCount,
+        }
+
+    def toJson(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent, sort_keys=True)
@@ -0,0 +1,91 @@
+import time
+
+"""
+Tag presence detection. Without tag in the field the PN5180 sleeps in
+low-power card detection (LPCD) and the host waits on the IRQ line; a detection
+switches the field on and runs an inventory. While tags are present, an
+inventory every presenceInterval detects departures.
+"""
+
+
+"""
+PresenceMonitor(isoIec15693, wakeupCounter=300, presenceInterval=0.5, afi=None, slots=16)
+isoIec15693      : connected iso_iec_15693 instance, use irq="FTDI"/"RASPI" to
+                   wait without SPI traffic
+wakeupCounter    : ms between two LPCD field measurements
+presenceInterval : s between two inventories while tags are present
+"""
+class PresenceMonitor(object):
+
+    ARRIVAL = "ARRIVAL"
+    DEPARTURE = "DEPARTURE"
+
+    # Tag power up time after field on (us)
+    TAG_POWER_UP_TIME = 1000
+
+    def __init__(self, isoIec15693, wakeupCounter=300, presenceInterval=0.5, afi=None, slots=16):
+        self.isoIec15693 = isoIec15693
+        self.wakeupCounter = wakeupCounter
+        self.presenceInterval = presenceInterval
+        self.afi = afi
+        self.slots = slots
+        self.present = []
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {'lpcdWakes': 0, 'falseWakes': 0, 'inventories': 0, 'arrivals': 0, 'departures': 0}
+
+    """
+    events(self, timeout=None)
+    Generator of tag arrivals and departures
+    timeout : s, None to wait forever
+    yield : ARRIVAL or DEPARTURE, uid
+    """
+    def events(self, timeout=None):
+        pn5180 = self.isoIec15693.pn5180
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            while True:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return
+                if not self.present:
+                    if not pn5180.lpcdWait(self.wakeupCounter, None if remaining is None else remaining * 1000000.0):
+                        return
+                    self.stats['lpcdWakes'] += 1
+                    pn5180.configureIsoIec15693Mode(reset=False, loadConfig=False)
+                    pn5180._usDelay(self.TAG_POWER_UP_TIME)
+                else:
+                    time.sleep(self.presenceInterval if remaining is None else min(self.presenceInterval, remaining))
+
+                found = [uid for uid, dsfid in self.isoIec15693.inventory(self.afi, self.slots, stayQuiet=False)]
+                self.stats['inventories'] += 1
+                if not self.present and not found:
+                    self.stats['falseWakes'] += 1
+                for uid in self.present:
+                    if uid not in found:
+                        self.stats['departures'] += 1
+                        if self.isoIec15693.blockCache is not None:
+                            self.isoIec15693.blockCache.invalidate(uid)
+                        yield self.DEPARTURE, uid
+                previous = self.present
+                self.present = found
+                for uid in found:
+                    if uid not in previous:
+                        self.stats['arrivals'] += 1
+                        yield self.ARRIVAL, uid
+        finally:
+            # Leave the reader usable: normal mode, field on
+            if not self.present:
+                pn5180.configureIsoIec15693Mode(reset=False, loadConfig=False)
+
+    """
+    run(self, onArrival, onDeparture=None, timeout=None)
+    Call onArrival(uid) and onDeparture(uid) on tag events until timeout
+    """
+    def run(self, onArrival, onDeparture=None, timeout=None):
+        for event, uid in self.events(timeout):
+            if event == self.ARRIVAL:
+                onArrival(uid)
+            elif onDeparture is not None:
+                onDeparture(uid)
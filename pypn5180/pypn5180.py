@@ -2,6 +2,7 @@ import time
 import struct
 import binascii
 from . import pypn5180hal
+from .registers import RegisterSnapshot
 
 
 """
@@ -17,6 +18,45 @@ class PN5180(pypn5180hal.PN5180_HIL):
 
     MAX_REGISTER_ADDR = 0x29
 
+    # Maximum wait for the tag answer after the end of transmission (us), see transactionIsoIec15693
+    transactionTimeout = 50000
+
+    # ISO IEC 15693 VCD to VICC transmission time (us): 1 out of 4 coding
+    ISO_15693_TX_BYTE_TIME = 302.08
+    ISO_15693_TX_SOF_EOF_TIME = 226.56
+    ISO_15693_TX_MARGIN = 500
+
+    # RX_STATUS of the last transactionIsoIec15693 answer
+    lastRxStatus = 0
+
+    # IRQ_STATUS at the end of the last transactionIsoIec15693: RX_SOF_DET_IRQ
+    # without RX_IRQ is an answer cut by the timeout
+    lastIrqStatus = 0
+
+    # SPI instructions of the last transactionIsoIec15693
+    lastTransactionInstructions = 0
+
+    # Registers polled by the fast path: IRQ_STATUS, RX_STATUS, RF_STATUS
+    TRANSACTION_STATUS_REGISTERS = bytearray((0x02, 0x13, 0x1D))
+
+    # IRQ_STATUS bits ending an RF transaction
+    TRANSACTION_END_IRQ = (pypn5180hal.PN5180_HIL.IRQ_STATUS['RX_IRQ'] |
+                           pypn5180hal.PN5180_HIL.IRQ_STATUS['TIMER0_IRQ'] |
+                           pypn5180hal.PN5180_HIL.IRQ_STATUS['TIMER1_IRQ'] |
+                           pypn5180hal.PN5180_HIL.IRQ_STATUS['TIMER2_IRQ'] |
+                           pypn5180hal.PN5180_HIL.IRQ_STATUS['RF_ACTIVE_ERROR_IRQ'] |
+                           pypn5180hal.PN5180_HIL.IRQ_STATUS['GENERAL_ERROR_IRQ'])
+
+    # IRQ_STATUS bit set when the answer SOF is detected
+    ANSWER_START_IRQ = pypn5180hal.PN5180_HIL.IRQ_STATUS['RX_SOF_DET_IRQ']
+
+    # lpcdWait without IRQ backend: IRQ_STATUS is polled this fraction of the
+    # wake-up period, plus LPCD_POLL_MARGIN us, after the period. The wake-up
+    # counter runs on the inaccurate low-frequency oscillator and a poll before the
+    # field measurement wakes the chip up: the card becomes the new reference
+    LPCD_POLL_TOLERANCE = 0.25
+    LPCD_POLL_MARGIN = 2000
+
     """
     getFirmwareVersion(self)
     response : 2 bytes 
@@ -51,45 +91,136 @@ class PN5180(pypn5180hal.PN5180_HIL):
         dieIdentifier = self.readEeprom(self.EEPROM_ADDR['DIE_IDENTIFIER'], 16)
         return self._toHex(dieIdentifier)
 
+    """
+    chipInfo(self)
+    response : dict of chip versions and die identifier (hex string)
+    """
+    def chipInfo(self):
+        return {
+            'firmwareVersion': self.getFirmwareVersion(),
+            'productVersion': self.getProductVersion(),
+            'eepromVersion': self.getEepromVersion(),
+            'dieIdentifier': self.getDieIdentifier().decode('ascii'),
+        }
+
     """
     selfTest(self)
     Display PN5180 chip versions (HW, SW)
+    response : chipInfo dict
     """
     def selfTest(self):
         # Get firmware version from EEPROM
-        firmwareVersion = self.getFirmwareVersion()
-        productVersion  = self.getProductVersion()
-        eepromVersion   = self.getEepromVersion()
-        dieIdentifier   = self.getDieIdentifier()
-        print(" Firmware version: %#x" % firmwareVersion)
-        print(" Product Version : %#x" % productVersion)
-        print(" EEPROM version  : %#x" % eepromVersion)
-        print(" Die identifier  : %#r" % dieIdentifier)
+        info = self.chipInfo()
+        print(" Firmware version: %#x" % info['firmwareVersion'])
+        print(" Product Version : %#x" % info['productVersion'])
+        print(" EEPROM version  : %#x" % info['eepromVersion'])
+        print(" Die identifier  : %s" % info['dieIdentifier'])
+        return info
+
+
+    """
+    warmStart(self, cache)
+    Check whether the chip is still configured as recorded in a ChipCache:
+    one EEPROM read (die identifier) and READ_REGISTER_MULTIPLE instructions
+    (18 registers each) of the cached RF configuration registers replace the
+    self test, the soft reset and the RF configuration loading.
+    response : cache entry, or None when a full configuration is needed
+    """
+    def warmStart(self, cache):
+        entry = cache.get(self.getDieIdentifier().decode('ascii'))
+        if entry is None or not entry['registers']:
+            return None
+        registers = entry['registers']
+        values = self.readRegisterMultiple([address for address, value in registers])
+        for k, (address, value) in enumerate(registers):
+            if self._toInt32(values[4*k:4*k+4]) != value:
+                return None
+        self.rfConfig = list(entry['rfConfig'])
+        return entry
+
+
+    """
+    updateCache(self, cache, info=None)
+    Record the chip versions and the registers of the loaded RF configuration
+    (addresses from RETRIEVE_RF_CONFIG, current values) in a ChipCache
+    info : chipInfo dict, read when not given
+    """
+    def updateCache(self, cache, info=None):
+        if info is None:
+            info = self.chipInfo()
+        addresses = []
+        for cfg in self.rfConfig:
+            if cfg is not None:
+                addresses.extend(address for address, value in self.retrieveRfConfig(cfg) if address not in addresses)
+        values = self.readRegisterMultiple(addresses) if addresses else []
+        entry = dict(info)
+        entry['rfConfig'] = list(self.rfConfig)
+        entry['registers'] = [[address, self._toInt32(values[4*k:4*k+4])] for k, address in enumerate(addresses)]
+        cache.store(info['dieIdentifier'], entry)
+        return entry
+
+
+    """
+    snapshotRegisters(self)
+    Read all REGISTER_NAME registers from the chip with READ_REGISTER_MULTIPLE
+    (3 instructions)
+    response : registers.RegisterSnapshot
+    """
+    def snapshotRegisters(self):
+        addresses = sorted(self.REGISTER_NAME)
+        values = struct.unpack("<%dI" %len(addresses), bytes(bytearray(self.readRegisterMultiple(addresses))))
+        return RegisterSnapshot(zip(addresses, values))
 
 
     """
     dumpRegisters(self)
     Dumps and display all PN5180 registers
+    response : registers.RegisterSnapshot
     """
     def dumpRegisters(self):
+        snapshot = self.snapshotRegisters()
         print("======= Register Dump =======")
-        for addr in range(0, self.MAX_REGISTER_ADDR):
-            registerValue = self.readRegister(addr)
-            print("%s %#x = %#x (%r)" %(self.REGISTER_NAME[addr], addr, registerValue, bin(registerValue)))
-        registerValue = self.readRegister(0x39)
-        print("%s %#x = %#x (%r)" %(self.REGISTER_NAME[0x39], 0x39, registerValue, bin(registerValue)))
+        print(snapshot)
         print("=============================")
+        return snapshot
 
 
     """
-    configureIsoIec15693Mode(self)
+    setRfProfile(self, profile)
+    Load the transmitter and receiver RF configurations of a profile,
+    only the ones differing from the loaded configurations
+    profile : RF_PROFILES key
+    """
+    def setRfProfile(self, profile):
+        txCfg, rxCfg = [self.RF_CFG[name] for name in self.RF_PROFILES[profile]]
+        if [txCfg, rxCfg] == self.rfConfig:
+            return
+        self.loadRfConfig(0xFF if txCfg == self.rfConfig[0] else txCfg,
+                          0xFF if rxCfg == self.rfConfig[1] else rxCfg)
+
+    """
+    getRfProfile(self)
+    response : RF_PROFILES key of the loaded RF configurations, or None
+    """
+    def getRfProfile(self):
+        for profile, names in self.RF_PROFILES.items():
+            if [self.RF_CFG[name] for name in names] == self.rfConfig:
+                return profile
+        return None
+
+    """
+    configureIsoIec15693Mode(self, reset=True, loadConfig=True, rfProfile="ASK100_26KBPS")
     Soft reset, configure default parameters for Iso IEC 15693 and enable RF
+    reset      : False to skip the soft reset (100 ms) of a chip known to be in a clean state
+    loadConfig : False to keep the loaded RF configuration, see warmStart
+    rfProfile  : RF_PROFILES key loaded with loadConfig
     """
-    def configureIsoIec15693Mode(self):
+    def configureIsoIec15693Mode(self, reset=True, loadConfig=True, rfProfile="ASK100_26KBPS"):
         # TODO :
         #   - do a clean interface selector, not hard coded
         #   - Configure CRC registers
-        self.softwareReset()
+        if reset:
+            self.softwareReset()
 
         # RF_CFG = {        
         # 'TX_ISO_15693_ASK100':0x0D, # 26 kbps
@@ -97,29 +228,122 @@ class PN5180(pypn5180hal.PN5180_HIL):
         # 'TX_ISO_15693_ASK10':0x0E,  # 26 kbps
         # 'RX_ISO_15693_53KBPS':0x8E  # 53 kbps
         #  }
-        self.loadRfConfig(self.RF_CFG['TX_ISO_15693_ASK100'], self.RF_CFG['RX_ISO_15693_26KBPS'])
+        if loadConfig:
+            txName, rxName = self.RF_PROFILES[rfProfile]
+            self.loadRfConfig(self.RF_CFG[txName], self.RF_CFG[rxName])
         self.rfOn(self.RF_ON_MODE["STANDARD"])
 
         # Set SYSTEM regsiter state machine to transceive
         self.setSystemCommand("COMMAND_IDLE_SET")
 
     """
-    transactionIsoIec15693(cmd)
+    transactionIsoIec15693(cmd, timeout=None)
     Perform RF transaction. Send command to the RFiD device and read device result.
+    The answer is read as soon as IRQ_STATUS reports the end of reception (RX_IRQ),
+    a timer or an error.
+    With fastPath, the chip stays in transceive mode after an answer: the next
+    frame is sent right away (IRQ clear, SEND_DATA), and IRQ_STATUS, RX_STATUS and
+    RF_STATUS are polled with one READ_REGISTER_MULTIPLE. Back-to-back transactions
+    take 4 SPI instructions when the first poll sees the answer; with ISO IEC
+    15693 timing, each pollInterval of answer time costs one more poll. With an
+    IRQ backend the host sleeps on the IRQ line instead: 4 SPI instructions, 5
+    with sofTimeout (one more status read at the answer start timeout).
+    timeout    : us, maximum wait for the answer after the end of transmission,
+                 default transactionTimeout
+    sofTimeout : us, maximum wait for the start of the answer (RX_SOF_DET_IRQ)
+                 after the end of transmission: a missing tag is detected without
+                 waiting timeout. None to wait timeout
+    response : flags, data. flags is 0xFF when no answer was received.
+               The RX_STATUS value of the answer is kept in lastRxStatus, the
+               final IRQ_STATUS in lastIrqStatus, the
+               number of SPI instructions in lastTransactionInstructions
     """
-    def transactionIsoIec15693(self, command):
-        self.setSystemCommand("COMMAND_TRANSCEIVE_SET")
+    def transactionIsoIec15693(self, command, timeout=None, sofTimeout=None):
+        if timeout is None:
+            timeout = self.transactionTimeout
+        instructions = self.instructionCount
+        if self.fastPath:
+            flags, data = self._transactionFast(command, timeout, sofTimeout)
+        else:
+            flags, data = self._transaction(command, timeout, sofTimeout)
+        self.lastTransactionInstructions = self.instructionCount - instructions
+        return flags, data
+
+
+    def _transaction(self, command, timeout, sofTimeout=None):
+        if not self._transactionStart(command):
+            return 0xFF, []
+        # Wait for the end of transmission, then for the answer
+        irqStatus = self.waitIrqStatus(self.IRQ_STATUS['TX_IRQ'] | self.TRANSACTION_END_IRQ, self._txTimeout(command))
+        if sofTimeout is not None and not irqStatus & (self.TRANSACTION_END_IRQ | self.ANSWER_START_IRQ):
+            irqStatus = self.waitIrqStatus(self.ANSWER_START_IRQ | self.TRANSACTION_END_IRQ, sofTimeout)
+            if not irqStatus & (self.TRANSACTION_END_IRQ | self.ANSWER_START_IRQ):
+                # No answer started
+                return self._transactionEnd(irqStatus)
+        if not irqStatus & self.TRANSACTION_END_IRQ:
+            irqStatus = self.waitIrqStatus(self.TRANSACTION_END_IRQ, timeout)
+        return self._transactionEnd(irqStatus)
+
+
+    def _transactionFast(self, command, timeout, sofTimeout=None):
+        if not self._transactionStartFast(command):
+            return 0xFF, []
+        if sofTimeout is None:
+            status = self.waitTransactionStatus(self._txTimeout(command) + timeout)
+        else:
+            status = self.waitTransactionStatus(self._txTimeout(command) + sofTimeout,
+                                                self.ANSWER_START_IRQ | self.TRANSACTION_END_IRQ)
+            if status[0] & self.ANSWER_START_IRQ and not status[0] & self.TRANSACTION_END_IRQ:
+                status = self.waitTransactionStatus(timeout)
+        return self._transactionEnd(*status)
+
+
+    def _txTimeout(self, command):
+        return self.ISO_15693_TX_SOF_EOF_TIME + (len(command) + 2) * self.ISO_15693_TX_BYTE_TIME + self.ISO_15693_TX_MARGIN
+
+
+    def _transactionStart(self, command):
+        with self.batch():
+            if self.irq is not None:
+                # IRQ line raised at the end of the transaction, see waitTransactionStatus
+                self.writeRegister(self.REG_ADDR['IRQ_ENABLE'], self.TRANSACTION_END_IRQ)
+            self.clearIrqStatus()
+            self.setSystemCommand("COMMAND_TRANSCEIVE_SET")
 
         # Check RF_STATUS TRANSCEIVE_STATE value
         # must be WAIT_TRANSMIT
-        if self.getRfStatusTransceiveState() is not "WAIT_TRANSMIT":
-            print("transactionIsoIec15693 Error in RF state: %s" %self.getRfStatusTransceiveState())
-            return -1 
-        
+        transceiveState = self.getRfStatusTransceiveState()
+        if transceiveState != "WAIT_TRANSMIT":
+            print("transactionIsoIec15693 Error in RF state: %s" %transceiveState)
+            self.lastRxStatus = 0
+            self.lastIrqStatus = 0
+            self.setSystemCommand("COMMAND_IDLE_SET")
+            return False
+
         self.sendData(8,command)
-        self._usDelay(50000) # 50 ms
-        nbBytes = self.getRxStatusNbBytesReceived()
-        response = self.readData(nbBytes)
+        return True
+
+
+    def _transactionStartFast(self, command):
+        if not self.transceiveArmed:
+            return self._transactionStart(command)
+        # Transceiver back in WAIT_TRANSMIT after the previous answer
+        self.clearIrqStatus()
+        self.sendData(8,command)
+        return True
+
+
+    def _transactionEnd(self, irqStatus, rxStatus=None, rfStatus=None):
+        self.lastRxStatus = 0
+        self.lastIrqStatus = irqStatus
+        if irqStatus & self.IRQ_STATUS['RX_IRQ']:
+            if rxStatus is None:
+                rxStatus = self.readRegister(self.REG_ADDR['RX_STATUS'])
+            self.lastRxStatus = rxStatus
+            nbBytes = self.lastRxStatus & self.RX_STATUS['NUM_BYTES_RECEIVED']
+            response = self.readData(nbBytes)
+        else:
+            response = []
         if response:
             flags = response[0]
             data = response[1:]
@@ -128,14 +352,160 @@ class PN5180(pypn5180hal.PN5180_HIL):
             flags = 0xFF
             data = []
 
-        self.setSystemCommand("COMMAND_IDLE_SET")
+        # Fast path: stay in transceive mode when the transceiver waits for the next frame
+        self.transceiveArmed = (rfStatus is not None and bool(irqStatus & self.IRQ_STATUS['RX_IRQ']) and
+                                self.RF_STATUS_TRANSCEIVE_STATE[(rfStatus >> 24) & 0x7] == "WAIT_TRANSMIT")
+        if not self.transceiveArmed:
+            self.setSystemCommand("COMMAND_IDLE_SET")
 
         return flags, data
 
 
+    """
+    transactionIsoIec15693Eof(self, timeout=None, sofTimeout=None)
+    Send an ISO IEC 15693 EOF alone and read the answer: next inventory slot,
+    or answer of a write request sent with the option flag
+    """
+    def transactionIsoIec15693Eof(self, timeout=None, sofTimeout=None):
+        self.setTxEofOnly(True)
+        flags, data = self.transactionIsoIec15693([], timeout, sofTimeout)
+        self.setTxEofOnly(False)
+        return flags, data
+
+
+    """
+    setTxEofOnly(self, enable)
+    Configure TX_CONFIG to transmit an EOF only, or restore the previous configuration
+    """
+    def setTxEofOnly(self, enable):
+        if enable:
+            self._txConfig = self.readRegister(self.REG_ADDR['TX_CONFIG'])
+            self.writeRegisterAndMask(self.REG_ADDR['TX_CONFIG'], self.TX_CONFIG['EOF_ONLY_CLR'])
+        else:
+            self.writeRegister(self.REG_ADDR['TX_CONFIG'], self._txConfig)
+
+
+    """
+    getIrqStatus(self)
+    response : IRQ_STATUS register value, see IRQ_STATUS bits
+    """
+    def getIrqStatus(self):
+        return self.readRegister(self.REG_ADDR['IRQ_STATUS'])
+
+
+    """
+    clearIrqStatus(self, mask)
+    Clear IRQ_STATUS bits through the IRQ_CLEAR register
+    mask : IRQ_STATUS bits to clear, default all
+    """
+    def clearIrqStatus(self, mask=pypn5180hal.PN5180_HIL.IRQ_STATUS['ALL']):
+        self.writeRegister(self.REG_ADDR['IRQ_CLEAR'], mask)
+
+
+    """
+    waitIrqStatus(self, mask, timeout)
+    Poll IRQ_STATUS every pollInterval us until one of the mask bits is set.
+    With an IRQ backend, wait for the IRQ line (IRQ_ENABLE bits) then read
+    IRQ_STATUS once, see waitTransactionStatus
+    mask    : IRQ_STATUS bits to wait for
+    timeout : us
+    response : last IRQ_STATUS value, without mask bits on timeout
+    """
+    def waitIrqStatus(self, mask, timeout):
+        if self.irq is not None:
+            self.waitIrqPin(timeout)
+            return self.getIrqStatus()
+        deadline = self.clock() + timeout / 1000000.0
+        while True:
+            # Deadline checked before reading so the last read is past the deadline
+            expired = self.clock() > deadline
+            irqStatus = self.getIrqStatus()
+            if irqStatus & mask or expired:
+                return irqStatus
+            self._pollDelay(deadline)
+
+
+    def _pollDelay(self, deadline):
+        # pollInterval between two status polls, without sleeping past the deadline
+        remaining = (deadline - self.clock()) * 1000000.0
+        if remaining > 0:
+            self._usDelay(min(self.pollInterval, remaining))
+
+
+    """
+    lpcdWait(self, wakeupCounter=300, timeout=None)
+    Switch the field off and sleep in low-power card detection until a card is
+    detected. With an IRQ backend the host waits on the IRQ line without any
+    SPI traffic, otherwise IRQ_STATUS is read once per wake-up period, after the
+    LPCD field measurement (see LPCD_POLL_TOLERANCE).
+    wakeupCounter : ms between two LPCD field measurements
+    timeout       : us, None to wait forever
+    response : True on card detection, False on timeout. The chip is back in
+               normal mode, field off (see configureIsoIec15693Mode)
+    """
+    def lpcdWait(self, wakeupCounter=300, timeout=None):
+        lpcdIrq = self.IRQ_STATUS['LPCD_IRQ']
+        deadline = None if timeout is None else self.clock() + timeout / 1000000.0
+        irqEnable = self.readRegister(self.REG_ADDR['IRQ_ENABLE'])
+        self.rfOff()
+        detected = False
+        pollDelay = wakeupCounter * 1000 * (1 + self.LPCD_POLL_TOLERANCE) + self.LPCD_POLL_MARGIN
+        while not detected:
+            with self.batch():
+                self.writeRegister(self.REG_ADDR['IRQ_ENABLE'], lpcdIrq)
+                self.clearIrqStatus()
+            self.switchModeLpcd(wakeupCounter)
+            remaining = None if deadline is None else max((deadline - self.clock()) * 1000000.0, 0)
+            if self.irq is not None:
+                self.waitIrqPin(remaining)
+            elif remaining is None:
+                self._usDelay(pollDelay)
+            else:
+                self._usDelay(min(pollDelay, remaining))
+            # Any SPI instruction wakes the chip up from LPCD: enter it again
+            # after a poll without detection
+            detected = bool(self.getIrqStatus() & lpcdIrq)
+            if deadline is not None and self.clock() >= deadline:
+                break
+        with self.batch():
+            self.writeRegister(self.REG_ADDR['IRQ_ENABLE'], irqEnable)
+            self.clearIrqStatus(lpcdIrq)
+        return detected
+
+
+    """
+    waitTransactionStatus(self, timeout, mask=TRANSACTION_END_IRQ)
+    Poll IRQ_STATUS, RX_STATUS and RF_STATUS with one READ_REGISTER_MULTIPLE
+    every pollInterval us until the end of an RF transaction.
+    With an IRQ backend, wait for the IRQ line (TRANSACTION_END_IRQ enabled)
+    then read the status once: mask bits out of TRANSACTION_END_IRQ are only
+    seen at the timeout.
+    timeout : us
+    mask    : IRQ_STATUS bits to wait for
+    response : irqStatus, rxStatus, rfStatus
+    """
+    def waitTransactionStatus(self, timeout, mask=TRANSACTION_END_IRQ):
+        if self.irq is not None:
+            self.waitIrqPin(timeout)
+            return self.getTransactionStatus()
+        deadline = self.clock() + timeout / 1000000.0
+        while True:
+            # Deadline checked before reading so the last read is past the deadline
+            expired = self.clock() > deadline
+            status = self.getTransactionStatus()
+            if status[0] & mask or expired:
+                return status
+            self._pollDelay(deadline)
+
+
+    def getTransactionStatus(self):
+        values = self.readRegisterMultiple(self.TRANSACTION_STATUS_REGISTERS)
+        return struct.unpack("<III", bytes(bytearray(values)))
+
+
     def getRfStatusTransceiveState(self):
         regvalue = self.readRegister(self.REG_ADDR['RF_STATUS'])
-        transceiveState = (regvalue >> 24) & 0x3
+        transceiveState = (regvalue >> 24) & 0x7
         return self.RF_STATUS_TRANSCEIVE_STATE[transceiveState] 
 
 
@@ -145,12 +515,16 @@ class PN5180(pypn5180hal.PN5180_HIL):
 
 
     def setSystemCommand(self, mode):
-        self.writeRegisterAndMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG["COMMAND_CLR"])
-        self.writeRegisterOrMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG[mode])
+        self.transceiveArmed = False
+        with self.batch():
+            self.writeRegisterAndMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG["COMMAND_CLR"])
+            self.writeRegisterOrMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG[mode])
 
 
     def softwareReset(self):
+        self.transceiveArmed = False
         self.writeRegisterOrMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG["RESET_SET"])
         self._usDelay(50000) # 50ms
         self.writeRegisterAndMask(self.REG_ADDR["SYSTEM_CONFIG"],self.SYSTEM_CONFIG["RESET_CLR"])
         self._usDelay(50000) # 50ms
+        self.invalidateShadow()
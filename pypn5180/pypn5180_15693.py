@@ -1,16 +1,24 @@
 from pypn5180.iso_iec_15693 import iso_iec_15693
+from pypn5180.dump import FramDumper, StreamingDump, IncrementalDump
+from pypn5180.chipcache import ChipCache, SpiSpeedCache
+from pypn5180.presence import PresenceMonitor
+from pypn5180.spitrace import SpiReplay
+from pypn5180.retrypolicy import RetryPolicy
 import time
 import os
+import sys
 import errno
 import binascii
 import argparse
 import datetime
 import struct
-import progressbar
+import json
 
 
 class pbar():
     def __init__(self):
+        # Only needed for dumps
+        import progressbar
         self.pb = progressbar.ProgressBar().start()
 
     def updatepb(self, current_block, max_block):
@@ -22,16 +30,32 @@ class pbar():
 
 
 def dumpFRAM(binFile):
-    with open(binFile, 'wb') as fid:
-        pb = pbar()
-        print("destination file: %s" %binFile)
-        for k in range(255):
-            pb.updatepb(k, 255)
-            data, errStr = isoIec15693.readSingleBlockCmd(k)
-            if 'OK' in errStr:
-                hexdata = bytes(data)
-                fid.write(hexdata)
-        pb.finish()
+    pb = pbar()
+    print("destination file: %s" %binFile)
+    dumper = FramDumper(isoIec15693)
+    state = StreamingDump(dumper, binFile).run(pb.updatepb)
+    pb.finish()
+    print("%d blocks in %d transactions, %.1f blocks/s" %(dumper.stats['blocks'], dumper.stats['transactions'], dumper.stats['blocksPerSec']))
+    if dumper.stats['aborted']:
+        print("Tag lost")
+    if state['complete']:
+        print("SHA-256: %s" %state['digest'])
+    else:
+        print("Incomplete dump, run again with '-O %s' to resume" %binFile)
+
+
+def incrementalDump(deltaFile, snapshotDir, mutable, fullEvery):
+    # mutable: 'first:count,first:count'
+    mutableRanges = [tuple(int(value) for value in blocks.split(":")) for blocks in mutable.split(",") if blocks]
+    dumper = FramDumper(isoIec15693)
+    delta = IncrementalDump(dumper, snapshotDir, mutableRanges, fullEvery).run()
+    if delta is None:
+        return
+    with open(deltaFile, 'w') as fid:
+        json.dump(delta, fid, indent=1)
+    print("Scan %d (%s): %d blocks read in %d transactions, %d changed, %d failed, delta file: %s"
+          %(delta['scan'], "full" if delta['full'] else "incremental", delta['blocksRead'],
+            dumper.stats['transactions'], len(delta['changed']), len(delta['failed']), deltaFile))
 
 
 def getBlockSecurityStatus():
@@ -46,6 +70,7 @@ def displayHelp():
     print("\nSupported commands :")
     print("Maintain RF Power On                                                 :  'pypn5180.py POWER'")
     print("Dump a complete FRAM (output file: UUID-Date.dat)                    :  'pypn5180.py DUMP'")
+    print("Incremental dump against the last snapshot (UUID-Date.delta.json)    :  'pypn5180.py INCDUMP --mutable 0:16'")
     print("Read NFC block(x)                                                    :  'pypn5180.py READBLK -o x'")
     print("Write NFC block(x) 8 bits data=A1A2A3B4B5B6C7C8                      :  'pypn5180.py WRITEBLK -o x -d A1A2A3B4B5B6C7C8'")
     print("Read Security status block(x)                                        :  'pypn5180.py BLOCKSECURITY -o x'")
@@ -54,12 +79,32 @@ def displayHelp():
 
 def parseInputs():
     parser = argparse.ArgumentParser()
-    parser.add_argument("mode", type=str, default="POWER", help="give test mode: {'DUMP', 'FREEDUMP','CUSTOM', 'POWER', 'READBLK', 'WRITEBLK', 'BLOCKSECURITY'}")
+    parser.add_argument("mode", type=str, default="POWER", help="give test mode: {'DUMP', 'INCDUMP', 'FREEDUMP','CUSTOM', 'POWER', 'PRESENCE', 'READBLK', 'WRITEBLK', 'BLOCKSECURITY'}")
     parser.add_argument("-o", "--blockOffset", type=int, default=0, help="Block offset required for READBLK, WRITEBLK")
     parser.add_argument("-d","--data", type=str, default="", help="Hexlified datablock to write (8 bytes, requred for WRITEBLK, CUSTOM)")
     parser.add_argument("-c", "--custom", type=str, default="A0", help="One hex byte for CUSTOM command code ex: A0")
     parser.add_argument("-m", "--mfCode", type=str, default="07", help="Manufacturer Code ID")
     parser.add_argument("-f", "--ftdi_port", type=str, default="PORT_A", help="FTDI 2232 port 'PORT_A, PORT_B'")
+    parser.add_argument("--backend", type=str, default=None, help="SPI backend 'FTDI', 'RASPI', 'SIMULATOR' (default: detected interface)")
+    parser.add_argument("-b", "--busy", type=str, default=None, help="BUSY signal backend 'FTDI', 'RASPI' (default: fixed delay)")
+    parser.add_argument("--busyPin", type=int, default=None, help="BUSY GPIO pin (FTDI default: 4, RASPI default: 25)")
+    parser.add_argument("--irq", type=str, default=None, help="IRQ signal backend 'FTDI', 'RASPI' for PRESENCE (default: IRQ_STATUS polling)")
+    parser.add_argument("--irqPin", type=int, default=None, help="IRQ GPIO pin (FTDI default: 5, RASPI default: 24)")
+    parser.add_argument("--calibrateSpi", action="store_true", help="Find the fastest reliable SPI clock and record it (~/.cache/pypn5180/spi.json), used with --cache")
+    parser.add_argument("--fastPath", action="store_true", help="Keep the chip in transceive mode between RF transactions")
+    parser.add_argument("--noSelfTest", action="store_true", help="Skip the chip versions display at startup")
+    parser.add_argument("--noReset", action="store_true", help="Skip the chip soft reset at startup")
+    parser.add_argument("-O", "--output", type=str, default=None, help="DUMP output file, resumed when already partially dumped (default: UUID-Date.dat)")
+    parser.add_argument("--snapshots", type=str, default=None, help="INCDUMP snapshots directory (default: ~/.cache/pypn5180/snapshots)")
+    parser.add_argument("--mutable", type=str, default="", help="INCDUMP blocks read at every scan 'first:count,first:count'")
+    parser.add_argument("--fullEvery", type=int, default=16, help="INCDUMP scans between two full reads")
+    parser.add_argument("-r", "--rfProfile", type=str, default="ASK100_26KBPS", help="RF profile 'ASK100_26KBPS', 'ASK10_26KBPS', 'ASK100_53KBPS', 'ASK10_53KBPS' (vendor fast custom commands only), or 'AUTO': first 26 kbps profile the tag answers to")
+    parser.add_argument("--cache", action="store_true", help="Skip startup configuration of an already configured chip (cache: ~/.cache/pypn5180)")
+    parser.add_argument("--retries", type=int, default=1, help="Attempts after a request without answer or with a reception error")
+    parser.add_argument("--maxMisses", type=int, default=3, help="Consecutive requests without answer aborting a dump or a write")
+    parser.add_argument("--trace", type=str, default=None, help="Record the SPI frames in this trace file")
+    parser.add_argument("--replay", type=str, default=None, help="Replay a trace file recorded with --trace instead of an SPI interface")
+    parser.add_argument("--replayTiming", action="store_true", help="Replay with the recorded timing (default: full speed)")
     return parser.parse_args()
 
 
@@ -67,7 +112,29 @@ if __name__ == "__main__":
 
     args = parseInputs()
 
-    isoIec15693 = iso_iec_15693(args.ftdi_port)
+    backend, busy = args.backend, args.busy
+    if args.replay is not None:
+        backend = SpiReplay(args.replay, timing=args.replayTiming)
+        busy = "SIMULATED"
+    try:
+        isoIec15693 = iso_iec_15693(args.ftdi_port, busy=busy, busyPin=args.busyPin, backend=backend,
+                                    irq=args.irq, irqPin=args.irqPin, fastPath=args.fastPath,
+                                    selfTest=not args.noSelfTest, reset=not args.noReset,
+                                    cache=ChipCache() if args.cache else None, rfProfile=args.rfProfile,
+                                    speedCache=SpiSpeedCache() if args.cache else None, trace=args.trace,
+                                    retryPolicy=RetryPolicy(args.retries, args.maxMisses))
+    except IOError:
+        # Reported by PN5180_HIL
+        sys.exit(1)
+    if args.calibrateSpi:
+        print("SPI clock: %d Hz" %isoIec15693.pn5180.calibrateSpeed(cache=SpiSpeedCache()))
+    if args.mode == "PRESENCE":
+        # Sleep in low-power card detection, report tags until 'CTRL+C' pressed
+        monitor = PresenceMonitor(isoIec15693)
+        for event, uid in monitor.events():
+            print('%s %s' %(event, binascii.hexlify(bytes(bytearray(uid))).decode('utf-8')))
+        sys.exit(0)
+
     sys_info, errStr = isoIec15693.getSystemInformationCmd()
     serial = binascii.hexlify(bytes(sys_info[1:9])).decode('utf-8')
     print('[%s] SysInfo - chip serial: %r' %(errStr, serial))
@@ -79,7 +146,11 @@ if __name__ == "__main__":
 
     elif args.mode == "DUMP":
         date = ("%s" %datetime.datetime.now()).replace(" ", "-")
-        dumpFRAM(serial + date + ".dat")
+        dumpFRAM(args.output or serial + date + ".dat")
+
+    elif args.mode == "INCDUMP":
+        date = ("%s" %datetime.datetime.now()).replace(" ", "-")
+        incrementalDump(serial + date + ".delta.json", args.snapshots, args.mutable, args.fullEvery)
 
     elif args.mode == "FREEDUMP":
         date = ("FREE-%s" %datetime.datetime.now()).replace(" ", "-")
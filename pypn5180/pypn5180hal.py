@@ -1,6 +1,7 @@
 import time
 import struct
 import binascii
+import contextlib
 from os import sys
 
 if sys.version_info[0] < 3:
@@ -8,55 +9,205 @@ if sys.version_info[0] < 3:
 else:
     PY_VERSION = 3
 
-try:
-    from pyftdi import spi
-    SPI_DEVICE = "FTDI"
+# Highest resolution clock available for BUSY polling
+if PY_VERSION == 3:
+    _timer = time.perf_counter
+else:
+    _timer = time.time
 
-except:
+"""
+_detectBackend()
+SPI interface libraries are only imported when connecting, importing
+pypn5180 has no side effect.
+response : 'FTDI' (pyftdi, python 3 on X86), 'RASPI' (spidev) or None
+"""
+def _detectBackend():
+    try:
+        import pyftdi.spi
+        return "FTDI"
+    except ImportError:
+        pass
     try:
         import spidev
-        SPI_DEVICE = "RASPI"
-    except :
-        print("** Error importing SPI interface. Need spidev on RASPI (python 2.7) or pyftdi (python 3) on X86 **")
-        SPI_DEVICE = "ERROR"
-        sys.exit()
-
+        return "RASPI"
+    except ImportError:
+        return None
 
 
+"""
+SPI backend:
+backend : 'FTDI', 'RASPI', 'SIMULATOR' (in-process PN5180 simulator), or any
+          device object providing xfer(), and optionally setSpeed() and url.
+          Default: detected SPI interface.
+url     : identifier of the SPI device, key of the calibrated speeds, see
+          PN5180_HIL.calibrateSpeed
+"""
 class _spi():
 
-    def __init__(self, bus=0, device=0, speed=1e6, ftdi_port="PORT_A"):
-        if SPI_DEVICE is "RASPI":
+    def __init__(self, bus=0, device=0, speed=1e6, ftdi_port="PORT_A", backend=None):
+        self.speed = speed
+        if backend is None:
+            backend = _detectBackend()
+            if backend is None:
+                raise IOError("No SPI interface. Need spidev on RASPI or pyftdi on X86, or the SIMULATOR backend")
+        if backend == "SIMULATOR":
+            from .pypn5180sim import PN5180Simulator
+            backend = PN5180Simulator()
+
+        if hasattr(backend, "xfer"):
+            self.device = backend
+            self.xfer = self.device.xfer
+            self.url = getattr(backend, "url", type(backend).__name__)
+            if hasattr(backend, "setSpeed"):
+                backend.setSpeed(speed)
+
+        elif backend == "RASPI":
+            import spidev
             self.device = spidev.SpiDev()
             self.device.open(bus, device)
             self.device.max_speed_hz = speed
-            self.xfer = self.device.xfer
+            self.xfer = self.raspi_xfer
+            self.url = "spidev%d.%d" %(bus, device)
 
-        elif SPI_DEVICE is "FTDI":
+        elif backend == "FTDI":
             # Configure FTDI PORT A or PORT B here:
             # Port A: ftdi://ftdi:2232h/1
             # Port B: ftdi://ftdi:2232h/2
-            if ftdi_port == "PORT_A":
+            # or any pyftdi URL, ex: ftdi://ftdi:2232h:FT1234/2
+            if ftdi_port.startswith("ftdi://"):
+                ftdi_devid = ftdi_port
+            elif ftdi_port == "PORT_A":
                 ftdi_devid = "ftdi://ftdi:2232h/1"
             else:
                 ftdi_devid = "ftdi://ftdi:2232h/2"
 
+            from pyftdi import spi
             self.device = spi.SpiController()
             self.device.configure(ftdi_devid)
             self.slave = self.device.get_port(cs=0, freq=speed, mode=0)
             self.xfer = self.ftdi_xfer
+            self.url = ftdi_devid
             print("Conected to FTDI SPI %s" %ftdi_devid)
         else:
-            self.device = None            
-            self.xfer = None
+            raise IOError("No SPI interface available")
+
+    """
+    setSpeed(self, speed)
+    Change the SPI clock frequency (Hz)
+    """
+    def setSpeed(self, speed):
+        if hasattr(self, "slave"):
+            self.slave.set_frequency(speed)
+        elif hasattr(self.device, "max_speed_hz"):
+            self.device.max_speed_hz = speed
+        elif hasattr(self.device, "setSpeed"):
+            self.device.setSpeed(speed)
+        self.speed = speed
 
+    # Frames are memoryview slices of the PN5180_HIL buffers, copied once
+    # by the SPI driver
     def ftdi_xfer(self, xfert_data):
-        data = bytearray(bytes(xfert_data))
-        # print('TxData: %r' %data)
-        read_buf = self.slave.exchange(data, duplex=True)
+        # print('TxData: %r' %xfert_data)
+        read_buf = self.slave.exchange(xfert_data, duplex=True)
         # print('RxData: %r' %read_buf)
         return read_buf
 
+    def raspi_xfer(self, xfert_data):
+        # spidev needs a list
+        if isinstance(xfert_data, memoryview):
+            xfert_data = xfert_data.tolist()
+        return self.device.xfer(xfert_data)
+
+
+"""
+BUSY and IRQ signal backends:
+The PN5180 raises BUSY while it processes an SPI instruction, and IRQ while an
+enabled IRQ_STATUS bit is set. Each backend exposes read() returning True while
+the line is high, and wait(timeout) waiting for the line to be high.
+"""
+class _ftdiInputPin():
+
+    """
+    FTDI 2232H GPIO input, default AD4 (PORT_A) / BD4 (PORT_B) for BUSY,
+    AD5 / BD5 for IRQ. AD0..AD3 are used by the SPI controller.
+    """
+    # Sleep between two reads of wait (s): the GPIO is read through USB
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, controller, pin=4, pollInterval=POLL_INTERVAL):
+        self.mask = 1 << pin
+        self.pollInterval = pollInterval
+        self.gpio = controller.get_gpio()
+        self.gpio.set_direction(self.mask, 0)
+
+    def read(self):
+        return bool(self.gpio.read() & self.mask)
+
+    """
+    wait(self, timeout=None)
+    timeout : us, None to wait forever
+    response : True when the line is high, False on timeout
+    """
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else _timer() + timeout / 1000000.0
+        while not self.read():
+            if deadline is not None and _timer() > deadline:
+                return False
+            time.sleep(self.pollInterval)
+        return True
+
+
+class _raspiInputPin():
+
+    """
+    Raspberry-pi GPIO input, BCM numbering, default GPIO25 (header pin 22)
+    for BUSY, GPIO24 (header pin 18) for IRQ.
+    """
+    def __init__(self, pin=25):
+        import RPi.GPIO as GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN)
+        self.GPIO = GPIO
+        self.pin = pin
+
+    def read(self):
+        return bool(self.GPIO.input(self.pin))
+
+    """
+    wait(self, timeout=None)
+    Edge interrupt wait, no CPU load
+    timeout : us, None to wait forever
+    response : True when the line is high, False on timeout
+    """
+    def wait(self, timeout=None):
+        if self.read():
+            return True
+        if timeout is None:
+            self.GPIO.wait_for_edge(self.pin, self.GPIO.RISING)
+        else:
+            self.GPIO.wait_for_edge(self.pin, self.GPIO.RISING, timeout=max(int(timeout / 1000), 1))
+        return self.read()
+
+
+class _simulatedBusyPin():
+
+    """
+    Simulated BUSY line: held high for busyUs microseconds after every SPI frame.
+    """
+    def __init__(self, spi, busyUs=20):
+        self.busyUs = busyUs
+        self._releaseTime = 0.0
+        self._xfer = spi.xfer
+        spi.xfer = self._busyXfer
+
+    def _busyXfer(self, xfert_data):
+        read_buf = self._xfer(xfert_data)
+        self._releaseTime = _timer() + self.busyUs / 1000000.0
+        return read_buf
+
+    def read(self):
+        return _timer() < self._releaseTime
+
 
 """
 Hardware interface layer:
@@ -93,13 +244,78 @@ class PN5180_HIL(object):
         'CONFIGURE_TESTBUS_ANALOG':0x19, # Enables the Analog test bus
     }
 
+    # SPI clock frequencies tried by calibrateSpeed (Hz), up to the 7 MHz PN5180 limit
+    SPI_SPEEDS = (50000, 100000, 250000, 500000, 1000000, 2000000, 3000000, 4000000, 5000000, 7000000)
+
+    # us, maximum wait for the chip to raise BUSY after an SPI frame, see _waitBusy
+    BUSY_RISE_TIMEOUT = 20
+
+    # Register write/read-back patterns of calibrateSpeed: TIMER2_RELOAD, 20 bits
+    SPI_TEST_REGISTER = 0x0D
+    SPI_TEST_PATTERNS = (0x000AAAAA, 0x00055555, 0x000FFFFF, 0x00000000, 0x000F0F0F)
+
+    # SWITCH_MODE modes
+    SWITCH_MODE = {
+        'STANDBY':0x00,
+        'LPCD':0x01,
+        'AUTOCOLL':0x02
+    }
+
+    # SWITCH_MODE standby wake-up control bits
+    STANDBY_WAKEUP = {
+        'RF_FIELD':0x01,        # external RF field detected
+        'COUNTER':0x02          # wake-up counter expired
+    }
+
+    # Maximum wake-up counter value of SWITCH_MODE (ms, 12 bits)
+    MAX_WAKEUP_COUNTER = 0xFFF
+
+    # WRITE_REGISTER_MULTIPLE actions
+    REGISTER_ACTION = {
+        'WRITE_REGISTER':0x01,
+        'WRITE_REGISTER_OR_MASK':0x02,
+        'WRITE_REGISTER_AND_MASK':0x03
+    }
+
+    # Maximum number of [address, action, content] elements of WRITE_REGISTER_MULTIPLE
+    MAX_REGISTER_MULTIPLE = 42
+
+    # READ_REGISTER_MULTIPLE maximum number of addresses
+    MAX_REGISTER_READ_MULTIPLE = 18
+
+    # Instruction buffer size: SEND_DATA of 260 bytes, READ_DATA answer of 508 bytes
+    MAX_FRAME = 512
+
     REG_ADDR = {
         'SYSTEM_CONFIG': 0x00,
+        'IRQ_ENABLE': 0x01,
+        'IRQ_STATUS': 0x02,
+        'IRQ_CLEAR': 0x03,
         'RX_STATUS': 0x13,
+        'TX_CONFIG': 0x18,
         'CRC_TX_CONFIG': 0x19,
         'RF_STATUS': 0x1D
     }
 
+    # Configuration registers only modified by the host, see shadow option.
+    # Status registers (IRQ_STATUS, RX_STATUS, RF_STATUS...) are always read from the chip.
+    SHADOW_REGISTERS = (
+        0x00,   # SYSTEM_CONFIG
+        0x01,   # IRQ_ENABLE
+        0x04,   # TRANSCEIVER_CONFIG
+        0x0B,   # TIMER0_RELOAD
+        0x0C,   # TIMER1_RELOAD
+        0x0D,   # TIMER2_RELOAD
+        0x0E,   # TIMER0_CONFIG
+        0x0F,   # TIMER1_CONFIG
+        0x10,   # TIMER2_CONFIG
+        0x11,   # RX_WAIT_CONFIG
+        0x12,   # CRC_RX_CONFIG
+        0x17,   # TX_WAIT_CONFIG
+        0x18,   # TX_CONFIG
+        0x19,   # CRC_TX_CONFIG
+    )
+
     REGISTER_NAME = {
         0x0: "SYSTEM_CONFIG",
         0x1: "IRQ_ENABLE",
@@ -159,6 +375,41 @@ class PN5180_HIL(object):
         'COMMAND_PRBS_SET':0x00000006
     }
 
+    IRQ_STATUS = {
+        'RX_IRQ':0x00000001,
+        'TX_IRQ':0x00000002,
+        'IDLE_IRQ':0x00000004,
+        'MODE_DETECTED_IRQ':0x00000008,
+        'CARD_ACTIVATED_IRQ':0x00000010,
+        'STATE_CHANGE_IRQ':0x00000020,
+        'RFOFF_DET_IRQ':0x00000040,
+        'RFON_DET_IRQ':0x00000080,
+        'TX_RFOFF_IRQ':0x00000100,
+        'TX_RFON_IRQ':0x00000200,
+        'RF_ACTIVE_ERROR_IRQ':0x00000400,
+        'TIMER0_IRQ':0x00000800,
+        'TIMER1_IRQ':0x00001000,
+        'TIMER2_IRQ':0x00002000,
+        'RX_SOF_DET_IRQ':0x00004000,
+        'RX_SC_DET_IRQ':0x00008000,
+        'TEMPSENS_ERROR_IRQ':0x00010000,
+        'GENERAL_ERROR_IRQ':0x00020000,
+        'HV_ERROR_IRQ':0x00040000,
+        'LPCD_IRQ':0x00080000,
+        'ALL':0x000FFFFF
+    }
+
+    RX_STATUS = {
+        'NUM_BYTES_RECEIVED':0x000001FF,
+        'DATA_INTEGRITY_ERROR':0x00010000,
+        'PROTOCOL_ERROR':0x00020000,
+        'COLLISION_DETECTED':0x00040000
+    }
+
+    TX_CONFIG = {
+        'EOF_ONLY_CLR':0xFFFFFB3F   # Clear TX_DATA_ENABLE and start symbol: send EOF only
+    }
+
     RF_STATUS_TRANSCEIVE_STATE = {
         0 : "IDLE",
         1 : "WAIT_TRANSMIT",
@@ -174,7 +425,18 @@ class PN5180_HIL(object):
         'TX_ISO_15693_ASK100':0x0D, # 26 kbps
         'RX_ISO_15693_26KBPS':0x8D, # 26 kbps
         'TX_ISO_15693_ASK10':0x0E,  # 26 kbps
-        'RX_ISO_15693_53KBPS':0x8E  # 53 kbps
+        'RX_ISO_15693_53KBPS':0x8E  # 53 kbps, vendor fast custom commands only
+    }
+
+    # Transmitter (modulation) and receiver (tag data rate) RF_CFG pairs.
+    # ASK10 keeps the field up during modulation: better for tags powered by the field.
+    # Tags answer standard ISO IEC 15693 commands at 26 kbps: the 53 kbps profiles
+    # only receive the answers of vendor fast custom commands (e.g. ICODE FAST_READ)
+    RF_PROFILES = {
+        'ASK100_26KBPS':('TX_ISO_15693_ASK100', 'RX_ISO_15693_26KBPS'),
+        'ASK10_26KBPS':('TX_ISO_15693_ASK10', 'RX_ISO_15693_26KBPS'),
+        'ASK100_53KBPS':('TX_ISO_15693_ASK100', 'RX_ISO_15693_53KBPS'),
+        'ASK10_53KBPS':('TX_ISO_15693_ASK10', 'RX_ISO_15693_53KBPS')
     }
 
     EEPROM_ADDR = {
@@ -186,39 +448,286 @@ class PN5180_HIL(object):
 
     """
     Debug values : PN5180_HIL, PN5180
+    backend     : SPI backend, see _spi
+    busy        : BUSY signal backend, 'FTDI', 'RASPI', 'SIMULATED', an object
+                  providing read(), or None to use a fixed busyTimeout delay
+    busyPin     : GPIO pin number of the BUSY signal (FTDI: 4, RASPI: 25)
+    busyTimeout : us, maximum BUSY wait, or fixed delay when no BUSY backend
+    irq         : IRQ signal backend, 'FTDI', 'RASPI', 'SIMULATED', an object
+                  providing read(), or None to poll IRQ_STATUS, see waitIrqPin
+    irqPin      : GPIO pin number of the IRQ signal (FTDI: 5, RASPI: 24)
+    shadow      : keep a shadow copy of SHADOW_REGISTERS, see readRegister
+    metrics     : record instruction counts and latencies in self.metrics, see metrics.HalMetrics
+    pollInterval: us, delay between two status polls while waiting for an RF transaction
+    fastPath    : keep the chip in transceive mode between RF transactions,
+                  see PN5180.transactionIsoIec15693
+    speedCache  : chipcache.SpiSpeedCache, SPI clock calibrated for this SPI device
+                  (calibrateSpeed) replacing speed
+    trace       : file recording the SPI frames in self.spiTrace, see spitrace.SpiTraceRecorder
+    self.clock() is the time source (s) of the RF transaction waits: recorded in
+    the SPI trace, and read from the trace by a spitrace.SpiReplay backend
     """
-    def __init__(self, bus=0, device=0, speed=50000, ftdi_port="PORT_A", debug="PN5180_HIL"):
+    def __init__(self, bus=0, device=0, speed=50000, ftdi_port="PORT_A", debug="PN5180_HIL",
+                 busy=None, busyPin=None, busyTimeout=5000, backend=None, shadow=False, metrics=False,
+                 irq=None, irqPin=None, fastPath=False, speedCache=None, trace=None, pollInterval=200):
         try:
             self.debug = debug
-            self.spi = _spi(bus, device, speed, ftdi_port)
+            self.spi = _spi(bus, device, speed, ftdi_port, backend)
+            self.spiTrace = None
+            self.clock = getattr(self.spi.device, "hostClock", _timer)
+            if trace is not None:
+                from .spitrace import SpiTraceRecorder
+                self.spiTrace = SpiTraceRecorder(trace, self.spi.xfer, self.clock)
+                self.spi.xfer = self.spiTrace.xfer
+                self.clock = self.spiTrace.clock
+            self.busy = self._openBusy(busy, busyPin)
+            self.irq = self._openIrq(irq, irqPin, pollInterval)
+            self.speedCache = speedCache
+            if speedCache is not None:
+                entry = speedCache.get(self.spi.url)
+                if entry is not None:
+                    self.spi.setSpeed(entry['speed'])
+            self.busyTimeout = busyTimeout
+            self.lastBusyTime = 0
+            self._batch = None
+            # Preallocated instruction frame, and 0xFF bytes clocked out to read answers
+            self._txBuffer = bytearray(self.MAX_FRAME)
+            self._txView = memoryview(self._txBuffer)
+            self._rxDummy = memoryview(b"\xff" * self.MAX_FRAME)
+            self.shadow = {} if shadow else None
+            # Last loaded transmitter and receiver RF configurations
+            self.rfConfig = [None, None]
+            self.fastPath = fastPath
+            self.pollInterval = pollInterval
+            # Transceiver waiting for the next frame in transceive mode (fast path)
+            self.transceiveArmed = False
+            # SPI instructions sent, see PN5180.lastTransactionInstructions
+            self.instructionCount = 0
+            self.metrics = None
+            if metrics:
+                from .metrics import HalMetrics
+                self.metrics = HalMetrics()
 
         except IOError as exc:
             print("Error opening SPI device : %r" %exc)
-            sys.exit()
+            raise
+
+
+    def _openBusy(self, busy, busyPin):
+        if busy is None:
+            return None
+        elif busy == "FTDI":
+            return _ftdiInputPin(self.spi.device, 4 if busyPin is None else busyPin)
+        elif busy == "RASPI":
+            return _raspiInputPin(25 if busyPin is None else busyPin)
+        elif busy == "SIMULATED":
+            if hasattr(self.spi.device, "busyPin"):
+                return self.spi.device.busyPin
+            return _simulatedBusyPin(self.spi)
+        return busy
+
+
+    def _openIrq(self, irq, irqPin, pollInterval):
+        if irq is None:
+            return None
+        elif irq == "FTDI":
+            # RF transaction waits: GPIO read every pollInterval us
+            return _ftdiInputPin(self.spi.device, 5 if irqPin is None else irqPin, pollInterval / 1000000.0)
+        elif irq == "RASPI":
+            return _raspiInputPin(24 if irqPin is None else irqPin)
+        elif irq == "SIMULATED":
+            return self.spi.device.irqPin
+        return irq
+
+
+    """
+    waitIrqPin(self, timeout=None)
+    Wait for the IRQ line without SPI traffic, see IRQ_ENABLE
+    timeout : us, None to wait forever
+    response : True when IRQ is high, False on timeout
+    """
+    def waitIrqPin(self, timeout=None):
+        if hasattr(self.irq, "wait"):
+            return self.irq.wait(timeout)
+        deadline = None if timeout is None else _timer() + timeout / 1000000.0
+        while not self.irq.read():
+            if deadline is not None and _timer() > deadline:
+                return False
+            time.sleep(_ftdiInputPin.POLL_INTERVAL)
+        return True
 
 
     def _usDelay(self, useconds):
         time.sleep(useconds / 1000000.0)
+        if self.metrics is not None:
+            self.metrics.recordDelay(useconds)
+
+
+    """
+    _waitBusy(self)
+    Wait until the chip raises BUSY, at most BUSY_RISE_TIMEOUT us (short
+    instructions may already be done), then until it releases BUSY, at most
+    busyTimeout us. A slow GPIO backend could otherwise read BUSY low before
+    the chip raised it and send the next instruction too early.
+    Without BUSY backend, sleep busyTimeout us.
+    response : False on BUSY timeout
+    """
+    def _waitBusy(self):
+        if self.busy is None:
+            time.sleep(self.busyTimeout / 1000000.0)
+            return True
+        start = _timer()
+        riseDeadline = start + self.BUSY_RISE_TIMEOUT / 1000000.0
+        while not self.busy.read():
+            if _timer() > riseDeadline:
+                break
+        deadline = start + self.busyTimeout / 1000000.0
+        while True:
+            # Deadline checked before reading so the last read is past the deadline
+            expired = _timer() > deadline
+            if not self.busy.read():
+                break
+            if expired:
+                print("PN5180 BUSY timeout after %d us" %self.busyTimeout)
+                return False
+        self.lastBusyTime = (_timer() - start) * 1000000.0
+        return True
+
+
+    """
+    calibrateBusyTimeout(self, samples=20, margin=4)
+    Measure the BUSY time of EEPROM reads and set busyTimeout to the worst case
+    times margin. The result can be used as fixed busyTimeout on boards sharing
+    the same firmware but without BUSY wiring.
+    response : calibrated busyTimeout in us
+    """
+    def calibrateBusyTimeout(self, samples=20, margin=4):
+        if self.busy is None:
+            print("calibrateBusyTimeout requires a BUSY backend")
+            return self.busyTimeout
+        worst = 0
+        for k in range(samples):
+            self.readEeprom(self.EEPROM_ADDR['DIE_IDENTIFIER'], 16)
+            worst = max(worst, self.lastBusyTime)
+        self.busyTimeout = max(int(worst * margin), 100)
+        return self.busyTimeout
+
+
+    """
+    calibrateSpeed(self, samples=8, margin=0.5, speeds=None, cache=None)
+    Step the SPI clock up, validating each frequency with EEPROM reads (die
+    identifier and versions, compared to the values read at the current clock)
+    and TIMER2_RELOAD write/read-back patterns. The first failure stops the
+    search; the retained clock is the fastest validated one not above
+    margin * fastest validated clock. Errors at too high a clock may corrupt the
+    instructions received by the chip: calibrate on a freshly reset chip.
+    samples : validations per frequency
+    speeds  : frequencies to try (Hz), default SPI_SPEEDS
+    cache   : chipcache.SpiSpeedCache storing the result for this SPI device, default speedCache
+    response : retained SPI clock (Hz), applied
+    """
+    def calibrateSpeed(self, samples=8, margin=0.5, speeds=None, cache=None):
+        if speeds is None:
+            speeds = self.SPI_SPEEDS
+        if cache is None:
+            cache = self.speedCache
+        safeSpeed = self.spi.speed
+        # Reference values (die identifier and versions: EEPROM 0x00 to 0x15)
+        # and register content, read at the current clock
+        shadow, self.shadow = self.shadow, None
+        reference = list(self.readEeprom(self.EEPROM_ADDR['DIE_IDENTIFIER'], 22))
+        savedValue = self.readRegister(self.SPI_TEST_REGISTER)
+        validated = []
+        try:
+            for speed in sorted(speeds):
+                self.spi.setSpeed(speed)
+                if not self._checkSpeed(reference, samples):
+                    break
+                validated.append(speed)
+        finally:
+            self.spi.setSpeed(safeSpeed)
+            self.writeRegister(self.SPI_TEST_REGISTER, savedValue)
+            self.shadow = shadow
+            self.invalidateShadow(self.SPI_TEST_REGISTER)
+
+        if not validated:
+            print("SPI calibration: no valid clock, keeping %d Hz" %safeSpeed)
+            return safeSpeed
+        speed = max([s for s in validated if s <= margin * validated[-1]] or validated[:1])
+        self.spi.setSpeed(speed)
+        if cache is not None:
+            cache.store(self.spi.url, {'speed': speed, 'maxValidated': validated[-1], 'safeSpeed': safeSpeed})
+        return speed
+
+
+    def _checkSpeed(self, reference, samples):
+        for k in range(samples):
+            if list(self.readEeprom(self.EEPROM_ADDR['DIE_IDENTIFIER'], 22)) != reference:
+                return False
+            pattern = self.SPI_TEST_PATTERNS[k % len(self.SPI_TEST_PATTERNS)]
+            self.writeRegister(self.SPI_TEST_REGISTER, pattern)
+            if self.readRegister(self.SPI_TEST_REGISTER) & 0x000FFFFF != pattern:
+                return False
+        return True
 
 
     def _getResponse(self, responseLen):
         # Send 0xFF bytes to get response bytes if any
         if responseLen != 0:
-            return self.spi.xfer([0xff]*responseLen)
+            return self.spi.xfer(self._rxDummy[:responseLen])
         else:
             return []
 
 
+    """
+    _frame(self)
+    Instruction buffer, filled by the caller then sent with _sendFrame.
+    Queued register writes are sent first to keep instructions order.
+    """
+    def _frame(self):
+        if self._batch:
+            self._flushBatch()
+        return self._txBuffer
+
+
+    def _sendFrame(self, length, responseLen=0):
+        # Send the first length bytes of the instruction buffer.
+        # With metrics, bus and BUSY wait times are recorded
+        frame = self._txView[:length]
+        self.instructionCount += 1
+        metrics = self.metrics
+        if metrics is not None:
+            start = _timer()
+        self.spi.xfer(frame)
+        if metrics is not None:
+            sent = _timer()
+        if self.debug == 'PN5180_HIL':
+            print("SPI send frame: %r" %(frame.tolist()))
+        self._waitBusy()
+        if metrics is None:
+            return self._getResponse(responseLen)
+        ready = _timer()
+        response = self._getResponse(responseLen)
+        end = _timer()
+        metrics.recordInstruction(self._txBuffer[0], length, responseLen,
+                                  ((sent - start) + (end - ready)) * 1000000.0,
+                                  (ready - sent) * 1000000.0)
+        return response
+
+
     def _sendCommand(self, cmd, parameters, responseLen=0):
-        # Send [cmd][parametes]
-        # print('Sending parameters %r' %parameters)
-        parameters.insert(0, cmd)
-        dir(self.spi)
-        self.spi.xfer(parameters)
-        if self.debug is 'PN5180_HIL':
-            print("SPI send frame: %r" %(parameters))
-        self._usDelay(5000) # TODO : Manage busy signal instead of hard sleep
-        return self._getResponse(responseLen)
+        # Send [cmd][parameters], parameters: list or bytes-like
+        frame = self._frame()
+        length = 1 + len(parameters)
+        frame[0] = cmd
+        frame[1:length] = parameters
+        return self._sendFrame(length, responseLen)
+
+
+    def _sendRegister(self, cmd, address, content):
+        # [cmd][address][content, 32-bit little endian]
+        struct.pack_into("<BBI", self._frame(), 0, cmd, address, content)
+        return self._sendFrame(6, 0)
 
 
     # FIXME: python2/3 support, better way ?   
@@ -253,6 +762,93 @@ class PN5180_HIL(object):
             return binascii.hexlify(bytes(byte_list))
 
 
+    """
+    batch(self)
+    Context manager queueing register writes and masks. Queued writes are sent
+    as WRITE_REGISTER_MULTIPLE instructions of up to 42 elements when the
+    context exits, or before any other instruction.
+        with pn5180.batch():
+            pn5180.writeRegisterAndMask(...)
+            pn5180.writeRegisterOrMask(...)
+    """
+    @contextlib.contextmanager
+    def batch(self):
+        if self._batch is not None:
+            # Nested batch, flushed by the outer one
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+        finally:
+            self._flushBatch()
+            self._batch = None
+
+
+    def _flushBatch(self):
+        queue = self._batch
+        self._batch = []
+        if len(queue) == 1:
+            address, action, content = queue[0]
+            if action == self.REGISTER_ACTION['WRITE_REGISTER']:
+                self._sendRegister(self.CMD['WRITE_REGISTER'], address, content)
+            elif action == self.REGISTER_ACTION['WRITE_REGISTER_OR_MASK']:
+                self._sendRegister(self.CMD['WRITE_REGISTER_OR_MASK'], address, content)
+            else:
+                self._sendRegister(self.CMD['WRITE_REGISTER_AND_MASK'], address, content)
+            return
+        for k in range(0, len(queue), self.MAX_REGISTER_MULTIPLE):
+            self._writeRegisterMultiple(queue[k:k+self.MAX_REGISTER_MULTIPLE])
+
+
+    def _queueRegister(self, address, action, content):
+        if self._batch is None:
+            return False
+        self._batch.append((address, self.REGISTER_ACTION[action], content))
+        return True
+
+
+    """
+    invalidateShadow(self, address=None)
+    Forget the shadow value of one register, or of all registers
+    """
+    def invalidateShadow(self, address=None):
+        if self.shadow is None:
+            return
+        if address is None:
+            self.shadow.clear()
+        else:
+            self.shadow.pop(address, None)
+
+
+    def _shadowWrite(self, address, action, content):
+        # Track a register write, response: True when the write is redundant
+        if self.shadow is None or address not in self.SHADOW_REGISTERS:
+            return False
+        if address == self.REG_ADDR['SYSTEM_CONFIG'] and content & self.SYSTEM_CONFIG['RESET_SET'] \
+                and action != 'WRITE_REGISTER_AND_MASK':
+            # Soft reset restores all registers
+            self.shadow.clear()
+            return False
+
+        if action == 'WRITE_REGISTER':
+            previous = self.shadow.get(address)
+            value = content
+        else:
+            previous = self.readRegister(address)
+            if action == 'WRITE_REGISTER_OR_MASK':
+                value = previous | content
+            else:
+                value = previous & content
+
+        # START_SEND triggers a transmission and is cleared by the chip
+        if address == self.REG_ADDR['SYSTEM_CONFIG'] and value & self.SYSTEM_CONFIG['START_SEND_SET']:
+            self.shadow[address] = value & self.SYSTEM_CONFIG['START_SEND_CLR']
+            return False
+        self.shadow[address] = value
+        return value == previous
+
+
     """
     writeRegister(self, address, content)
     address  : 1 byte, Register address 
@@ -260,17 +856,18 @@ class PN5180_HIL(object):
     response : -
     """
     def writeRegister(self, address, content):
-        parameters = []
-        parameters.insert(0, address)
         if type(content) is str:
-            contentList = list(binascii.unhexlify(content))
-            parameters.extend(contentList.reverse())
-        elif type(content) is int:
-            listBytes = list(struct.pack("<I", content))
-            parameters.extend(map(ord,listBytes))
-        if self.debug is "PN5180_HIL":
-            print("WriteReg: %r <=> %r" %(parameters, content))
-        return self._sendCommand(self.CMD['WRITE_REGISTER'], parameters, 0)
+            # Hexadecimal string, most significant byte first
+            value = int(content, 16)
+        else:
+            value = content
+        if self.debug == "PN5180_HIL":
+            print("WriteReg: %r <=> %r" %([address] + self._toList(value), content))
+        if self._shadowWrite(address, 'WRITE_REGISTER', value):
+            return []
+        if self._queueRegister(address, 'WRITE_REGISTER', value):
+            return []
+        return self._sendRegister(self.CMD['WRITE_REGISTER'], address, value)
 
 
     """
@@ -280,10 +877,11 @@ class PN5180_HIL(object):
     response : -
     """
     def writeRegisterOrMask(self, address, orMask):
-        parameters = []
-        parameters.insert(0, address)
-        parameters = parameters + self._toList(orMask)
-        return self._sendCommand(self.CMD['WRITE_REGISTER_OR_MASK'], parameters, 0)
+        if self._shadowWrite(address, 'WRITE_REGISTER_OR_MASK', orMask):
+            return []
+        if self._queueRegister(address, 'WRITE_REGISTER_OR_MASK', orMask):
+            return []
+        return self._sendRegister(self.CMD['WRITE_REGISTER_OR_MASK'], address, orMask)
 
 
     """
@@ -293,53 +891,65 @@ class PN5180_HIL(object):
     response : -
     """
     def writeRegisterAndMask(self, address, andMask):
-        parameters = []
-        parameters.insert(0, address)
-        parameters = parameters + self._toList(andMask)
-        return self._sendCommand(self.CMD['WRITE_REGISTER_AND_MASK'], parameters, 0)
+        if self._shadowWrite(address, 'WRITE_REGISTER_AND_MASK', andMask):
+            return []
+        if self._queueRegister(address, 'WRITE_REGISTER_AND_MASK', andMask):
+            return []
+        return self._sendRegister(self.CMD['WRITE_REGISTER_AND_MASK'], address, andMask)
 
 
     """
-    writeRegisterMultiple(self, address, parameter)
-    address  : 1 byte, Register address 
-    parameter: Array of up to 42 elements [address, action, content]    
+    writeRegisterMultiple(self, parameterList)
+    parameterList: Array of up to 42 elements [address, action, content]
                 address: 1 byte
                 action : 1 byte (0x01 WRITE_REGISTER, 0x02 WRITE_REGISTER_OR_MASK, 0x03 WRITE_REGISTER_AND_MASK)
-                content: 4 bytes, register content
+                content: 4 bytes, register content or mask
     response : -
     """
-    def writeRegisterMultiple(self, address, parameterList):
-        parameters = []
-        parameters.insert(0, address)
+    def writeRegisterMultiple(self, parameterList):
         for param in parameterList:
-            parameters.extend(param[0])
-            parameters.extend(param[1])
-            parameters.extend(self._toList(param[2]))
+            self.invalidateShadow(param[0])
+        return self._writeRegisterMultiple(parameterList)
 
-        return self._sendCommand(self.CMD['WRITE_REGISTER_AND_MASK'], parameters, 0)
+
+    def _writeRegisterMultiple(self, parameterList):
+        frame = self._frame()
+        frame[0] = self.CMD['WRITE_REGISTER_MULTIPLE']
+        length = 1
+        for param in parameterList:
+            struct.pack_into("<BBI", frame, length, param[0], param[1], param[2])
+            length += 6
+        return self._sendFrame(length, 0)
 
     """
     readRegister(self, address)
     address  : 1 byte, Register address 
     response : 4 bytes, register content 32-bit value (little endian).
+    With the shadow option, SHADOW_REGISTERS are read once from the chip then
+    served from the shadow copy.
     """
     def readRegister(self, address):
-        parameters = []
-        parameters.insert(0, address)
-        regList = self._sendCommand(self.CMD['READ_REGISTER'], parameters, 4)
-        return self._toInt32(regList)
+        if self.shadow is not None and address in self.shadow:
+            return self.shadow[address]
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['READ_REGISTER'], address)
+        regList = self._sendFrame(2, 4)
+        value = self._toInt32(regList)
+        if self.shadow is not None and address in self.SHADOW_REGISTERS:
+            self.shadow[address] = value
+        return value
 
 
     """
     readRegisterMultiple(self, addressList)
-    addressList : 1 to 18 bytes, Register address list
-    response : 4 to 72 bytes, register content 32-bit value (little endian).
+    addressList : Register address list, one instruction per MAX_REGISTER_READ_MULTIPLE addresses
+    response : bytearray, 4 bytes per address, register content 32-bit value (little endian).
     """
     def readRegisterMultiple(self, addressList):
-        parameters = []
-        for param in addressList:
-            parameters.extend(param)
-        return self._sendCommand(self.CMD['READ_REGISTER_MULTIPLE'], parameters, 4*len(addressList))
+        values = bytearray()
+        for k in range(0, len(addressList), self.MAX_REGISTER_READ_MULTIPLE):
+            chunk = addressList[k:k + self.MAX_REGISTER_READ_MULTIPLE]
+            values.extend(bytearray(self._sendCommand(self.CMD['READ_REGISTER_MULTIPLE'], chunk, 4*len(chunk))))
+        return values
 
 
     """
@@ -360,10 +970,8 @@ class PN5180_HIL(object):
     length : 1 byte, Number of bytes to read from EEPROM
     """
     def readEeprom(self, address, length):
-        parameters = []
-        parameters.insert(0, address)
-        parameters.insert(1, length)
-        return self._sendCommand(self.CMD['READ_EEPROM'], parameters, length)
+        struct.pack_into("<BBB", self._frame(), 0, self.CMD['READ_EEPROM'], address, length)
+        return self._sendFrame(3, length)
 
 
     """
@@ -372,10 +980,7 @@ class PN5180_HIL(object):
     response : -
     """
     def writeData(self, parameterList):
-        parameters = []
-        for param in parameterList:
-            parameters.extend(param)
-        return self._sendCommand(self.CMD['WRITE_DATA'], parameters, 0)
+        return self._sendCommand(self.CMD['WRITE_TX_DATA'], parameterList, 0)
 
 
     """
@@ -385,11 +990,12 @@ class PN5180_HIL(object):
     response : -
     """
     def sendData(self, numberOfValidBits, parameterList):
-        parameters = []
-        parameters.insert(0, numberOfValidBits)
-        for param in parameterList:
-            parameters.append(param)
-        return self._sendCommand(self.CMD['SEND_DATA'], parameters, 0)
+        frame = self._frame()
+        length = 2 + len(parameterList)
+        frame[0] = self.CMD['SEND_DATA']
+        frame[1] = numberOfValidBits
+        frame[2:length] = parameterList
+        return self._sendFrame(length, 0)
 
 
     """
@@ -398,20 +1004,40 @@ class PN5180_HIL(object):
     response : 1 to 508 bytes read from Rx buffer
     """
     def readData(self, len):
-        parameters = []
-        parameters.insert(0, 0)
-        return self._sendCommand(self.CMD['READ_DATA'], parameters, len)
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['READ_DATA'], 0)
+        return self._sendFrame(2, len)
 
 
     """
-    switchMode(self)
-    TODO 
+    switchModeStandby(self, wakeupCounter, wakeupControl=STANDBY_WAKEUP['COUNTER'])
+    Enter standby, only possible from normal mode
+    wakeupCounter : ms, 0 to MAX_WAKEUP_COUNTER
+    wakeupControl : STANDBY_WAKEUP bits
     response : -
     """
-    # def switchMode(self):
-    #     parameters = []
-    #     parameters.insert(0, 0)
-    #     return self._sendCommand(self.CMD['READ_DATA'], parameters, 0)
+    def switchModeStandby(self, wakeupCounter, wakeupControl=STANDBY_WAKEUP['COUNTER']):
+        self.invalidateShadow()
+        self.transceiveArmed = False
+        struct.pack_into("<BBBH", self._frame(), 0, self.CMD['SWITCH_MODE'], self.SWITCH_MODE['STANDBY'],
+                         wakeupControl, min(wakeupCounter, self.MAX_WAKEUP_COUNTER))
+        return self._sendFrame(5, 0)
+
+
+    """
+    switchModeLpcd(self, wakeupCounter)
+    Enter low-power card detection, only possible from normal mode. The chip
+    sleeps wakeupCounter ms between two field measurements, and returns to
+    normal mode with LPCD_IRQ when the antenna load changed. LPCD thresholds
+    and field on time are EEPROM settings.
+    wakeupCounter : ms, 0 to MAX_WAKEUP_COUNTER
+    response : -
+    """
+    def switchModeLpcd(self, wakeupCounter):
+        self.invalidateShadow()
+        self.transceiveArmed = False
+        struct.pack_into("<BBH", self._frame(), 0, self.CMD['SWITCH_MODE'], self.SWITCH_MODE['LPCD'],
+                         min(wakeupCounter, self.MAX_WAKEUP_COUNTER))
+        return self._sendFrame(4, 0)
 
 
     """
@@ -419,13 +1045,39 @@ class PN5180_HIL(object):
     This instruction is used to load the RF configuration from EEPROM into the configuration registers.
     txCfg : 1 byte, Transmitter configuration byte
     rxCfg : 1 byte, receiver configuration byte
+    0xFF keeps the current configuration, the loaded ones are kept in rfConfig
     response : -
     """
     def loadRfConfig(self, txCfg, rxCfg):
-        parameters = []
-        parameters.insert(0, txCfg)
-        parameters.insert(1, rxCfg)
-        return self._sendCommand(self.CMD['LOAD_RF_CONFIG'], parameters, 0)
+        self.invalidateShadow()
+        for index, cfg in enumerate((txCfg, rxCfg)):
+            if cfg != 0xFF:
+                self.rfConfig[index] = cfg
+        struct.pack_into("<BBB", self._frame(), 0, self.CMD['LOAD_RF_CONFIG'], txCfg, rxCfg)
+        return self._sendFrame(3, 0)
+
+
+    """
+    retrieveRfConfigSize(self, rfConfig)
+    rfConfig : 1 byte, RF configuration byte
+    response : number of registers of the RF configuration
+    """
+    def retrieveRfConfigSize(self, rfConfig):
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['RETRIEVE_RF_CONFIG_SIZE'], rfConfig)
+        return self._sendFrame(2, 1)[0]
+
+
+    """
+    retrieveRfConfig(self, rfConfig)
+    Read out an RF configuration from EEPROM
+    rfConfig : 1 byte, RF configuration byte
+    response : list of (register address, 32-bit value)
+    """
+    def retrieveRfConfig(self, rfConfig):
+        size = self.retrieveRfConfigSize(rfConfig)
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['RETRIEVE_RF_CONFIG'], rfConfig)
+        data = bytearray(self._sendFrame(2, 5 * size))
+        return [struct.unpack_from("<BI", data, 5 * k) for k in range(size)]
 
 
     """
@@ -436,9 +1088,9 @@ class PN5180_HIL(object):
     response : -
     """
     def rfOn(self, ctrl):
-        parameters = []
-        parameters.insert(0, ctrl)
-        return self._sendCommand(self.CMD['RF_ON'], parameters, 0)
+        self.transceiveArmed = False
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['RF_ON'], ctrl)
+        return self._sendFrame(2, 0)
 
 
     """
@@ -446,7 +1098,7 @@ class PN5180_HIL(object):
     response : -
     """
     def rfOff(self):
-        parameters = []
-        parameters.insert(0, 0)
-        return self._sendCommand(self.CMD['RF_OFF'], parameters, 0)
+        self.transceiveArmed = False
+        struct.pack_into("<BB", self._frame(), 0, self.CMD['RF_OFF'], 0)
+        return self._sendFrame(2, 0)
 
@@ -0,0 +1,730 @@
+import struct
+import threading
+from . import pypn5180hal
+from .pypn5180hal import PN5180_HIL
+
+"""
+In-process PN5180 simulator.
+Decodes the SPI instructions of PN5180_HIL.CMD and answers ISO IEC 15693 frames
+from a population of virtual tags, with the RF timing of the norm.
+Use it as SPI backend: PN5180(backend="SIMULATOR") or PN5180(backend=PN5180Simulator(...))
+"""
+
+# ISO IEC 15693 timings (us)
+VCD_BYTE_TIME = 302.08     # 1 out of 4 coding, 26.48 kbps
+VCD_SOF_EOF_TIME = 226.56
+VICC_T1 = 320.9            # tag response delay
+VICC_SOF_EOF_TIME = 302.08
+VICC_BIT_TIME = {
+    0x8D: 37.76,           # RX_ISO_15693_26KBPS, 26.48 kbps
+    0x8E: 18.88,           # RX_ISO_15693_53KBPS, 52.97 kbps
+}
+VICC_LOW_RATE_BIT_TIME = 151.04   # 6.62 kbps
+
+# ISO IEC 15693 request flags
+FLAG_DATA_RATE = 0x02
+FLAG_INVENTORY = 0x04
+FLAG_SELECT = 0x10
+FLAG_ADDRESS = 0x20
+FLAG_OPTION = 0x40
+FLAG_AFI = 0x10
+FLAG_NB_SLOTS = 0x20
+
+# Error codes returned by virtual tags
+ERROR_NOT_SUPPORTED = 0x01
+ERROR_NOT_RECOGNISED = 0x02
+ERROR_UNKNOWN = 0x0F
+ERROR_BLOCK_NOT_AVAILABLE = 0x10
+ERROR_ALREADY_LOCKED = 0x11
+ERROR_LOCKED = 0x12
+
+# RX_STATUS bits
+RX_DATA_INTEGRITY_ERROR = 0x00010000
+RX_PROTOCOL_ERROR = 0x00020000
+RX_COLLISION_DETECTED = 0x00040000
+
+# TX_CONFIG TX_DATA_ENABLE bit, cleared to send an EOF only
+TX_DATA_ENABLE = 0x00000400
+
+
+"""
+Virtual ISO IEC 15693 tag
+uid       : 8 bytes, LSB first (as received in inventory answers)
+data      : initial memory content, numBlocks * blockSize bytes
+rxConfigs : PN5180 receiver configurations the tag can answer to (0x8E: 53 kbps,
+            vendor fast custom commands only)
+writeTime : us, programming time of one block
+maxBlocksPerRead : READ_MULTIPLE_BLOCK limit, None for the whole memory
+"""
+class VirtualTag15693(object):
+
+    def __init__(self, uid, numBlocks=256, blockSize=8, data=None, dsfid=0, afi=0, icReference=0,
+                 supportsMultipleBlocks=True, maxBlocksPerRead=None, rxConfigs=(0x8D,), writeTime=5000):
+        self.uid = list(uid)
+        self.numBlocks = numBlocks
+        self.blockSize = blockSize
+        self.memory = bytearray(numBlocks * blockSize)
+        if data is not None:
+            self.memory[:len(data)] = bytearray(data)
+        self.dsfid = dsfid
+        self.afi = afi
+        self.icReference = icReference
+        self.supportsMultipleBlocks = supportsMultipleBlocks
+        self.maxBlocksPerRead = maxBlocksPerRead
+        self.rxConfigs = rxConfigs
+        self.writeTime = writeTime
+        self.lockedBlocks = set()
+        self.afiLocked = False
+        self.dsfidLocked = False
+        self.state = "READY"
+
+    def uidValue(self):
+        return struct.unpack("<Q", bytes(bytearray(self.uid)))[0]
+
+    def powerUp(self):
+        self.state = "READY"
+
+    def block(self, blockNumber):
+        return self.memory[blockNumber*self.blockSize:(blockNumber+1)*self.blockSize]
+
+    """
+    isAddressed(self, frame)
+    Check addressing flags of a non inventory request
+    """
+    def isAddressed(self, frame):
+        flags = frame[0]
+        if flags & FLAG_ADDRESS:
+            return list(frame[self.uidOffset(frame):self.uidOffset(frame)+8]) == self.uid
+        if flags & FLAG_SELECT:
+            return self.state == "SELECTED"
+        return self.state != "QUIET"
+
+    def uidOffset(self, frame):
+        # Custom commands carry the manufacturer code before the UID
+        if 0xA0 <= frame[1] <= 0xDF:
+            return 3
+        return 2
+
+    """
+    process(self, frame)
+    response : answer bytes (without CRC) or None, programming time in us
+    """
+    def process(self, frame):
+        flags = frame[0]
+        cmd = frame[1]
+        params = list(frame[self.uidOffset(frame):])
+        if flags & FLAG_ADDRESS:
+            params = params[8:]
+        handler = self.HANDLERS.get(cmd)
+        if handler is None:
+            return [0x01, ERROR_NOT_SUPPORTED], 0
+        try:
+            return handler(self, flags, params)
+        except IndexError:
+            return [0x01, ERROR_NOT_RECOGNISED], 0
+
+    def _stayQuiet(self, flags, params):
+        self.state = "QUIET"
+        return None, 0
+
+    def _readBlocks(self, flags, first, count):
+        if first + count > self.numBlocks:
+            return [0x01, ERROR_BLOCK_NOT_AVAILABLE], 0
+        response = [0x00]
+        for blockNumber in range(first, first + count):
+            if flags & FLAG_OPTION:
+                response.append(1 if blockNumber in self.lockedBlocks else 0)
+            response.extend(self.block(blockNumber))
+        return response, 0
+
+    def _writeBlocks(self, first, count, data):
+        if first + count > self.numBlocks or len(data) < count * self.blockSize:
+            return [0x01, ERROR_BLOCK_NOT_AVAILABLE], 0
+        for blockNumber in range(first, first + count):
+            if blockNumber in self.lockedBlocks:
+                return [0x01, ERROR_LOCKED], 0
+        offset = first * self.blockSize
+        self.memory[offset:offset + count*self.blockSize] = bytearray(data[:count*self.blockSize])
+        return [0x00], self.writeTime * count
+
+    def _readSingleBlock(self, flags, params):
+        return self._readBlocks(flags, params[0], 1)
+
+    def _writeSingleBlock(self, flags, params):
+        return self._writeBlocks(params[0], 1, params[1:])
+
+    def _lockBlock(self, flags, params):
+        if params[0] >= self.numBlocks:
+            return [0x01, ERROR_BLOCK_NOT_AVAILABLE], 0
+        if params[0] in self.lockedBlocks:
+            return [0x01, ERROR_ALREADY_LOCKED], 0
+        self.lockedBlocks.add(params[0])
+        return [0x00], self.writeTime
+
+    def _readMultipleBlock(self, flags, params):
+        if not self.supportsMultipleBlocks:
+            return [0x01, ERROR_NOT_SUPPORTED], 0
+        count = params[1] + 1
+        if self.maxBlocksPerRead is not None and count > self.maxBlocksPerRead:
+            return [0x01, ERROR_UNKNOWN], 0
+        return self._readBlocks(flags, params[0], count)
+
+    def _writeMultipleBlock(self, flags, params):
+        if not self.supportsMultipleBlocks:
+            return [0x01, ERROR_NOT_SUPPORTED], 0
+        return self._writeBlocks(params[0], params[1] + 1, params[2:])
+
+    def _select(self, flags, params):
+        self.state = "SELECTED"
+        return [0x00], 0
+
+    def _resetToReady(self, flags, params):
+        self.state = "READY"
+        return [0x00], 0
+
+    def _writeAfi(self, flags, params):
+        if self.afiLocked:
+            return [0x01, ERROR_LOCKED], 0
+        self.afi = params[0]
+        return [0x00], self.writeTime
+
+    def _lockAfi(self, flags, params):
+        if self.afiLocked:
+            return [0x01, ERROR_ALREADY_LOCKED], 0
+        self.afiLocked = True
+        return [0x00], self.writeTime
+
+    def _writeDsfid(self, flags, params):
+        if self.dsfidLocked:
+            return [0x01, ERROR_LOCKED], 0
+        self.dsfid = params[0]
+        return [0x00], self.writeTime
+
+    def _lockDsfid(self, flags, params):
+        if self.dsfidLocked:
+            return [0x01, ERROR_ALREADY_LOCKED], 0
+        self.dsfidLocked = True
+        return [0x00], self.writeTime
+
+    def _getSystemInformation(self, flags, params):
+        # Info flags: DSFID, AFI, memory size and IC reference present
+        response = [0x00, 0x0F]
+        response.extend(self.uid)
+        response.extend([self.dsfid, self.afi, self.numBlocks - 1, (self.blockSize - 1) & 0x1F, self.icReference])
+        return response, 0
+
+    def _getMultipleBlockSecurityStatus(self, flags, params):
+        first = params[0]
+        count = params[1] + 1
+        if first + count > self.numBlocks:
+            return [0x01, ERROR_BLOCK_NOT_AVAILABLE], 0
+        response = [0x00]
+        for blockNumber in range(first, first + count):
+            response.append(1 if blockNumber in self.lockedBlocks else 0)
+        return response, 0
+
+    HANDLERS = {
+        0x02: _stayQuiet,
+        0x20: _readSingleBlock,
+        0x21: _writeSingleBlock,
+        0x22: _lockBlock,
+        0x23: _readMultipleBlock,
+        0x24: _writeMultipleBlock,
+        0x25: _select,
+        0x26: _resetToReady,
+        0x27: _writeAfi,
+        0x28: _lockAfi,
+        0x29: _writeDsfid,
+        0x2A: _lockDsfid,
+        0x2B: _getSystemInformation,
+        0x2C: _getMultipleBlockSecurityStatus,
+    }
+
+
+"""
+Simulated BUSY line of the PN5180Simulator
+"""
+class _simulatorBusyPin(object):
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def read(self):
+        return pypn5180hal._timer() < self.simulator.busyUntil
+
+
+"""
+Simulated IRQ line of the PN5180Simulator: high while an enabled IRQ_STATUS bit is set
+"""
+class _simulatorIrqPin(object):
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def read(self):
+        simulator = self.simulator
+        simulator._update()
+        irqStatus = simulator.registers[simulator.REG_ADDR['IRQ_STATUS']]
+        return bool(irqStatus & simulator.registers[simulator.REG_ADDR['IRQ_ENABLE']])
+
+    def wait(self, timeout=None):
+        simulator = self.simulator
+        deadline = None if timeout is None else simulator._now() + timeout / 1000000.0
+        with simulator.condition:
+            # Sleep until the next simulated event or a change of the tags in the field
+            while not self.read():
+                delays = []
+                eventDelay = simulator._nextEventDelay()
+                if eventDelay is not None:
+                    delays.append(eventDelay)
+                if deadline is not None:
+                    remaining = deadline - simulator._now()
+                    if remaining <= 0:
+                        return False
+                    delays.append(remaining)
+                simulator.condition.wait(min(delays) if delays else None)
+        return True
+
+
+"""
+PN5180 chip simulator, SPI device object usable as _spi backend.
+tags      : initial list of VirtualTag15693 in the field
+timeScale : 1.0 for real time RF and BUSY timings, 0 for instantaneous answers
+maxSpeed  : Hz, SPI clock above which answers are read one bit late (cabling
+            limit), None for no limit
+lpcdClockError : relative error of the LPCD wake-up counter (low-frequency
+            oscillator), 0.1: field measurements 10% after the programmed period
+"""
+class PN5180Simulator(object):
+
+    CMD = PN5180_HIL.CMD
+    REG_ADDR = PN5180_HIL.REG_ADDR
+    IRQ_STATUS = PN5180_HIL.IRQ_STATUS
+    SYSTEM_CONFIG = PN5180_HIL.SYSTEM_CONFIG
+
+    REG_TX_CONFIG = 0x18
+    REG_RX_STATUS = 0x13
+    REG_RF_STATUS = 0x1D
+
+    # Chip processing time per instruction (us)
+    BUSY_TIME = {
+        0x06: 5000,   # WRITE_EEPROM
+        0x07: 40,     # READ_EEPROM
+        0x11: 1000,   # LOAD_RF_CONFIG
+        0x12: 5000,   # UPDATE_RF_CONFIG
+        0x16: 500,    # RF_ON
+    }
+    DEFAULT_BUSY_TIME = 10
+
+    # Representative register values loaded by LOAD_RF_CONFIG
+    RF_CONFIG = {
+        0x0D: [(0x14, 0x00000000), (0x15, 0x00000000), (0x16, 0x00000000), (0x17, 0x00000E05),
+               (0x18, 0x000007C8), (0x19, 0x00000079), (0x21, 0x0000008C)],
+        0x0E: [(0x14, 0x00000000), (0x15, 0x00000000), (0x16, 0x00000000), (0x17, 0x00000E05),
+               (0x18, 0x000007C8), (0x19, 0x00000079), (0x21, 0x00000084)],
+        0x8D: [(0x11, 0x0000B3C4), (0x12, 0x00000079), (0x1A, 0x0000004D), (0x1B, 0x00001E1C),
+               (0x1C, 0x00000000), (0x1E, 0x00000000), (0x22, 0x00000008)],
+        0x8E: [(0x11, 0x000059E2), (0x12, 0x00000079), (0x1A, 0x0000004E), (0x1B, 0x00001E1C),
+               (0x1C, 0x00000000), (0x1E, 0x00000000), (0x22, 0x00000008)],
+    }
+
+    url = "simulator"
+
+    def __init__(self, tags=None, timeScale=1.0, dieIdentifier=None,
+                 productVersion=0x0304, firmwareVersion=0x0304, eepromVersion=0x0306, maxSpeed=None,
+                 lpcdClockError=0.0):
+        self.tags = list(tags) if tags is not None else []
+        self.timeScale = timeScale
+        self.busyUntil = 0.0
+        self.busyPin = _simulatorBusyPin(self)
+        self.irqPin = _simulatorIrqPin(self)
+        # Notified when tags enter or leave the field, see _simulatorIrqPin.wait
+        self.condition = threading.Condition()
+        self.instructionCount = 0
+        self.lpcdMeasurements = 0
+        self.lpcdClockError = lpcdClockError
+        self.maxSpeed = maxSpeed
+        self.speed = None
+
+        self.eeprom = bytearray(256)
+        if dieIdentifier is None:
+            dieIdentifier = range(0x50, 0x60)
+        self.eeprom[0x00:0x10] = bytearray(dieIdentifier)
+        self.eeprom[0x10:0x12] = struct.pack("<H", productVersion)
+        self.eeprom[0x12:0x14] = struct.pack("<H", firmwareVersion)
+        self.eeprom[0x14:0x16] = struct.pack("<H", eepromVersion)
+        self.rfConfigTable = dict((cfg, list(regs)) for cfg, regs in self.RF_CONFIG.items())
+
+        self.rfOn = False
+        self._response = None
+        self._reset()
+
+    def _reset(self):
+        self.registers = dict((addr, 0) for addr in PN5180_HIL.REGISTER_NAME)
+        self.rfConfig = [None, None]
+        self.txBuffer = []
+        self.rxBuffer = bytearray()
+        self.transceiveState = 0
+        self._rxEvents = []
+        self._inventorySlots = None
+        self._eofResponders = None
+        self._requestFlags = 0
+        self.mode = "NORMAL"
+        self._lpcdForced = False
+
+    def _now(self):
+        return pypn5180hal._timer()
+
+    def _after(self, us):
+        return self._now() + us * self.timeScale / 1000000.0
+
+    """
+    addTag(self, tag) / removeTag(self, tag)
+    Move a virtual tag into or out of the RF field
+    """
+    def addTag(self, tag):
+        with self.condition:
+            if self.rfOn:
+                tag.powerUp()
+            self.tags.append(tag)
+            self.condition.notify_all()
+
+    def removeTag(self, tag):
+        with self.condition:
+            self.tags.remove(tag)
+            self.condition.notify_all()
+
+    """
+    lpcdWake(self)
+    Antenna load change without tag (metal object, hand...): the next LPCD
+    field measurement detects a card
+    """
+    def lpcdWake(self):
+        with self.condition:
+            self._lpcdForced = True
+            self.condition.notify_all()
+
+    """
+    setSpeed(self, speed)
+    SPI clock set by the host, see maxSpeed
+    """
+    def setSpeed(self, speed):
+        self.speed = speed
+
+    """
+    xfer(self, data)
+    SPI exchange. Frames following an instruction with an answer clock out that answer.
+    """
+    def xfer(self, data):
+        data = list(bytearray(data))
+        self._update()
+        if self._response is not None:
+            response = self._response
+            self._response = None
+            response = response[:len(data)] + [0] * (len(data) - len(response))
+            if self.maxSpeed is not None and self.speed is not None and self.speed > self.maxSpeed:
+                # MISO sampled one bit late
+                response = [(value >> 1) | 0x80 for value in response]
+            return response
+
+        self.instructionCount += 1
+        # Host interface access wakes the chip up from standby and LPCD
+        self.mode = "NORMAL"
+        answer = self._execute(data[0], data[1:])
+        if answer is not None:
+            self._response = list(bytearray(answer))
+        busyTime = self.BUSY_TIME.get(data[0], self.DEFAULT_BUSY_TIME)
+        self.busyUntil = self._after(busyTime)
+        return [0xFF] * len(data)
+
+    def _execute(self, cmd, params):
+        if cmd == self.CMD['WRITE_REGISTER']:
+            self._writeRegister(params[0], self._toInt32(params[1:5]))
+        elif cmd == self.CMD['WRITE_REGISTER_OR_MASK']:
+            self._writeRegister(params[0], self._readRegister(params[0]) | self._toInt32(params[1:5]))
+        elif cmd == self.CMD['WRITE_REGISTER_AND_MASK']:
+            self._writeRegister(params[0], self._readRegister(params[0]) & self._toInt32(params[1:5]))
+        elif cmd == self.CMD['WRITE_REGISTER_MULTIPLE']:
+            for k in range(0, len(params) - 5, 6):
+                address, action, value = params[k], params[k+1], self._toInt32(params[k+2:k+6])
+                if action == 0x02:
+                    value |= self._readRegister(address)
+                elif action == 0x03:
+                    value &= self._readRegister(address)
+                self._writeRegister(address, value)
+        elif cmd == self.CMD['READ_REGISTER']:
+            return struct.pack("<I", self._readRegister(params[0]))
+        elif cmd == self.CMD['READ_REGISTER_MULTIPLE']:
+            return b"".join(struct.pack("<I", self._readRegister(address)) for address in params)
+        elif cmd == self.CMD['WRITE_EEPROM']:
+            self.eeprom[params[0]:params[0]+len(params)-1] = bytearray(params[1:])
+        elif cmd == self.CMD['READ_EEPROM']:
+            return self.eeprom[params[0]:params[0]+params[1]]
+        elif cmd == self.CMD['WRITE_TX_DATA']:
+            self.txBuffer = params
+        elif cmd == self.CMD['SEND_DATA']:
+            self.txBuffer = params[1:]
+            self._startSend()
+        elif cmd == self.CMD['READ_DATA']:
+            return self.rxBuffer
+        elif cmd == self.CMD['LOAD_RF_CONFIG']:
+            self._loadRfConfig(params[0], params[1])
+        elif cmd == self.CMD['UPDATE_RF_CONFIG']:
+            for k in range(0, len(params) - 5, 6):
+                self._updateRfConfig(params[k], params[k+1], self._toInt32(params[k+2:k+6]))
+        elif cmd == self.CMD['RETRIEVE_RF_CONFIG_SIZE']:
+            return [len(self.rfConfigTable.get(params[0], []))]
+        elif cmd == self.CMD['RETRIEVE_RF_CONFIG']:
+            return b"".join(struct.pack("<BI", address, value)
+                            for address, value in self.rfConfigTable.get(params[0], []))
+        elif cmd == self.CMD['RF_ON']:
+            self.rfOn = True
+            for tag in self.tags:
+                tag.powerUp()
+        elif cmd == self.CMD['RF_OFF']:
+            self.rfOn = False
+        elif cmd == self.CMD['SWITCH_MODE']:
+            self._switchMode(params)
+        return None
+
+    def _switchMode(self, params):
+        if params[0] == PN5180_HIL.SWITCH_MODE['LPCD']:
+            # The chip drives the field itself for LPCD measurements
+            self.rfOn = False
+            self.mode = "LPCD"
+            self._lpcdPeriod = struct.unpack("<H", bytes(bytearray(params[1:3])))[0] * 1000 * (1 + self.lpcdClockError)
+            self._lpcdReference = self._lpcdLoad()
+            self._lpcdNext = self._after(self._lpcdPeriod)
+        elif params[0] == PN5180_HIL.SWITCH_MODE['STANDBY']:
+            self.rfOn = False
+            self.mode = "STANDBY"
+            self._standbyWakeup = params[1]
+            self._standbyEnd = self._after(struct.unpack("<H", bytes(bytearray(params[2:4])))[0] * 1000)
+
+    def _lpcdLoad(self):
+        return frozenset(id(tag) for tag in self.tags)
+
+    def _updateMode(self):
+        now = self._now()
+        if self.mode == "STANDBY":
+            if self._standbyWakeup & PN5180_HIL.STANDBY_WAKEUP['COUNTER'] and now >= self._standbyEnd:
+                self.mode = "NORMAL"
+        elif self.mode == "LPCD" and now >= self._lpcdNext:
+            self.lpcdMeasurements += 1
+            if self._lpcdForced or self._lpcdLoad() != self._lpcdReference:
+                self._lpcdForced = False
+                self.registers[self.REG_ADDR['IRQ_STATUS']] |= self.IRQ_STATUS['LPCD_IRQ']
+                self.mode = "NORMAL"
+            else:
+                self._lpcdNext = now + self._lpcdPeriod * self.timeScale / 1000000.0
+
+    def _nextEventDelay(self):
+        # Seconds until the next simulated event changing IRQ_STATUS, None when
+        # only a change of the tags in the field can change it
+        now = self._now()
+        if self.mode == "LPCD":
+            if self._lpcdForced or self._lpcdLoad() != self._lpcdReference:
+                return max(self._lpcdNext - now, 0)
+            return None
+        if self._rxEvents:
+            return max(min(event[0] for event in self._rxEvents) - now, 0)
+        return None
+
+    def _toInt32(self, byte_list):
+        return struct.unpack("<I", bytes(bytearray(byte_list)))[0]
+
+    def _readRegister(self, address):
+        if address == self.REG_ADDR['IRQ_CLEAR']:
+            return 0
+        if address == self.REG_RF_STATUS:
+            return (self.registers[address] & 0xF8FFFFFF) | (self.transceiveState << 24)
+        return self.registers.get(address, 0)
+
+    def _writeRegister(self, address, value):
+        if address == self.REG_ADDR['IRQ_CLEAR']:
+            self.registers[self.REG_ADDR['IRQ_STATUS']] &= ~value & 0xFFFFFFFF
+            return
+        if address in (self.REG_ADDR['IRQ_STATUS'], self.REG_RX_STATUS, self.REG_RF_STATUS):
+            return
+        if address != self.REG_ADDR['SYSTEM_CONFIG']:
+            self.registers[address] = value
+            return
+
+        previous = self.registers[address]
+        if value & self.SYSTEM_CONFIG['RESET_SET'] and not previous & self.SYSTEM_CONFIG['RESET_SET']:
+            self._reset()
+        command = value & 0x7
+        if command != previous & 0x7 or command == 0:
+            self._rxEvents = []
+            self.transceiveState = 1 if command == self.SYSTEM_CONFIG['COMMAND_TRANSCEIVE_SET'] else 0
+        # START_SEND is cleared by the chip once the transmission started
+        self.registers[address] = value & self.SYSTEM_CONFIG['START_SEND_CLR']
+        if value & self.SYSTEM_CONFIG['START_SEND_SET']:
+            self._startSend()
+
+    def _loadRfConfig(self, txCfg, rxCfg):
+        for index, cfg in enumerate((txCfg, rxCfg)):
+            if cfg == 0xFF or cfg not in self.rfConfigTable:
+                continue
+            self.rfConfig[index] = cfg
+            for address, value in self.rfConfigTable[cfg]:
+                self.registers[address] = value
+
+    def _updateRfConfig(self, cfg, address, value):
+        regs = self.rfConfigTable.setdefault(cfg, [])
+        for k, (regAddress, regValue) in enumerate(regs):
+            if regAddress == address:
+                regs[k] = (address, value)
+                return
+        regs.append((address, value))
+
+    """
+    RF transmission and virtual tag answers
+    """
+    def _startSend(self):
+        if self.transceiveState != 1:
+            return
+        frame = list(self.txBuffer)
+        eofOnly = not frame or not self.registers[self.REG_TX_CONFIG] & TX_DATA_ENABLE
+        if eofOnly:
+            txTime = VCD_SOF_EOF_TIME / 2
+            responders, writeTime = self._processEof()
+        else:
+            txTime = VCD_SOF_EOF_TIME + (len(frame) + 2) * VCD_BYTE_TIME
+            responders, writeTime = self._processFrame(frame)
+
+        txEnd = self._after(txTime)
+        self.transceiveState = 3
+        self._rxEvents = [(txEnd, self.IRQ_STATUS['TX_IRQ'], None)]
+        self.registers[self.REG_RX_STATUS] = 0
+        if not responders:
+            return
+        requestFlags = self._requestFlags
+        sof = txEnd + (VICC_T1 + writeTime) * self.timeScale / 1000000.0
+        rxData, rxStatus = self._receive(responders, requestFlags)
+        rxTime = VICC_SOF_EOF_TIME + (len(rxData) + 2) * 8 * self._bitTime(requestFlags)
+        rxEnd = sof + rxTime * self.timeScale / 1000000.0
+        self._rxEvents.append((sof, self.IRQ_STATUS['RX_SOF_DET_IRQ'], None))
+        self._rxEvents.append((rxEnd, self.IRQ_STATUS['RX_IRQ'], (rxData, rxStatus)))
+
+    def _bitTime(self, requestFlags):
+        if not requestFlags & FLAG_DATA_RATE:
+            return VICC_LOW_RATE_BIT_TIME
+        return VICC_BIT_TIME.get(self.rfConfig[1], VICC_BIT_TIME[0x8D])
+
+    def _receive(self, responders, requestFlags):
+        answers = [answer for tag, answer in responders]
+        rxData = bytearray(max(len(answer) for answer in answers))
+        for answer in answers:
+            for k, value in enumerate(answer):
+                rxData[k] |= value
+        rxStatus = 0
+        if len(answers) > 1:
+            rxStatus |= RX_COLLISION_DETECTED | RX_DATA_INTEGRITY_ERROR
+        decodable = requestFlags & FLAG_DATA_RATE
+        for tag, answer in responders:
+            if self.rfConfig[1] not in tag.rxConfigs:
+                decodable = False
+        if not decodable:
+            rxStatus |= RX_DATA_INTEGRITY_ERROR
+        return rxData, rxStatus | len(rxData)
+
+    def _fieldTags(self):
+        if not self.rfOn:
+            return []
+        return self.tags
+
+    def _processFrame(self, frame):
+        self._inventorySlots = None
+        self._eofResponders = None
+        if len(frame) < 2:
+            return [], 0
+        flags = frame[0]
+        self._requestFlags = flags
+        if flags & FLAG_INVENTORY:
+            if frame[1] != 0x01:
+                return [], 0
+            return self._inventory(frame), 0
+
+        responders = []
+        writeTime = 0
+        for tag in self._fieldTags():
+            if not tag.isAddressed(frame):
+                continue
+            if frame[1] == 0x25:
+                # Select: other selected tags go back to ready state
+                for other in self._fieldTags():
+                    if other.state == "SELECTED":
+                        other.state = "READY"
+            answer, tagWriteTime = tag.process(frame)
+            if answer is not None:
+                responders.append((tag, answer))
+                writeTime = max(writeTime, tagWriteTime)
+
+        # With option flag, writes are answered on the next EOF
+        if flags & FLAG_OPTION and frame[1] in (0x21, 0x22, 0x24, 0x27, 0x28, 0x29, 0x2A):
+            self._eofResponders = responders
+            return [], 0
+        return responders, writeTime
+
+    def _processEof(self):
+        if self._eofResponders is not None:
+            responders = self._eofResponders
+            self._eofResponders = None
+            return responders, 0
+        if self._inventorySlots is not None:
+            self._inventorySlot += 1
+            if self._inventorySlot >= len(self._inventorySlots):
+                self._inventorySlots = None
+                return [], 0
+            return self._inventorySlots[self._inventorySlot], 0
+        return [], 0
+
+    def _inventory(self, frame):
+        flags = frame[0]
+        offset = 2
+        afi = None
+        if flags & FLAG_AFI:
+            afi = frame[offset]
+            offset += 1
+        maskLength = frame[offset]
+        maskBytes = frame[offset+1:offset+1+(maskLength+7)//8]
+        mask = 0
+        for k, value in enumerate(maskBytes):
+            mask |= value << (8*k)
+        mask &= (1 << maskLength) - 1
+
+        nbSlots = 1 if flags & FLAG_NB_SLOTS else 16
+        slots = [[] for k in range(nbSlots)]
+        for tag in self._fieldTags():
+            if tag.state == "QUIET":
+                continue
+            if afi is not None and afi != 0 and tag.afi != afi:
+                continue
+            uid = tag.uidValue()
+            if uid & ((1 << maskLength) - 1) != mask:
+                continue
+            slot = 0 if nbSlots == 1 else (uid >> maskLength) & 0xF
+            slots[slot].append((tag, [0x00, tag.dsfid] + tag.uid))
+        self._inventorySlots = slots
+        self._inventorySlot = 0
+        return slots[0]
+
+    def _update(self):
+        if self.mode != "NORMAL":
+            self._updateMode()
+        now = self._now()
+        pending = []
+        for eventTime, irq, rx in self._rxEvents:
+            if eventTime > now:
+                pending.append((eventTime, irq, rx))
+                continue
+            self.registers[self.REG_ADDR['IRQ_STATUS']] |= irq
+            if irq == self.IRQ_STATUS['TX_IRQ']:
+                self.transceiveState = 3
+            elif irq == self.IRQ_STATUS['RX_SOF_DET_IRQ']:
+                self.transceiveState = 5
+            if rx is not None:
+                self.rxBuffer, self.registers[self.REG_RX_STATUS] = rx
+                self.transceiveState = 1
+        self._rxEvents = pending
@@ -0,0 +1,173 @@
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from .iso_iec_15693 import iso_iec_15693
+
+"""
+Pool of PN5180 readers driven concurrently.
+Each reader owns a worker thread: SPI transfers of different readers overlap
+(USB and spidev I/O release the GIL).
+
+Reader addresses:
+    ftdi://...        pyftdi URL, ex: ftdi://ftdi:2232h:FT1234/1
+    spidev:<bus>.<device>
+    any other name, with explicit options (ex: backend=PN5180Simulator())
+"""
+
+
+"""
+discoverFtdi()
+response : pyftdi URLs of all interfaces of the connected FTDI devices
+"""
+def discoverFtdi():
+    try:
+        from pyftdi.ftdi import Ftdi
+    except ImportError:
+        return []
+    urls = []
+    for descriptor, interfaces in Ftdi.list_devices():
+        if descriptor.sn:
+            device = "0x%04x:0x%04x:%s" %(descriptor.vid, descriptor.pid, descriptor.sn)
+        else:
+            device = "0x%04x:0x%04x:%x:%x" %(descriptor.vid, descriptor.pid, descriptor.bus, descriptor.address)
+        for interface in range(1, interfaces + 1):
+            urls.append("ftdi://%s/%d" %(device, interface))
+    return urls
+
+
+"""
+discoverSpidev()
+response : 'spidev:<bus>.<device>' addresses of the spidev devices
+"""
+def discoverSpidev():
+    addresses = []
+    for path in sorted(glob.glob("/dev/spidev*.*")):
+        addresses.append("spidev:" + path[len("/dev/spidev"):])
+    return addresses
+
+
+"""
+readerOptions(address)
+response : iso_iec_15693 connection options of a reader address
+"""
+def readerOptions(address):
+    if address.startswith("ftdi://"):
+        return {'ftdi_port': address, 'backend': "FTDI"}
+    if address.startswith("spidev:"):
+        bus, device = address[len("spidev:"):].split(".")
+        return {'bus': int(bus), 'device': int(device), 'backend': "RASPI"}
+    return {}
+
+
+class _reader(object):
+
+    def __init__(self, address, options):
+        self.address = address
+        self.options = options
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.isoIec15693 = None
+        self.connected = self.executor.submit(self._connect)
+
+    def _connect(self):
+        self.isoIec15693 = iso_iec_15693(**self.options)
+        return self.isoIec15693
+
+    def _call(self, function, args, kwargs):
+        # Connection error of the reader (IOError)
+        self.connected.result()
+        if isinstance(function, str):
+            return getattr(self.isoIec15693, function)(*args, **kwargs)
+        return function(self.isoIec15693, *args, **kwargs)
+
+    def submit(self, function, args, kwargs):
+        return self.executor.submit(self._call, function, args, kwargs)
+
+    def close(self):
+        if self.isoIec15693 is not None:
+            self.executor.submit(self.isoIec15693.disconnect).result()
+        self.executor.shutdown()
+
+
+"""
+ReaderPool(addresses=None, **options)
+addresses : reader addresses, default: all discovered FTDI interfaces and spidev devices
+options   : iso_iec_15693 options common to all readers (busy, shadow...)
+
+    with ReaderPool() as pool:
+        results = pool.runAll('readSingleBlockCmd', 5)
+"""
+class ReaderPool(object):
+
+    def __init__(self, addresses=None, **options):
+        self.options = options
+        self.readers = {}
+        if addresses is None:
+            addresses = discoverFtdi() + discoverSpidev()
+        for address in addresses:
+            self.addReader(address)
+
+    """
+    addReader(self, address, **options)
+    Connect a reader on its own worker thread. options override readerOptions(address)
+    """
+    def addReader(self, address, **options):
+        readerOpts = dict(self.options)
+        readerOpts.update(readerOptions(address))
+        readerOpts.update(options)
+        self.readers[address] = _reader(address, readerOpts)
+
+    def removeReader(self, address):
+        self.readers.pop(address).close()
+
+    def addresses(self):
+        return list(self.readers)
+
+    """
+    wait(self)
+    Wait until all readers are connected
+    response : dict address -> exception of the readers which failed to connect
+    """
+    def wait(self):
+        errors = {}
+        for address, reader in self.readers.items():
+            try:
+                reader.connected.result()
+            except Exception as exc:
+                errors[address] = exc
+        return errors
+
+    """
+    run(self, address, function, *args, **kwargs)
+    Queue an operation on one reader
+    function : iso_iec_15693 method name, or callable(isoIec15693, *args, **kwargs)
+    response : concurrent.futures.Future
+    """
+    def run(self, address, function, *args, **kwargs):
+        return self.readers[address].submit(function, args, kwargs)
+
+    """
+    runAll(self, function, *args, **kwargs)
+    Run the same operation on all readers and gather the results
+    response : dict address -> result, or the raised exception
+    """
+    def runAll(self, function, *args, **kwargs):
+        futures = dict((address, reader.submit(function, args, kwargs))
+                       for address, reader in self.readers.items())
+        results = {}
+        for address, future in futures.items():
+            try:
+                results[address] = future.result()
+            except Exception as exc:
+                results[address] = exc
+        return results
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers = {}
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -0,0 +1,114 @@
+import time
+from .pypn5180hal import PN5180_HIL
+
+"""
+Decoded PN5180 register snapshots, see PN5180.snapshotRegisters
+"""
+
+
+def _irqFlags(value):
+    return [name for name, bit in sorted(PN5180_HIL.IRQ_STATUS.items(), key=lambda item: item[1])
+            if name != 'ALL' and value & bit]
+
+
+def _decodeRxStatus(value):
+    fields = {'NUM_BYTES_RECEIVED': value & PN5180_HIL.RX_STATUS['NUM_BYTES_RECEIVED']}
+    for name, bit in PN5180_HIL.RX_STATUS.items():
+        if name != 'NUM_BYTES_RECEIVED':
+            fields[name] = bool(value & bit)
+    return fields
+
+
+def _decodeRfStatus(value):
+    return {'TRANSCEIVE_STATE': PN5180_HIL.RF_STATUS_TRANSCEIVE_STATE[(value >> 24) & 0x7]}
+
+
+def _decodeSystemConfig(value):
+    command = value & ~PN5180_HIL.SYSTEM_CONFIG['COMMAND_CLR']
+    commandName = "%#x" %command
+    for name, setValue in PN5180_HIL.SYSTEM_CONFIG.items():
+        if name.startswith('COMMAND_') and name.endswith('_SET') and setValue == command:
+            commandName = name[len('COMMAND_'):-len('_SET')]
+    return {'COMMAND': commandName,
+            'START_SEND': bool(value & PN5180_HIL.SYSTEM_CONFIG['START_SEND_SET']),
+            'RESET': bool(value & PN5180_HIL.SYSTEM_CONFIG['RESET_SET'])}
+
+
+"""
+RegisterSnapshot(values, timestamp=None)
+values    : dict register address -> 32-bit value
+timestamp : time.time() of the capture, default: now
+"""
+class RegisterSnapshot(object):
+
+    # Bitfield decoders of the registers with known fields
+    DECODERS = {
+        'SYSTEM_CONFIG': _decodeSystemConfig,
+        'IRQ_ENABLE': lambda value: {'IRQ': _irqFlags(value)},
+        'IRQ_STATUS': lambda value: {'IRQ': _irqFlags(value)},
+        'RX_STATUS': _decodeRxStatus,
+        'RF_STATUS': _decodeRfStatus,
+    }
+
+    REGISTER_ADDR = dict((name, address) for address, name in PN5180_HIL.REGISTER_NAME.items())
+
+    def __init__(self, values, timestamp=None):
+        self.values = dict(values)
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    """
+    snapshot[address] or snapshot[name]
+    response : register value
+    """
+    def __getitem__(self, key):
+        if key in self.REGISTER_ADDR:
+            key = self.REGISTER_ADDR[key]
+        return self.values[key]
+
+    """
+    decode(self, address)
+    response : dict of the register bitfields, {} when not known
+    """
+    def decode(self, address):
+        decoder = self.DECODERS.get(PN5180_HIL.REGISTER_NAME.get(address))
+        if decoder is None:
+            return {}
+        return decoder(self.values[address])
+
+    """
+    toDict(self)
+    response : {name: {'address':, 'value':, 'fields':}}, JSON serialisable
+    """
+    def toDict(self):
+        return dict((PN5180_HIL.REGISTER_NAME.get(address, "%#x" %address),
+                     {'address': address, 'value': value, 'fields': self.decode(address)})
+                    for address, value in self.values.items())
+
+    """
+    diff(self, other)
+    Registers changed from this snapshot to other
+    response : list of (name, address, value, other value, {field: (value, other value)})
+    """
+    def diff(self, other):
+        changes = []
+        for address in sorted(self.values):
+            if address not in other.values or self.values[address] == other.values[address]:
+                continue
+            fields = self.decode(address)
+            otherFields = other.decode(address)
+            changedFields = dict((name, (fields[name], otherFields[name])) for name in fields
+                                 if fields[name] != otherFields[name])
+            changes.append((PN5180_HIL.REGISTER_NAME.get(address, "%#x" %address), address,
+                            self.values[address], other.values[address], changedFields))
+        return changes
+
+    def __str__(self):
+        lines = []
+        for address in sorted(self.values):
+            value = self.values[address]
+            line = "%s %#x = %#x (%r)" %(PN5180_HIL.REGISTER_NAME.get(address, "?"), address, value, bin(value))
+            fields = self.decode(address)
+            if fields:
+                line += " %r" %fields
+            lines.append(line)
+        return "\n".join(lines)
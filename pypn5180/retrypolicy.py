@@ -0,0 +1,157 @@
+import contextlib
+from .pypn5180hal import PN5180_HIL
+
+"""
+Retry and abort policy of ISO IEC 15693 requests, see iso_iec_15693(retryPolicy=...).
+A missing tag is detected when the answer does not start (RX_SOF_DET_IRQ) within
+the ISO IEC 15693 response time, instead of waiting for the whole answer timeout.
+"""
+
+
+"""
+TagLostError
+Raised inside an operation (see RetryPolicy.operation) after maxMisses
+consecutive requests without answer
+"""
+class TagLostError(IOError):
+    pass
+
+
+"""
+RetryPolicy(maxRetries=1, maxMisses=3, sofMargin=500, retryOn=None)
+maxRetries : attempts after the first one for the error classes of retryOn
+maxMisses  : consecutive requests without answer aborting an operation, None never
+sofMargin  : us, added to the ISO IEC 15693 answer start time: host polling latency
+retryOn    : error classes retried, default RETRY_ON
+"""
+class RetryPolicy(object):
+
+    # Error classes of a request result, see classify
+    OK = "OK"
+    NO_ANSWER = "NO_ANSWER"
+    TIMEOUT = "TIMEOUT"
+    COLLISION = "COLLISION"
+    CRC = "CRC"
+    PROTOCOL = "PROTOCOL"
+    TAG_ERROR = "TAG_ERROR"
+
+    # Transmission errors: the same request may succeed at the next attempt.
+    # TAG_ERROR answers (error flag set by the tag) are not retried
+    RETRY_ON = (NO_ANSWER, TIMEOUT, COLLISION, CRC, PROTOCOL)
+
+    # ISO IEC 15693-3 answer timing (us): latest answer start after the
+    # request EOF (t1 max = 4384/fc), answer SOF (and EOF) and bit at high
+    # (26.48 kbps) and low (6.62 kbps) data rate
+    T1_MAX = 323.3
+    SOF_TIME_HIGH_RATE = 151.04
+    SOF_TIME_LOW_RATE = 604.16
+    BIT_TIME_HIGH_RATE = 37.76
+    BIT_TIME_LOW_RATE = 151.04
+
+    # DATA_RATE request flag
+    DATA_RATE = 0x02
+
+    def __init__(self, maxRetries=1, maxMisses=3, sofMargin=500, retryOn=None):
+        self.maxRetries = maxRetries
+        self.maxMisses = maxMisses
+        self.sofMargin = sofMargin
+        self.retryOn = self.RETRY_ON if retryOn is None else retryOn
+        self.misses = 0
+        self._operations = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {'requests': 0, 'retries': 0, 'aborts': 0,
+                      'errors': dict((name, 0) for name in (self.NO_ANSWER, self.TIMEOUT, self.COLLISION,
+                                                            self.CRC, self.PROTOCOL, self.TAG_ERROR))}
+
+    """
+    answerStartTimeout(self, requestFlags, answerDelay=0)
+    Maximum wait for the answer SOF after the end of the request
+    answerDelay : us, tag processing time before answering (writes without option flag)
+    response : us
+    """
+    def answerStartTimeout(self, requestFlags, answerDelay=0):
+        sofTime = self.SOF_TIME_HIGH_RATE if requestFlags & self.DATA_RATE else self.SOF_TIME_LOW_RATE
+        return self.T1_MAX + sofTime + answerDelay + self.sofMargin
+
+    """
+    answerTimeout(self, requestFlags, answerLength)
+    Maximum duration of an answer, from the end of the request to its EOF
+    answerLength : answer bytes, flags included, CRC excluded
+    response : us
+    """
+    def answerTimeout(self, requestFlags, answerLength):
+        if requestFlags & self.DATA_RATE:
+            sofTime, bitTime = self.SOF_TIME_HIGH_RATE, self.BIT_TIME_HIGH_RATE
+        else:
+            sofTime, bitTime = self.SOF_TIME_LOW_RATE, self.BIT_TIME_LOW_RATE
+        return self.T1_MAX + 2 * sofTime + (answerLength + 2) * 8 * bitTime + self.sofMargin
+
+    """
+    classify(self, flags, rxStatus, irqStatus=0)
+    flags     : answer flags byte, 0xFF without answer (PN5180.transactionIsoIec15693)
+    rxStatus  : RX_STATUS of the answer (PN5180.lastRxStatus)
+    irqStatus : final IRQ_STATUS of the transaction (PN5180.lastIrqStatus)
+    response : OK, NO_ANSWER, TIMEOUT (answer started, not complete before the
+               timeout), COLLISION, CRC, PROTOCOL or TAG_ERROR
+    """
+    def classify(self, flags, rxStatus, irqStatus=0):
+        if rxStatus & PN5180_HIL.RX_STATUS['COLLISION_DETECTED']:
+            return self.COLLISION
+        if rxStatus & PN5180_HIL.RX_STATUS['DATA_INTEGRITY_ERROR']:
+            return self.CRC
+        if rxStatus & PN5180_HIL.RX_STATUS['PROTOCOL_ERROR']:
+            return self.PROTOCOL
+        if flags == 0xFF:
+            if irqStatus & PN5180_HIL.IRQ_STATUS['RX_SOF_DET_IRQ']:
+                return self.TIMEOUT
+            return self.NO_ANSWER
+        if flags != 0:
+            return self.TAG_ERROR
+        return self.OK
+
+    """
+    retry(self, errorClass, attempt)
+    attempt  : 0 for the first attempt
+    response : True when the request is sent again
+    """
+    def retry(self, errorClass, attempt):
+        if errorClass != self.OK:
+            self.stats['errors'][errorClass] += 1
+        if errorClass in self.retryOn and attempt < self.maxRetries:
+            self.stats['retries'] += 1
+            return True
+        return False
+
+    """
+    record(self, errorClass)
+    Final result of a request: count consecutive misses, raise TagLostError
+    inside an operation when maxMisses is reached
+    """
+    def record(self, errorClass):
+        self.stats['requests'] += 1
+        if errorClass != self.NO_ANSWER:
+            self.misses = 0
+            return
+        self.misses += 1
+        if self._operations and self.maxMisses is not None and self.misses >= self.maxMisses:
+            self.misses = 0
+            self.stats['aborts'] += 1
+            raise TagLostError("Tag lost: %d consecutive requests without answer" %self.maxMisses)
+
+    """
+    operation(self)
+    Context of a multi-request operation (dump, multiple block write) aborted
+    by TagLostError after maxMisses consecutive requests without answer.
+    Single requests outside an operation only return their error.
+    """
+    @contextlib.contextmanager
+    def operation(self):
+        if not self._operations:
+            self.misses = 0
+        self._operations += 1
+        try:
+            yield self
+        finally:
+            self._operations -= 1
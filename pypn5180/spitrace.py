@@ -0,0 +1,208 @@
+import time
+import struct
+from .pypn5180hal import _timer
+
+"""
+SPI traffic recording and replay.
+A trace file starts with TRACE_MAGIC, followed by records:
+    [timestamp, us since the start, 8 bytes][direction, 1 byte][length, 2 bytes][bytes]
+little endian. Each xfer gives a MOSI record (host to chip) when sent and a
+MISO record (chip to host) when completed. Each read of the host clock of the
+RF transaction waits (PN5180_HIL.clock) gives a CLOCK record, the value as a
+double: a replay takes the same timeout decisions as the recorded session.
+
+    isoIec15693 = iso_iec_15693(trace="session.trace")
+    ...
+    isoIec15693.pn5180.spiTrace.close()
+
+    isoIec15693 = iso_iec_15693(backend=SpiReplay("session.trace"), busy="SIMULATED")
+"""
+
+TRACE_MAGIC = b"PN5180TRACE1"
+RECORD_HEADER = struct.Struct("<QBH")
+MOSI = 0
+MISO = 1
+CLOCK = 2
+CLOCK_VALUE = struct.Struct("<d")
+
+
+"""
+SpiTraceRecorder(path, xfer, clock=_timer)
+Record the frames exchanged by an xfer function, and the host clock reads
+path  : trace file
+xfer  : SPI exchange function to wrap, see _spi.xfer
+clock : host clock to wrap, see PN5180_HIL.clock
+"""
+class SpiTraceRecorder(object):
+
+    def __init__(self, path, xfer, clock=_timer):
+        self.path = path
+        self._xfer = xfer
+        self._clock = clock
+        self.records = 0
+        self.fid = open(path, "wb")
+        self.fid.write(TRACE_MAGIC)
+        self.start = _timer()
+
+    def _record(self, direction, data):
+        self.fid.write(RECORD_HEADER.pack(int((_timer() - self.start) * 1000000.0), direction, len(data)))
+        self.fid.write(data)
+        self.records += 1
+
+    def xfer(self, data):
+        self._record(MOSI, data)
+        response = self._xfer(data)
+        self._record(MISO, bytes(bytearray(response)))
+        return response
+
+    def clock(self):
+        value = self._clock()
+        self._record(CLOCK, CLOCK_VALUE.pack(value))
+        return value
+
+    def flush(self):
+        self.fid.flush()
+
+    def close(self):
+        if not self.fid.closed:
+            self.fid.close()
+
+
+"""
+readTrace(path)
+Generator of the records of a trace file
+yield : timestamp (us), direction (MOSI, MISO or CLOCK), data (bytes)
+"""
+def readTrace(path):
+    with open(path, "rb") as fid:
+        if fid.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise IOError("%s is not an SPI trace" %path)
+        while True:
+            header = fid.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, direction, length = RECORD_HEADER.unpack(header)
+            data = fid.read(length)
+            if len(data) < length:
+                # Truncated trace (recorder not closed)
+                return
+            yield timestamp, direction, data
+
+
+class _replayBusyPin(object):
+
+    """
+    BUSY line of a replay: the chip is always ready
+    """
+    def read(self):
+        return False
+
+
+"""
+SpiReplay(path, timing=False, strict=True)
+SPI device object answering the frames of a recorded trace, usable as _spi backend.
+The host clock of the RF transaction waits (hostClock) returns the recorded
+clock reads, so the replay polls exactly as the recorded session. Traces
+without clock records use the recorded frame times instead, then a poll
+repeated by the host is answered again, polls of the trace not repeated by
+the host are skipped (counted in resyncs).
+path   : trace file
+timing : False for full speed, True to send the answers at the recorded times
+strict : raise IOError when the host frame differs from the recorded one,
+         otherwise count it in mismatches and answer the recorded frame
+"""
+class SpiReplay(object):
+
+    def __init__(self, path, timing=False, strict=True):
+        self.url = "replay:%s" %path
+        self.timing = timing
+        self.strict = strict
+        self.busyPin = _replayBusyPin()
+        # (timestamp of the answer, MOSI bytes, MISO bytes) of every xfer
+        self.exchanges = []
+        # (exchanges before the read, value) of every host clock read
+        self.clocks = []
+        mosi = None
+        for timestamp, direction, data in readTrace(path):
+            if direction == CLOCK:
+                self.clocks.append((len(self.exchanges), CLOCK_VALUE.unpack(data)[0]))
+                if not self.clocks[1:]:
+                    # Recorded frame times to the host clock
+                    self.clockOffset = self.clocks[0][1] - timestamp / 1000000.0
+            elif direction == MOSI:
+                mosi = data
+            elif mosi is not None:
+                self.exchanges.append((timestamp, mosi, data))
+                mosi = None
+        if not self.clocks:
+            self.clockOffset = 0.0
+        self.clockIndex = 0
+        self.index = 0
+        self.mismatches = 0
+        self.resyncs = 0
+        self.start = None
+
+    """
+    done(self)
+    response : True when all recorded frames were replayed
+    """
+    def done(self):
+        return self.index >= len(self.exchanges)
+
+    """
+    hostClock(self)
+    Host clock of the RF transaction waits, see PN5180_HIL.clock
+    response : s, recorded clock read at this point of the trace, or the time
+               of the last replayed frame
+    """
+    def hostClock(self):
+        while self.clockIndex < len(self.clocks) and self.clocks[self.clockIndex][0] < self.index:
+            # Clock reads of skipped polls
+            self.clockIndex += 1
+        if self.clockIndex < len(self.clocks) and self.clocks[self.clockIndex][0] == self.index:
+            self.clockIndex += 1
+            return self.clocks[self.clockIndex - 1][1]
+        timestamp = self.exchanges[self.index - 1][0] if self.index else 0
+        return self.clockOffset + timestamp / 1000000.0
+
+    def _isRepeat(self, index):
+        # Exchange pair (instruction, answer read) identical to the previous pair
+        return (index >= 2 and index + 1 < len(self.exchanges)
+                and self.exchanges[index][1] == self.exchanges[index - 2][1]
+                and self.exchanges[index + 1][1] == self.exchanges[index - 1][1])
+
+    def _resync(self, data):
+        index = self.index
+        if index >= 2 and self.exchanges[index - 2][1] == data:
+            # One more poll than recorded
+            return index - 2
+        while self._isRepeat(index):
+            # Less polls than recorded
+            index += 2
+            if self.exchanges[index][1] == data:
+                return index
+        return None
+
+    def xfer(self, data):
+        data = bytes(bytearray(data))
+        if self.index >= len(self.exchanges):
+            raise IOError("SPI trace replay: end of trace")
+        if self.exchanges[self.index][1] != data:
+            index = self._resync(data)
+            if index is not None:
+                self.index = index
+                self.resyncs += 1
+            elif self.strict:
+                raise IOError("SPI trace replay diverged at exchange %d: %r instead of %r"
+                              %(self.index, data, self.exchanges[self.index][1]))
+            else:
+                self.mismatches += 1
+        timestamp, mosi, response = self.exchanges[self.index]
+        self.index += 1
+        if self.timing:
+            if self.start is None:
+                self.start = _timer() - timestamp / 1000000.0
+            delay = self.start + timestamp / 1000000.0 - _timer()
+            if delay > 0:
+                time.sleep(delay)
+        return list(bytearray(response))
@@ -8,5 +8,5 @@ setup(
     author_email = "captainbeehart@protonmail.com",
     license="GPL v3.0",
     platform="Linux",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "tests"]),
 )
@@ -0,0 +1,39 @@
+import io
+import contextlib
+
+import pytest
+
+from pypn5180.iso_iec_15693 import iso_iec_15693
+from pypn5180.pypn5180sim import PN5180Simulator, VirtualTag15693
+
+"""
+Tests run on the PN5180 simulator, without hardware. timeScale=0: RF and BUSY
+timings are instantaneous.
+"""
+
+UID = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0xE0]
+UID2 = [0x09, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0xE0]
+
+# Tag memory: 256 blocks of 8 bytes
+TAG_DATA = bytes(bytearray(range(256))) * 8
+
+
+def connect(simulator, **options):
+    # Connection progress messages
+    with contextlib.redirect_stdout(io.StringIO()):
+        return iso_iec_15693(backend=simulator, busy="SIMULATED", selfTest=False, **options)
+
+
+@pytest.fixture
+def tag():
+    return VirtualTag15693(UID, data=TAG_DATA)
+
+
+@pytest.fixture
+def simulator(tag):
+    return PN5180Simulator([tag], timeScale=0)
+
+
+@pytest.fixture
+def reader(simulator):
+    return connect(simulator)
@@ -0,0 +1,26 @@
+import asyncio
+
+from pypn5180.async_iso_iec_15693 import AsyncIsoIec15693
+
+from conftest import UID
+
+
+def test_sharedFlags(reader):
+    asyncReader = AsyncIsoIec15693(reader)
+    asyncReader.flags = reader.flags | reader.REQUEST_FLAGS['OPTION']
+    assert reader.flags & reader.REQUEST_FLAGS['OPTION']
+    reader.flags = 0x02
+    assert asyncReader.flags == 0x02
+
+
+def test_sharedRetryPolicy(reader):
+    asyncReader = AsyncIsoIec15693(reader)
+    asyncReader.retryPolicy = None
+    assert reader.retryPolicy is None
+
+
+def test_readSingleBlock(reader, tag):
+    asyncReader = AsyncIsoIec15693(reader)
+    data, error = asyncio.run(asyncReader.readSingleBlockCmd(5, UID))
+    assert 'OK' in error
+    assert bytes(bytearray(data)) == bytes(tag.memory[40:48])
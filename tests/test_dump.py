@@ -0,0 +1,70 @@
+import hashlib
+
+from pypn5180.dump import FramDumper, StreamingDump, IncrementalDump
+from pypn5180.pypn5180sim import PN5180Simulator
+
+from conftest import UID, connect
+
+
+def _loseTag(simulator, tag, afterBlock):
+    # progress callback removing the tag once afterBlock blocks are read
+    def progress(current, maxBlock):
+        if current == afterBlock and tag in simulator.tags:
+            simulator.removeTag(tag)
+    return progress
+
+
+def test_dumpOption(reader, tag):
+    reader.flags |= reader.REQUEST_FLAGS['OPTION']
+    tag.lockedBlocks.update((0, 100))
+    dumper = FramDumper(reader, UID)
+    blocks = dumper.dump()
+    # Block security status bytes are not part of the dump
+    assert b"".join(bytes(block) for block in blocks) == bytes(tag.memory)
+    assert dumper.stats['failedBlocks'] == 0
+    assert dumper.stats['transactions'] < 20
+
+
+def test_dumpRealTiming(tag):
+    # ISO IEC 15693 answer timing: long READ_MULTIPLE_BLOCK answers must not time out
+    reader = connect(PN5180Simulator([tag], timeScale=1))
+    dumper = FramDumper(reader, UID)
+    blocks = dumper.dump()
+    assert b"".join(bytes(block) for block in blocks) == bytes(tag.memory)
+    assert dumper.stats['transactions'] <= 7
+    assert reader.retryPolicy.stats['retries'] == 0
+    assert not any(reader.retryPolicy.stats['errors'].values())
+
+
+def test_streamingDumpResume(reader, simulator, tag, tmp_path):
+    path = str(tmp_path / "tag.dat")
+    state = StreamingDump(FramDumper(reader, UID), path).run(_loseTag(simulator, tag, 100))
+    assert not state['complete']
+    done = sum(end - first for first, end in state['done'])
+    assert 100 <= done < 256
+    simulator.addTag(tag)
+    dumper = FramDumper(reader, UID)
+    state = StreamingDump(dumper, path).run()
+    assert state['complete']
+    # Only the missing blocks are read again
+    assert dumper.stats['blocks'] == 256 - done
+    with open(path, "rb") as fid:
+        assert fid.read() == bytes(tag.memory)
+    assert state['digest'] == hashlib.sha256(bytes(tag.memory)).hexdigest()
+
+
+def test_incrementalDumpAbortedFirstScan(reader, simulator, tag, tmp_path):
+    incremental = IncrementalDump(FramDumper(reader, UID), str(tmp_path), mutableRanges=[(0, 4)])
+    delta = incremental.run(_loseTag(simulator, tag, 40))
+    assert delta['aborted']
+    simulator.addTag(tag)
+    # Blocks not read by the first scan are read without being reported as changed
+    delta = incremental.run()
+    assert delta['full'] and not delta['aborted']
+    assert delta['changed'] == []
+    assert delta['blocksRead'] == 256
+    tag.memory[16:24] = bytearray(8)
+    delta = incremental.run()
+    assert not delta['full']
+    assert delta['blocksRead'] == 4
+    assert [change[0] for change in delta['changed']] == [2]
@@ -0,0 +1,92 @@
+from pypn5180.blockcache import BlockCache
+from pypn5180.pypn5180sim import VirtualTag15693
+
+from conftest import UID, UID2
+
+
+def test_rfuCommandStrData(reader, simulator):
+    data, error = reader.rfuCommand(0x30, "A\xe9")
+    assert list(simulator.txBuffer) == [reader.flags, 0x30, 0x41, 0xE9]
+    # Unknown command code, answered with an error by the tag
+    assert 'not supported' in error
+
+
+def test_rfuCommandBytesData(reader, simulator):
+    reader.rfuCommand(0x30, [0x01, 0x02])
+    assert list(simulator.txBuffer) == [reader.flags, 0x30, 0x01, 0x02]
+    reader.rfuCommand(0x30, b"\x03")
+    assert list(simulator.txBuffer) == [reader.flags, 0x30, 0x03]
+
+
+def test_readSingleBlockOption(reader, tag):
+    reader.flags |= reader.REQUEST_FLAGS['OPTION']
+    tag.lockedBlocks.add(3)
+    data, error = reader.readSingleBlockCmd(3, UID)
+    assert 'OK' in error
+    # Block security status byte, then the block data
+    assert list(data) == [1] + list(tag.memory[24:32])
+
+
+def test_readMultipleBlocksOption(reader, tag):
+    reader.flags |= reader.REQUEST_FLAGS['OPTION']
+    tag.lockedBlocks.add(5)
+    data, error = reader.readMultipleBlocksCmd(4, 2, UID)
+    assert 'OK' in error
+    assert list(data) == [0] + list(tag.memory[32:40]) + [1] + list(tag.memory[40:48])
+
+
+def test_writeSingleBlockOption(reader, tag):
+    reader.flags |= reader.REQUEST_FLAGS['OPTION']
+    data, error = reader.writeSingleBlockCmd(7, [0xA5] * 8, UID)
+    assert 'OK' in error
+    assert tag.memory[56:64] == bytearray([0xA5] * 8)
+
+
+def test_writeMultipleBlocksOption(reader, tag):
+    reader.flags |= reader.REQUEST_FLAGS['OPTION']
+    data, error = reader.writeMultipleBlocksCmd(8, 2, [0x5A] * 16, UID)
+    assert 'OK' in error
+    assert tag.memory[64:80] == bytearray([0x5A] * 16)
+
+
+def test_inventoryMaskSplit(reader, simulator):
+    # Same 4 low UID bits as UID: collision in the first round
+    uid3 = [0x11] + UID[1:]
+    simulator.addTag(VirtualTag15693(uid3))
+    simulator.addTag(VirtualTag15693(UID2))
+    found = reader.inventory()
+    assert sorted(uid for uid, dsfid in found) == sorted([UID, UID2, uid3])
+    assert reader.inventoryStats['collisions'] >= 1
+    assert reader.inventoryStats['rounds'] >= 2
+
+
+def test_inventorySingleSlotMaskSplit(reader, simulator):
+    simulator.addTag(VirtualTag15693(UID2))
+    found = reader.inventory(slots=1)
+    assert sorted(uid for uid, dsfid in found) == sorted([UID, UID2])
+    assert reader.inventoryStats['collisions'] >= 1
+
+
+def test_autoRfProfile(reader):
+    # Standard commands are answered at 26 kbps: the first probe validates ASK100
+    reader.setRfProfile('ASK10_53KBPS')
+    profile, error = reader.autoRfProfile()
+    assert profile == 'ASK100_26KBPS' and 'OK' in error
+    assert reader.pn5180.getRfProfile() == 'ASK100_26KBPS'
+
+
+def test_blockCacheFailedWrites(reader, simulator, tag):
+    reader.blockCache = BlockCache()
+    for block in (2, 3):
+        reader.readSingleBlockCmd(block, UID)
+    # Tag error: the written block is invalidated, the others are kept
+    tag.lockedBlocks.add(3)
+    data, error = reader.writeSingleBlockCmd(3, [0xAA] * 8, UID)
+    assert 'OK' not in error
+    assert reader.blockCache.get(UID, 3) is None
+    assert reader.blockCache.get(UID, 2) is not None
+    # Non-addressed write without answer: any tag may have been written
+    simulator.removeTag(tag)
+    data, error = reader.writeSingleBlockCmd(2, [0xAA] * 8)
+    assert 'No Answer' in error
+    assert reader.blockCache.get(UID, 2) is None
@@ -0,0 +1,37 @@
+import threading
+
+from pypn5180.pypn5180sim import PN5180Simulator
+
+from conftest import UID, connect
+
+
+def test_rfStatusTransceiveState(reader, simulator):
+    pn5180 = reader.pn5180
+    simulator.transceiveState = 5
+    assert pn5180.getRfStatusTransceiveState() == "RECEIVING"
+    simulator.transceiveState = 1
+    assert pn5180.getRfStatusTransceiveState() == "WAIT_TRANSMIT"
+
+
+def test_irqLineTransaction(tag):
+    # ISO IEC 15693 timing: the host waits on the IRQ line instead of polling the status
+    reader = connect(PN5180Simulator([tag], timeScale=1), fastPath=True, irq="SIMULATED")
+    for block in range(5):
+        data, error = reader.readSingleBlockCmd(block, UID)
+        assert 'OK' in error
+        assert bytes(bytearray(data)) == bytes(tag.memory[8 * block:8 * block + 8])
+    assert reader.pn5180.lastTransactionInstructions <= 5
+
+
+def test_lpcdWaitPolling(tag):
+    # No IRQ backend: IRQ_STATUS polled after the LPCD measurement, which comes
+    # late with a slow wake-up counter oscillator
+    simulator = PN5180Simulator([], timeScale=1, lpcdClockError=0.2)
+    pn5180 = connect(simulator).pn5180
+    timer = threading.Timer(0.015, simulator.addTag, (tag,))
+    timer.start()
+    try:
+        assert pn5180.lpcdWait(wakeupCounter=10, timeout=500000)
+    finally:
+        timer.cancel()
+    assert simulator.lpcdMeasurements <= 2
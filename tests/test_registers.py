@@ -0,0 +1,36 @@
+import json
+
+from pypn5180.registers import RegisterSnapshot
+
+
+def test_snapshotRegisters(reader, simulator):
+    pn5180 = reader.pn5180
+    instructions = pn5180.instructionCount
+    snapshot = pn5180.snapshotRegisters()
+    assert pn5180.instructionCount - instructions == 3
+    assert sorted(snapshot.values) == sorted(pn5180.REGISTER_NAME)
+    address = RegisterSnapshot.REGISTER_ADDR['TIMER2_RELOAD']
+    assert snapshot['TIMER2_RELOAD'] == snapshot[address] == simulator.registers[address]
+    json.dumps(snapshot.toDict())
+
+
+def test_snapshotRfStatus(reader, simulator):
+    pn5180 = reader.pn5180
+    simulator.transceiveState = 5
+    snapshot = pn5180.snapshotRegisters()
+    assert snapshot.decode(pn5180.REG_ADDR['RF_STATUS']) == {'TRANSCEIVE_STATE': "RECEIVING"}
+
+
+def test_snapshotDiff(reader):
+    pn5180 = reader.pn5180
+    before = pn5180.snapshotRegisters()
+    pn5180.writeRegister(RegisterSnapshot.REGISTER_ADDR['TIMER2_RELOAD'], before['TIMER2_RELOAD'] ^ 0x1234)
+    after = pn5180.snapshotRegisters()
+    changes = before.diff(after)
+    assert [change[0] for change in changes] == ['TIMER2_RELOAD']
+    assert changes[0][2:4] == (before['TIMER2_RELOAD'], after['TIMER2_RELOAD'])
+
+
+def test_decodeSystemConfig():
+    snapshot = RegisterSnapshot({0x0: 0x3})
+    assert snapshot.decode(0x0)['COMMAND'] == "TRANSCEIVE"
@@ -0,0 +1,19 @@
+from pypn5180.pypn5180hal import PN5180_HIL
+from pypn5180.retrypolicy import RetryPolicy
+
+
+def test_classifyCutAnswer():
+    policy = RetryPolicy()
+    sof = PN5180_HIL.IRQ_STATUS['RX_SOF_DET_IRQ']
+    assert policy.classify(0xFF, 0) == RetryPolicy.NO_ANSWER
+    # Answer started, then cut by the timeout: the tag is present
+    assert policy.classify(0xFF, 0, sof) == RetryPolicy.TIMEOUT
+    assert policy.classify(0, 0, sof | PN5180_HIL.IRQ_STATUS['RX_IRQ']) == RetryPolicy.OK
+
+
+def test_answerTimeout():
+    policy = RetryPolicy(sofMargin=0)
+    # 63 blocks of 8 bytes and the flags byte at 26.48 kbps: ~150 ms
+    assert 150000 < policy.answerTimeout(0x02, 1 + 63 * 8) < 160000
+    # Low data rate: 4 times longer bits
+    assert policy.answerTimeout(0x00, 10) > 3 * policy.answerTimeout(0x02, 10)
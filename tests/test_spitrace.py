@@ -0,0 +1,26 @@
+from pypn5180.pypn5180sim import PN5180Simulator
+from pypn5180.spitrace import SpiReplay
+
+from conftest import UID, connect
+
+
+def _session(reader):
+    results = [reader.getSystemInformationCmd(UID)]
+    for blockNumber in range(20):
+        results.append(reader.readSingleBlockCmd(blockNumber, UID))
+    results.append(reader.readMultipleBlocksCmd(0, 8, UID))
+    reader.disconnect()
+    return results
+
+
+def test_replayRealTiming(tag, tmp_path):
+    # Recorded with ISO IEC 15693 timing: the status polls depend on the host clock
+    path = str(tmp_path / "session.trace")
+    reader = connect(PN5180Simulator([tag], timeScale=1), trace=path)
+    recorded = _session(reader)
+    reader.pn5180.spiTrace.close()
+    for timing in (False, True):
+        replay = SpiReplay(path, timing=timing)
+        assert _session(connect(replay)) == recorded
+        assert replay.done()
+        assert replay.resyncs == 0